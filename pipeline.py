@@ -5,17 +5,34 @@ FULL PIPELINE
 Steps:
 1) src/data_load/dataload.py
 2) src/features/features.py
-3) 6 model scripts in src/models
-4) Start Streamlit dashboard
+3) 6 model scripts in src/models (run concurrently, they only share features)
+4) Publish the tables as a versioned snapshot (src/storage/snapshots.py)
+5) Start Streamlit dashboard
+
+Stage dependencies are declared in src/pipeline/stages.py.
 """
 
+from dataclasses import asdict
+from datetime import datetime, timezone
 from pathlib import Path
+import argparse
 import subprocess
 import sys
+import time
 
 PROJECT_ROOT = Path(__file__).parent
 PY = sys.executable  # current Python interpreter
 
+sys.path.insert(0, str(PROJECT_ROOT))
+from src import load_settings
+from src.pipeline.stages import build_stages
+from src.pipeline.executor import run_stages, print_summary
+from src.pipeline.cache import StageCache
+from src.pipeline.inprocess import run_in_process
+from src.instrumentation import peak_rss_mb, write_run_report
+from src.storage import snapshots
+from src.storage.tables import SUFFIXES
+
 
 def run(label, script_args):
     print("\n" + "=" * 60)
@@ -26,27 +43,125 @@ def run(label, script_args):
     subprocess.run(cmd, check=True)
 
 
+def publish(stages, results, cfg):
+    """Snapshot every table the stages produced and switch readers to it"""
+    if snapshots.current_version(cfg) is not None and all(r.status == "cached" for r in results.values()):
+        print(f"= Snapshot {snapshots.current_version(cfg)} unchanged")
+        return snapshots.current_version(cfg)
+    tables = [p for s in stages for p in s.outputs if Path(p).suffix in SUFFIXES.values()]
+    version = snapshots.publish(
+        tables, cfg, meta={"stages": {name: r.status for name, r in results.items()}}
+    )
+    print(f"✓ Published snapshot {version} ({len(tables)} tables)")
+    return version
+
+
+def report(stages, results, cfg, started, wall0, mode, snapshot=None):
+    """Write the JSON run report with per-stage timings, memory and rows"""
+    report_dir = PROJECT_ROOT / cfg.get("pipeline", {}).get("report_dir", "data/reports")
+    records = []
+    for stage in stages:
+        r = asdict(results[stage.name])
+        r.pop("output")  # already printed; the report stays small
+        records.append({"label": stage.label, "deps": sorted(stage.deps), **r})
+    path = write_run_report(
+        report_dir,
+        records,
+        started=started,
+        wall_seconds=round(time.perf_counter() - wall0, 3),
+        mode=mode,
+        snapshot=snapshot,
+        pipeline_peak_rss_mb=peak_rss_mb(),
+    )
+    print(f"✓ Run report saved to {path}")
+
+
+def rollback(version, cfg):
+    versions = snapshots.list_versions(cfg)
+    if version == "list":
+        current = snapshots.current_version(cfg)
+        for v in versions:
+            print(f"{'*' if v == current else ' '} {v}")
+        return
+    try:
+        snapshots.switch(version, cfg)
+    except ValueError as e:
+        sys.exit(str(e))
+    print(f"✓ Published snapshot is now {version}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the decision support pipeline")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="max concurrent stages (default: settings pipeline.max_workers)")
+    parser.add_argument("--no-dashboard", action="store_true",
+                        help="do not start the Streamlit dashboard at the end")
+    parser.add_argument("--force", action="append", default=[], metavar="STAGE",
+                        help="rerun STAGE even if its inputs are unchanged (repeatable, 'all' for every stage)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="ignore stage fingerprints and run everything")
+    parser.add_argument("--in-process", action="store_true",
+                        help="run all stages in this interpreter, sharing one features frame")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="print which stages would run and exit")
+    parser.add_argument("--no-publish", action="store_true",
+                        help="leave the published snapshot as it is after the run")
+    parser.add_argument("--profile", action="append", default=[], metavar="STAGE",
+                        help="run STAGE under cProfile (implies --force STAGE, repeatable); "
+                             "stats go to pipeline.report_dir")
+    parser.add_argument("--rollback", metavar="VERSION",
+                        help="publish an earlier snapshot VERSION and exit ('list' to show them)")
+    return parser.parse_args()
+
+
 def main():
-    # 1) data load
-    run("DATA LOAD", ["src/data_load/dataload.py"])
-
-    # 2) feature build
-    run("FEATURE BUILD", ["src/features/features.py"])
-
-    # 3) models
-    models = [
-        ("MODEL – BAYES", ["src/models/trend_bayes_hierarchical.py"]),
-        ("MODEL – MARKOV", ["src/models/trend_markov_switching.py"]),
-        ("MODEL – KALMAN", ["src/models/trend_kalman.py"]),
-        ("MODEL – RISK", ["src/models/risk_prospect_theory.py"]),
-        ("MODEL – MPT", ["src/models/portfolio_mpt.py"]),
-        ("MODEL – VALUATION", ["src/models/valuation_nash_real.py"]),
-    ]
-    for label, args in models:
-        run(label, args)
-
-    # 4) dashboard
-    run("START DASHBOARD", ["-m", "streamlit", "run", "src/app/dashboard.py"])
+    args = parse_args()
+    cfg = load_settings()
+    if args.rollback:
+        rollback(args.rollback, cfg)
+        return
+    workers = args.workers or cfg.get("pipeline", {}).get("max_workers", 4)
+
+    # 1-3) data load, features, models
+    stages = build_stages(cfg)
+    unknown = set(args.force) - {s.name for s in stages} - {"all"}
+    if unknown:
+        sys.exit(f"Unknown stage(s) for --force: {', '.join(sorted(unknown))}")
+    unknown = set(args.profile) - {s.name for s in stages}
+    if unknown:
+        sys.exit(f"Unknown stage(s) for --profile: {', '.join(sorted(unknown))}")
+    force = ["all"] if args.no_cache else args.force + args.profile
+    cache = StageCache(cfg, root=PROJECT_ROOT, force=force)
+
+    if args.dry_run:
+        will_run = cache.plan(stages)
+        for stage in stages:
+            mark = "run " if stage.name in will_run else "skip"
+            print(f"{mark}  {stage.name}")
+        return
+
+    started = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    wall0 = time.perf_counter()
+    profile_dir = PROJECT_ROOT / cfg.get("pipeline", {}).get("report_dir", "data/reports")
+    if args.in_process:
+        results = run_in_process(stages, cfg, max_workers=workers, cache=cache,
+                                 profile=args.profile, profile_dir=profile_dir)
+    else:
+        results = run_stages(stages, max_workers=workers, python=PY, cwd=PROJECT_ROOT, cache=cache,
+                             profile=args.profile, profile_dir=profile_dir)
+    print_summary(stages, results)
+    mode = "in-process" if args.in_process else "subprocess"
+    if any(r.status not in ("ok", "cached") for r in results.values()):
+        report(stages, results, cfg, started, wall0, mode)
+        sys.exit(1)
+
+    # 4) publish
+    version = None if args.no_publish else publish(stages, results, cfg)
+    report(stages, results, cfg, started, wall0, mode, snapshot=version)
+
+    # 5) dashboard
+    if not args.no_dashboard:
+        run("START DASHBOARD", ["-m", "streamlit", "run", "src/app/dashboard.py"])
 
 
 if __name__ == "__main__":
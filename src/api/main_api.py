@@ -3,15 +3,23 @@ FastAPI backend for decision support.
 Serves trend, risk, valuation, and portfolio outputs.
 """
 
-from fastapi import FastAPI, Query
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel, Field
 from pathlib import Path
+import hashlib
+import numpy as np
 import pandas as pd
 import sys
 import os
+import time
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from src import load_settings
+from src.models.valuation_nash_real import value_properties
+from src.api.output_cache import OutputCache
+from src.instrumentation import LatencyHistogram, render_samples
 
 app = FastAPI(
     title="Real Estate Decision Support API",
@@ -21,6 +29,14 @@ app = FastAPI(
 
 cfg = load_settings()
 processed_dir = Path(cfg["data"]["processed_dir"])
+api_cfg = cfg.get("api", {})
+outputs = OutputCache(cfg, check_interval=float(api_cfg.get("cache_check_interval", 1.0)))
+app.add_middleware(GZipMiddleware, minimum_size=int(api_cfg.get("gzip_min_bytes", 1000)))
+request_latency = LatencyHistogram()
+
+# Tables combined by /snapshot, and the models /history can page through
+SNAPSHOT_MODELS = ("trend_bayes", "trend_markov", "trend_kalman", "risk_prospect", "valuation", "portfolio")
+HISTORY_MODELS = ("trend_bayes", "trend_markov", "trend_kalman")
 
 
 class TrendResponse(BaseModel):
@@ -40,8 +56,128 @@ class RiskResponse(BaseModel):
 class ValuationResponse(BaseModel):
     city: str
     segment: str
+    horizon: float | None = None
+    nash_price: float | None = None
+    option_value_wait: float | None = None
+
+
+class PropertyIn(BaseModel):
+    city: str
+    segment: str
+    size_sqm: float = Field(gt=0)
+    seller_reservation: float = Field(gt=0)
+    buyer_reservation: float = Field(gt=0)
+    seller_weight: float = Field(0.5, gt=0)
+    buyer_weight: float = Field(0.5, gt=0)
+
+
+class BatchValuationRequest(BaseModel):
+    properties: list[PropertyIn]
+    horizon: float | None = Field(None, gt=0)
+
+
+class PropertyValuation(BaseModel):
+    city: str
+    segment: str
+    agreement: bool
     nash_price: float | None = None
+    current_value: float | None = None
     option_value_wait: float | None = None
+    option_value_wait_buy: float | None = None
+
+
+class BatchValuationResponse(BaseModel):
+    horizon: float
+    results: list[PropertyValuation]
+
+
+class GroupSnapshot(BaseModel):
+    city: str
+    segment: str
+    trend_date: str | None = None
+    bayes_trend_mean: float | None = None
+    kalman_trend: float | None = None
+    regime: str | None = None
+    prob_down: float | None = None
+    prob_sideways: float | None = None
+    prob_up: float | None = None
+    expected_12m_return: float | None = None
+    downside_prob_12m: float | None = None
+    cvar_95: float | None = None
+    nash_price: float | None = None
+    option_value_wait: float | None = None
+    portfolio_weight: float | None = None
+
+
+class SnapshotResponse(BaseModel):
+    horizon: float
+    groups: list[GroupSnapshot]
+
+
+def _etag(*parts):
+    """Weak validator for a response built from the given table versions and query"""
+    return '"' + hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:24] + '"'
+
+
+def _not_modified(request, etag):
+    return etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]
+
+
+def _value(x):
+    """JSON-safe scalar: NaN/NaT become None, numpy scalars become Python ones"""
+    if x is None or (not isinstance(x, str) and pd.isna(x)):
+        return None
+    if isinstance(x, pd.Timestamp):
+        return x.strftime("%Y-%m-%d")
+    return x.item() if isinstance(x, np.generic) else x
+
+
+def _columns(df):
+    """Columnar JSON layout: one array per field"""
+    data = {}
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            data[col] = [None if pd.isna(v) else v for v in values.dt.strftime("%Y-%m-%d")]
+        else:
+            data[col] = values.astype(object).where(values.notna(), None).tolist()
+    return data
+
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    """Observe each request's latency per route template and status"""
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    labels = (
+        ("method", request.method),
+        ("path", route.path if route is not None else "unmatched"),
+        ("status", str(response.status_code)),
+    )
+    request_latency.observe(labels, time.perf_counter() - start)
+    return response
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Request latency histograms and output-cache counters in Prometheus text format"""
+    models = sorted(set(outputs.hits) | set(outputs.misses))
+    hit_ratio = [
+        ((("model", m),), outputs.hits[m] / (outputs.hits[m] + outputs.misses[m]))
+        for m in models if outputs.hits[m] + outputs.misses[m]
+    ]
+    body = "\n".join([
+        request_latency.render("api_request_duration_seconds", "Request latency by route and status."),
+        render_samples("api_output_cache_hits_total", "Lookups served from the in-memory index.", "counter",
+                       [((("model", m),), outputs.hits[m]) for m in models]),
+        render_samples("api_output_cache_misses_total", "Lookups that found a new or missing version.", "counter",
+                       [((("model", m),), outputs.misses[m]) for m in models]),
+        render_samples("api_output_cache_reloads_total", "Output tables loaded into memory.", "counter",
+                       [((("model", m),), outputs.reloads[m]) for m in sorted(outputs.reloads)]),
+        render_samples("api_output_cache_hit_ratio", "Share of lookups served from memory.", "gauge", hit_ratio),
+    ])
+    return PlainTextResponse(body + "\n", media_type="text/plain; version=0.0.4")
 
 
 @app.get("/health")
@@ -55,23 +191,19 @@ def get_trend(
     segment: str = Query("panel_3szoba")
 ):
     """Get trend analysis (Bayes + Markov)"""
-    bayes_path = Path(cfg["models"]["trend_bayes"]["output_file"])
-    markov_path = Path(cfg["models"]["trend_markov"]["output_file"])
-
     bayes_mean = None
     regime = None
 
-    if bayes_path.exists():
-        df_b = pd.read_csv(bayes_path, parse_dates=["date"])
-        latest_b = df_b[(df_b["region"] == city) & (df_b["segment"] == segment)].sort_values("date").tail(1)
-        if not latest_b.empty:
-            bayes_mean = float(latest_b["bayes_trend_mean"].iloc[0])
+    snapshot = outputs.current()
+    bayes = outputs.get("trend_bayes", snapshot)
+    latest_b = bayes.latest(city, segment) if bayes is not None else None
+    if latest_b is not None:
+        bayes_mean = float(latest_b["bayes_trend_mean"])
 
-    if markov_path.exists():
-        df_m = pd.read_csv(markov_path, parse_dates=["date"])
-        latest_m = df_m[(df_m["region"] == city) & (df_m["segment"] == segment)].sort_values("date").tail(1)
-        if not latest_m.empty:
-            regime = str(latest_m["regime"].iloc[0])
+    markov = outputs.get("trend_markov", snapshot)
+    latest_m = markov.latest(city, segment) if markov is not None else None
+    if latest_m is not None:
+        regime = str(latest_m["regime"])
 
     return TrendResponse(city=city, segment=segment, bayes_trend_mean=bayes_mean, regime=regime)
 
@@ -82,18 +214,15 @@ def get_risk(
     segment: str = Query("panel_3szoba")
 ):
     """Get risk assessment (Prospect Theory)"""
-    risk_path = Path(cfg["models"]["risk_prospect"]["output_file"])
-
     ret = None
     downside = None
 
-    if risk_path.exists():
-        df_r = pd.read_csv(risk_path)
-        df_r = df_r[(df_r["region"] == city) & (df_r["segment"] == segment)]
-        if not df_r.empty:
-            r = df_r.iloc[0]
-            ret = float(r["expected_12m_return"])
-            downside = float(r["downside_prob_12m"])
+    risk = outputs.get("risk_prospect")
+    rows = risk.history(city, segment) if risk is not None else None
+    if rows is not None:
+        r = rows.iloc[0]
+        ret = float(r["expected_12m_return"])
+        downside = float(r["downside_prob_12m"])
 
     return RiskResponse(city=city, segment=segment, expected_12m_return=ret, downside_prob_12m=downside)
 
@@ -101,23 +230,176 @@ def get_risk(
 @app.get("/valuation", response_model=ValuationResponse)
 def get_valuation(
     city: str = Query("Budapest"),
-    segment: str = Query("panel_3szoba")
+    segment: str = Query("panel_3szoba"),
+    horizon: float | None = Query(None, description="Years the sale can be delayed")
 ):
-    """Get valuation (Nash bargaining)"""
-    val_path = Path(cfg["models"]["valuation"]["output_file"])
+    """Get valuation (Nash bargaining + value of waiting to sell)"""
+    if horizon is None:
+        horizon = float(cfg["models"]["valuation"].get("report_horizon", 1.0))
 
     nash = None
     option = None
 
-    if val_path.exists():
-        df_v = pd.read_csv(val_path)
-        df_v = df_v[(df_v["region"] == city) & (df_v["segment"] == segment)]
-        if not df_v.empty:
-            v = df_v.iloc[0]
+    valuation = outputs.get("valuation")
+    rows = valuation.history(city, segment) if valuation is not None else None
+    if rows is not None:
+        # One row per horizon, so this scan is over a handful of rows
+        if "horizon" in rows.columns:
+            rows = rows[np.isclose(rows["horizon"], horizon)]
+        if not rows.empty:
+            v = rows.iloc[0]
             nash = float(v["nash_price"])
             option = float(v["option_value_wait"])
 
-    return ValuationResponse(city=city, segment=segment, nash_price=nash, option_value_wait=option)
+    return ValuationResponse(city=city, segment=segment, horizon=horizon,
+                             nash_price=nash, option_value_wait=option)
+
+
+@app.post("/valuation/batch", response_model=BatchValuationResponse)
+def post_valuation_batch(request: BatchValuationRequest):
+    """Nash prices and wait-option values for many properties in one pass"""
+    params = cfg["models"]["valuation"]
+    valuation = outputs.get("valuation")
+    if valuation is None:
+        raise HTTPException(status_code=503, detail="Valuation output missing; run the pipeline first")
+    horizon = request.horizon or float(params.get("report_horizon", 1.0))
+
+    props = pd.DataFrame([p.model_dump() for p in request.properties], columns=list(PropertyIn.model_fields))
+    out = value_properties(props, valuation.frame, params, horizon)
+    cols = list(PropertyValuation.model_fields)
+    # NaN (no agreement or no calibration for the series) becomes null
+    records = out[cols].astype(object).where(out[cols].notna(), None).to_dict("records")
+    return BatchValuationResponse(horizon=horizon, results=records)
+
+
+_snapshot_memo = (None, None)
+
+
+def market_snapshot(horizon):
+    """Latest outputs of every group, rebuilt only when a source table changes"""
+    global _snapshot_memo
+    snapshot = outputs.current()
+    tables = {key: outputs.get(key, snapshot) for key in SNAPSHOT_MODELS}
+    key = (horizon, *(None if t is None else t.version for t in tables.values()))
+    if _snapshot_memo[0] == key:
+        return key, _snapshot_memo[1]
+
+    def latest(model, group):
+        table = tables[model]
+        return (table.latest(*group) if table is not None else None) or {}
+
+    groups = sorted({g for t in tables.values() if t is not None for g in t.groups})
+    rows = []
+    for group in groups:
+        bayes = latest("trend_bayes", group)
+        markov = latest("trend_markov", group)
+        kalman = latest("trend_kalman", group)
+        risk = latest("risk_prospect", group)
+        port = latest("portfolio", group)
+        valuation = {}
+        if tables["valuation"] is not None and tables["valuation"].history(*group) is not None:
+            v = tables["valuation"].history(*group)
+            v = v[np.isclose(v["horizon"], horizon)] if "horizon" in v.columns else v
+            valuation = v.iloc[0].to_dict() if not v.empty else {}
+        rows.append(GroupSnapshot(
+            city=group[0],
+            segment=group[1],
+            trend_date=_value(bayes.get("date", markov.get("date"))),
+            bayes_trend_mean=_value(bayes.get("bayes_trend_mean")),
+            kalman_trend=_value(kalman.get("kalman_trend")),
+            regime=_value(markov.get("regime")),
+            prob_down=_value(markov.get("prob_down")),
+            prob_sideways=_value(markov.get("prob_sideways")),
+            prob_up=_value(markov.get("prob_up")),
+            expected_12m_return=_value(risk.get("expected_12m_return")),
+            downside_prob_12m=_value(risk.get("downside_prob_12m")),
+            cvar_95=_value(risk.get("cvar_95")),
+            nash_price=_value(valuation.get("nash_price")),
+            option_value_wait=_value(valuation.get("option_value_wait")),
+            portfolio_weight=_value(port.get("weight")),
+        ))
+    _snapshot_memo = (key, rows)
+    return key, rows
+
+
+@app.get("/snapshot", response_model=SnapshotResponse)
+def get_snapshot(
+    request: Request,
+    response: Response,
+    horizon: float | None = Query(None, description="Valuation horizon in years")
+):
+    """Trend, regime, risk, valuation and portfolio weight of every group in one response"""
+    if horizon is None:
+        horizon = float(cfg["models"]["valuation"].get("report_horizon", 1.0))
+    key, rows = market_snapshot(horizon)
+    etag = _etag("snapshot", key)
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return SnapshotResponse(horizon=horizon, groups=rows)
+
+
+@app.get("/history")
+def get_history(
+    request: Request,
+    model: str = Query("trend_bayes", description=f"One of {', '.join(HISTORY_MODELS)}"),
+    city: str | None = Query(None),
+    segment: str | None = Query(None),
+    start: str | None = Query(None, description="First date (inclusive), YYYY-MM-DD"),
+    end: str | None = Query(None, description="Last date (inclusive), YYYY-MM-DD"),
+    fields: str | None = Query(None, description="Comma-separated columns (default: all)"),
+    limit: int = Query(1000, ge=1, le=int(api_cfg.get("history_max_rows", 10000))),
+    offset: int = Query(0, ge=0)
+):
+    """Time series in a columnar layout (one array per field), paged by offset/limit"""
+    if model not in HISTORY_MODELS:
+        raise HTTPException(status_code=400, detail=f"model must be one of {', '.join(HISTORY_MODELS)}")
+    try:
+        lo = pd.Timestamp(start) if start else None
+        hi = pd.Timestamp(end) if end else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {e}")
+
+    table = outputs.get(model)
+    if table is None:
+        raise HTTPException(status_code=503, detail=f"{model} output missing; run the pipeline first")
+
+    columns = list(table.frame.columns)
+    if fields:
+        wanted = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = sorted(set(wanted) - set(columns))
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+        columns = ["date", "region", "segment"] + [c for c in wanted if c not in ("date", "region", "segment")]
+
+    etag = _etag("history", table.version, model, city, segment, start, end, columns, limit, offset)
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    # Group slices come from the index; dates are sorted within each slice
+    slices = [h["history"] for (r, s), h in table.groups.items()
+              if (city is None or r == city) and (segment is None or s == segment)]
+    parts = []
+    for part in slices:
+        dates = part["date"].to_numpy()
+        i0 = 0 if lo is None else np.searchsorted(dates, lo.to_datetime64(), side="left")
+        i1 = len(part) if hi is None else np.searchsorted(dates, hi.to_datetime64(), side="right")
+        if i1 > i0:
+            parts.append(part.iloc[i0:i1])
+    rows = pd.concat(parts) if parts else table.frame.iloc[:0]
+
+    page = rows.iloc[offset: offset + limit][columns]
+    total = len(rows)
+    body = {
+        "model": model,
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "next_offset": offset + limit if offset + limit < total else None,
+        "columns": columns,
+        "data": _columns(page),
+    }
+    return JSONResponse(body, headers={"ETag": etag})
 
 
 if __name__ == "__main__":
@@ -0,0 +1,139 @@
+"""
+In-memory model outputs for the API.
+Each output table is loaded once and indexed by (region, segment): the
+latest row as a dict and the group's full history as a frame slice. A
+table is reloaded only when its version changes: the published snapshot
+(see src/storage/snapshots.py) or, before anything is published, the
+working file's mtime and size. The published snapshot is resolved once
+per check interval for all tables, and a request that reads several
+tables pins that one version, so it never mixes two snapshots. The new
+index is built aside and swapped in with one assignment, so readers
+never see a half-built index.
+"""
+
+from collections import Counter
+import os
+import threading
+import time
+
+from src.storage.snapshots import current_version, published_path
+from src.storage.tables import read_table, table_path
+
+CURRENT = object()  # get() default: the cache's current snapshot
+
+
+class TableIndex:
+    """One output table indexed by (region, segment)"""
+
+    def __init__(self, df, version):
+        self.version = version
+        sort_cols = [c for c in ("region", "segment", "date") if c in df.columns]
+        df = df.astype({c: object for c in ("region", "segment") if c in df.columns})
+        self.frame = df.sort_values(sort_cols, kind="stable").reset_index(drop=True) if sort_cols else df
+        self.groups = {}
+        if {"region", "segment"} <= set(df.columns):
+            bounds = self.frame.groupby(["region", "segment"], sort=False).indices
+            for key, rows in bounds.items():
+                history = self.frame.iloc[rows[0]: rows[-1] + 1]
+                self.groups[key] = {"latest": history.iloc[-1].to_dict(), "history": history}
+
+    def latest(self, region, segment):
+        group = self.groups.get((region, segment))
+        return None if group is None else group["latest"]
+
+    def history(self, region, segment):
+        group = self.groups.get((region, segment))
+        return None if group is None else group["history"]
+
+
+class OutputCache:
+    """Model outputs keyed by model name, refreshed when a new version appears"""
+
+    def __init__(self, cfg, check_interval=1.0):
+        self.cfg = cfg
+        self.check_interval = check_interval
+        self._tables = {}
+        self._checked = {}
+        self._snapshot = None
+        self._snapshot_checked = float("-inf")
+        self._lock = threading.Lock()
+        # Per model: lookups served from memory, lookups that found a new version, table loads
+        self.hits = Counter()
+        self.misses = Counter()
+        self.reloads = Counter()
+
+    def current(self):
+        """Published snapshot version (None before any publish), re-read once per check interval"""
+        now = time.monotonic()
+        if now - self._snapshot_checked >= self.check_interval:
+            self._snapshot = current_version(self.cfg)
+            self._snapshot_checked = now
+        return self._snapshot
+
+    def locate(self, model_key, snapshot=None):
+        """(path, version) of an output table in snapshot; version is None if it does not exist.
+
+        Tables the snapshot does not hold (or all tables, without one) are
+        read from the working copy and versioned by its mtime and size.
+        """
+        output_file = self.cfg["models"][model_key]["output_file"]
+        if snapshot is not None:
+            path, found = published_path(output_file, self.cfg, version=snapshot)
+            if found is not None:
+                return path, ("snapshot", found)
+        path = table_path(output_file, self.cfg)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return path, None
+        return path, (st.st_mtime_ns, st.st_size)
+
+    def get(self, model_key, snapshot=CURRENT):
+        """Indexed table for model_key in snapshot, or None if its output is missing.
+
+        Callers combining several tables pass one current() result to every
+        get, so all of them come from the same published version.
+        """
+        if snapshot is CURRENT:
+            snapshot = self.current()
+        now = time.monotonic()
+        table = self._tables.get(model_key)
+        if table is not None:
+            # Snapshot contents never change; working copies are re-checked per interval
+            checked_at, checked_snapshot = self._checked.get(model_key, (float("-inf"), None))
+            if table.version == ("snapshot", snapshot) or (
+                    table.version[0] != "snapshot" and checked_snapshot == snapshot
+                    and now - checked_at < self.check_interval):
+                self.hits[model_key] += 1
+                return table
+
+        path, version = self.locate(model_key, snapshot)
+        self._checked[model_key] = (now, snapshot)
+        if table is not None and table.version == version:
+            self.hits[model_key] += 1
+            return table
+
+        with self._lock:
+            # Another request may have reloaded while this one waited
+            table = self._tables.get(model_key)
+            if table is not None and table.version == version:
+                self.hits[model_key] += 1
+                return table
+            self.misses[model_key] += 1
+            if version is None:
+                self._tables.pop(model_key, None)
+                return None
+            try:
+                df = read_table(path, self.cfg)
+            except FileNotFoundError:
+                # The pinned snapshot was pruned meanwhile; only the current one is left
+                self._snapshot_checked = float("-inf")
+                snapshot = self.current()
+                path, version = self.locate(model_key, snapshot)
+                df = read_table(path, self.cfg)
+            table = TableIndex(df, version)
+            self.reloads[model_key] += 1
+            # A request pinned to an older snapshot must not evict the current one
+            if snapshot == self._snapshot:
+                self._tables[model_key] = table
+            return table
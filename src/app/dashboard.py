@@ -4,13 +4,14 @@ Visualizes trends, risks, valuations, and portfolio recommendations.
 """
 
 import streamlit as st
-import pandas as pd
 from pathlib import Path
 import sys
 import os
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from src import load_settings
+from src.storage.snapshots import current_version, published_path
+from src.storage.tables import read_table
 
 cfg = load_settings()
 processed_dir = Path(cfg["data"]["processed_dir"])
@@ -30,12 +31,23 @@ st.sidebar.header("Szűrők")
 city = st.sidebar.selectbox("Város", ["Budapest", "Debrecen", "Győr"])
 segment = st.sidebar.selectbox("Szegmens", ["panel_3szoba", "csaladi_haz", "tegla_lakas"])
 
-# Load data
-bayes_path = Path(cfg["models"]["trend_bayes"]["output_file"])
-markov_path = Path(cfg["models"]["trend_markov"]["output_file"])
-risk_path = Path(cfg["models"]["risk_prospect"]["output_file"])
-val_path = Path(cfg["models"]["valuation"]["output_file"])
-port_path = Path(cfg["models"]["portfolio"]["output_file"])
+# Load data: every table of one rerun comes from the same published snapshot
+snapshot = current_version(cfg)
+
+
+def output_path(path):
+    return published_path(path, cfg, version=snapshot)[0]
+
+
+bayes_path = output_path(cfg["models"]["trend_bayes"]["output_file"])
+markov_path = output_path(cfg["models"]["trend_markov"]["output_file"])
+markov_stats_file = cfg["models"]["trend_markov"].get("stats_file")
+markov_stats_path = output_path(markov_stats_file) if markov_stats_file else None
+risk_path = output_path(cfg["models"]["risk_prospect"]["output_file"])
+val_path = output_path(cfg["models"]["valuation"]["output_file"])
+port_path = output_path(cfg["models"]["portfolio"]["output_file"])
+if snapshot:
+    st.sidebar.caption(f"Adatverzió: {snapshot}")
 
 # Layout
 col1, col2 = st.columns(2)
@@ -46,12 +58,13 @@ with col1:
     
     if bayes_path.exists():
         try:
-            df_b = pd.read_csv(bayes_path, parse_dates=["date"])
+            df_b = read_table(bayes_path, cfg)
             df_b = df_b[(df_b["region"] == city) & (df_b["segment"] == segment)]
             
             if not df_b.empty:
+                band_cols = [c for c in df_b.columns if c.startswith("bayes_trend_p")]
                 st.line_chart(
-                    df_b.set_index("date")[["bayes_trend_mean", "bayes_trend_p16", "bayes_trend_p84"]],
+                    df_b.set_index("date")[["bayes_trend_mean", *band_cols]],
                     use_container_width=True
                 )
             else:
@@ -64,12 +77,26 @@ with col1:
     # Markov regime
     if markov_path.exists():
         try:
-            df_m = pd.read_csv(markov_path, parse_dates=["date"])
+            df_m = read_table(markov_path, cfg)
             df_m = df_m[(df_m["region"] == city) & (df_m["segment"] == segment)]
             
             if not df_m.empty:
                 latest_regime = df_m.sort_values("date").tail(1)["regime"].iloc[0]
                 st.metric("📊 Aktuális rezsim", latest_regime.upper(), delta=None)
+
+                # Persistence precomputed by the Markov stage
+                if markov_stats_path is not None and markov_stats_path.exists():
+                    df_s = read_table(markov_stats_path, cfg)
+                    df_s = df_s[(df_s["region"] == city) & (df_s["segment"] == segment)]
+                    if not df_s.empty:
+                        st.caption(f"Utolsó váltás óta: {int(df_s['periods_since_switch'].iloc[0])} időszak")
+                        st.dataframe(
+                            df_s.set_index("regime")[
+                                ["share", "mean_duration", "max_duration", "expected_duration",
+                                 "to_down", "to_sideways", "to_up"]
+                            ],
+                            use_container_width=True,
+                        )
             else:
                 st.info(f"Nincs rezsim adat: {city} / {segment}")
         except Exception as e:
@@ -84,7 +111,7 @@ with col2:
     # Risk
     if risk_path.exists():
         try:
-            df_r = pd.read_csv(risk_path)
+            df_r = read_table(risk_path, cfg)
             df_r = df_r[(df_r["region"] == city) & (df_r["segment"] == segment)]
             
             if not df_r.empty:
@@ -111,8 +138,11 @@ with col2:
     # Valuation
     if val_path.exists():
         try:
-            df_v = pd.read_csv(val_path)
+            df_v = read_table(val_path, cfg)
             df_v = df_v[(df_v["region"] == city) & (df_v["segment"] == segment)]
+            report_horizon = float(cfg["models"]["valuation"].get("report_horizon", 1.0))
+            if "horizon" in df_v.columns:
+                df_v = df_v[(df_v["horizon"] - report_horizon).abs() < 1e-9]
             
             if not df_v.empty:
                 v = df_v.iloc[0]
@@ -124,7 +154,7 @@ with col2:
                     )
                 with c2:
                     st.metric(
-                        "⏳ Opcióérték",
+                        f"⏳ Várakozás opcióértéke ({report_horizon:g} év)",
                         f"{v['option_value_wait']:,.0f} Ft"
                     )
             else:
@@ -138,11 +168,12 @@ with col2:
 st.header("🎯 Portfólió Súlyok (MPT)")
 if port_path.exists():
     try:
-        df_p = pd.read_csv(port_path)
+        df_p = read_table(port_path, cfg)
         st.dataframe(df_p, use_container_width=True)
         
         # Simple bar chart
-        st.bar_chart(df_p.set_index("segment"))
+        df_p["series"] = df_p["region"].astype(str) + " / " + df_p["segment"].astype(str)
+        st.bar_chart(df_p.set_index("series")[["tangency_weight", "min_variance_weight"]])
     except Exception as e:
         st.error(f"Error loading portfolio: {e}")
 else:
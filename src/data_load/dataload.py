@@ -11,6 +11,7 @@ import os
 # Add parent to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from src import load_settings
+from src.storage.tables import read_table, table_path, write_table
 
 
 def load_mnb_data():
@@ -38,7 +39,7 @@ def load_mnb_data():
             df['date'] = pd.to_datetime(df['date'])
         df['source'] = 'MNB'
 
-    df.to_csv(processed_dir / "mnb_lakasarindex_normalized.csv", index=False)
+    write_table(df, processed_dir / "mnb_lakasarindex_normalized.csv", cfg)
     print(f"✓ MNB data loaded: {len(df)} rows")
     return df
 
@@ -67,7 +68,7 @@ def load_ksh_data():
             df['date'] = pd.to_datetime(df['date'])
         df['source'] = 'KSH'
 
-    df.to_csv(processed_dir / "ksh_lakasarindex_normalized.csv", index=False)
+    write_table(df, processed_dir / "ksh_lakasarindex_normalized.csv", cfg)
     print(f"✓ KSH data loaded: {len(df)} rows")
     return df
 
@@ -105,7 +106,7 @@ def load_ingatlan_com_data():
             df['date'] = pd.to_datetime(df['date'])
         df['source'] = 'ingatlan.com'
 
-    df.to_csv(processed_dir / "ingatlancom_index_normalized.csv", index=False)
+    write_table(df, processed_dir / "ingatlancom_index_normalized.csv", cfg)
     print(f"✓ ingatlan.com data loaded: {len(df)} rows")
     return df
 
@@ -124,14 +125,16 @@ def unify_datasets():
 
     dfs = []
     for f in files:
-        if f.exists():
-            dfs.append(pd.read_csv(f))
+        if table_path(f, cfg).exists():
+            dfs.append(read_table(f, cfg))
         else:
             print(f"⚠️  {f} missing, skipping.")
 
     if not dfs:
         raise RuntimeError("No normalized files found.")
 
+    # Labels go back to plain strings so the differing categories concat cleanly
+    dfs = [d.astype({c: object for c in ("region", "segment", "source") if c in d.columns}) for d in dfs]
     df = pd.concat(dfs, ignore_index=True)
     df['date'] = pd.to_datetime(df['date'])
     
@@ -139,12 +142,12 @@ def unify_datasets():
     df['segment'] = df['segment'].fillna('all')
     
     df = df.sort_values(['region', 'segment', 'date'], na_position='last')
-    df.to_csv(unified_path, index=False)
+    unified_path = write_table(df, unified_path, cfg)
     print(f"✓ Unified dataset: {len(df)} rows → {unified_path}")
     return df
 
 
-if __name__ == "__main__":
+def main():
     print("Loading MNB data...")
     load_mnb_data()
     print("\nLoading KSH data...")
@@ -152,5 +155,10 @@ if __name__ == "__main__":
     print("\nLoading ingatlan.com data...")
     load_ingatlan_com_data()
     print("\nUnifying datasets...")
-    unify_datasets()
+    df = unify_datasets()
     print("\n✓ All data loaded and unified!")
+    return df
+
+
+if __name__ == "__main__":
+    main()
@@ -10,13 +10,14 @@ import os
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from src import load_settings
+from src.storage.tables import read_table, table_path, write_table
 
 
 def add_lags(df, group_cols, target_col, lags=(1, 3, 6, 12)):
     """Add lagged features"""
     df = df.sort_values(group_cols + ["date"])
     for l in lags:
-        df[f"{target_col}_lag{l}"] = df.groupby(group_cols)[target_col].shift(l)
+        df[f"{target_col}_lag{l}"] = df.groupby(group_cols, observed=True)[target_col].shift(l)
     return df
 
 
@@ -24,7 +25,7 @@ def add_rolling_features(df, group_cols, target_col, windows=(3, 6, 12)):
     """Add rolling standard deviation"""
     for w in windows:
         df[f"{target_col}_rolling_std_{w}"] = (
-            df.groupby(group_cols)[target_col]
+            df.groupby(group_cols, observed=True)[target_col]
             .rolling(window=w, min_periods=2)
             .std()
             .reset_index(level=list(range(len(group_cols))), drop=True)
@@ -38,11 +39,12 @@ def build_features():
     unified_path = Path(cfg["data"]["unified_file"])
     processed_dir = Path(cfg["data"]["processed_dir"])
 
-    if not unified_path.exists():
-        raise FileNotFoundError(f"Unified dataset {unified_path} not found. Run dataload.py first.")
+    unified_table = table_path(unified_path, cfg)
+    if not unified_table.exists():
+        raise FileNotFoundError(f"Unified dataset {unified_table} not found. Run dataload.py first.")
 
-    df = pd.read_csv(unified_path, parse_dates=["date"])
-    print(f"Loaded {len(df)} rows from {unified_path}")
+    df = read_table(unified_path, cfg)
+    print(f"Loaded {len(df)} rows from {unified_table}")
 
     # Ensure price_index is numeric
     df["price_index"] = pd.to_numeric(df["price_index"], errors='coerce')
@@ -61,10 +63,9 @@ def build_features():
     # Calculate returns
     print("Adding returns...")
     df = df.sort_values(group_cols + ["date"])
-    df["ret"] = df.groupby(group_cols)["price_index"].pct_change()
+    df["ret"] = df.groupby(group_cols, observed=True)["price_index"].pct_change()
 
-    out_path = processed_dir / "features_timeseries.csv"
-    df.to_csv(out_path, index=False)
+    out_path = write_table(df, processed_dir / "features_timeseries.csv", cfg)
     print(f"✓ Features saved to {out_path}")
     return df
 
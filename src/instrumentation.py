@@ -0,0 +1,143 @@
+"""
+Shared instrumentation.
+Measurements of pipeline stages and models (wall time, CPU time, peak
+memory, rows), the JSON run report written after each pipeline run,
+opt-in cProfile dumps, and latency histograms rendered in the Prometheus
+text format for the API's /metrics endpoint.
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+import cProfile
+import json
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Seconds; suits lookups served from memory up to a slow batch valuation
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def maxrss_mb(ru_maxrss):
+    """ru_maxrss in MB (Linux reports kilobytes, macOS bytes)"""
+    return ru_maxrss / (1024 ** 2 if sys.platform == "darwin" else 1024)
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far, or None where unsupported"""
+    if resource is None:
+        return None
+    return maxrss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+@dataclass
+class Measurement:
+    name: str
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    peak_rss_mb: float | None = None
+
+
+@contextmanager
+def measure(name, cpu_clock=time.thread_time):
+    """Time a block, filling in the yielded Measurement when it ends.
+
+    CPU time defaults to the calling thread's, so models measured side by
+    side in one process do not count each other; worker processes they
+    start are not included. Peak memory is the process high-water mark.
+    """
+    m = Measurement(name)
+    wall0, cpu0 = time.perf_counter(), cpu_clock()
+    try:
+        yield m
+    finally:
+        m.wall_seconds = time.perf_counter() - wall0
+        m.cpu_seconds = cpu_clock() - cpu0
+        m.peak_rss_mb = peak_rss_mb()
+
+
+def profile_path(profile_dir, name):
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    return Path(profile_dir) / f"profile_{name}_{stamp}.prof"
+
+
+def profiled(path, func, *args):
+    """Run func under cProfile and dump the stats to path (view with pstats or snakeviz)"""
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args)
+    finally:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(str(path))
+
+
+def write_run_report(report_dir, stages, **meta):
+    """Write one JSON report for a pipeline run and return its path"""
+    now = datetime.now(timezone.utc)
+    report = {"finished": now.isoformat(timespec="seconds"), **meta, "stages": stages}
+    report_dir = Path(report_dir)
+    report_dir.mkdir(parents=True, exist_ok=True)
+    path = report_dir / f"run_{now.strftime('%Y%m%dT%H%M%S%fZ')}.json"
+    path.write_text(json.dumps(report, indent=2, default=str), encoding="utf-8")
+    return path
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _number(x):
+    if isinstance(x, int):
+        return str(x)
+    return repr(float(x)) if x != float("inf") else "+Inf"
+
+
+class LatencyHistogram:
+    """Thread-safe latency histogram with one series per label set"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, seconds):
+        """labels is a tuple of (name, value) pairs"""
+        i = bisect_left(self.buckets, seconds)
+        with self._lock:
+            counts, total = self._series.get(labels, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[i] += 1
+            self._series[labels] = (counts, total + seconds)
+
+    def render(self, name, help_text):
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        with self._lock:
+            series = {k: (list(c), t) for k, (c, t) in self._series.items()}
+        for labels, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels((*labels, ('le', _number(bound))))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        return "\n".join(lines)
+
+
+def render_samples(name, help_text, kind, samples):
+    """Counter or gauge lines; samples are (labels, value) pairs"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{_labels(labels)} {_number(value)}" for labels, value in samples]
+    return "\n".join(lines)
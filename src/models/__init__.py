@@ -1 +0,0 @@
-__init__.py
\ No newline at end of file
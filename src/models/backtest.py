@@ -0,0 +1,153 @@
+"""
+Walk-forward portfolio backtest.
+Window moments come from prefix sums of pairwise cross-products, so each
+rebalance date costs two subtractions instead of a covariance recompute.
+The sample, OAS and Ledoit-Wolf estimators all run on these sums
+(Ledoit-Wolf adds third and fourth-order cross sums for its intensity);
+EWMA weights and factor regressions depend on the window's rows, so those
+two estimators recompute from the rows at each date.
+Rebalance dates are split across processes; each compiles the
+parametric frontier problem once and re-solves it per date.
+"""
+
+import numpy as np
+
+from src.models.common import process_pool
+from src.models.covariance import (
+    CROSS_SUMS, cross_factors, estimate_covariance, ledoit_wolf_from_sums, nearest_psd,
+    oas_intensity, shrink_to_identity,
+)
+from src.models.frontier import FrontierProblem
+
+
+class MomentPrefix:
+    """Cumulative pairwise power sums (covariance.CROSS_SUMS) of a T x n return panel"""
+
+    SECOND = ("n", "x", "xy")
+
+    def __init__(self, R, names=SECOND):
+        f = cross_factors(R)
+        T, n = f["m"].shape
+        # For pair (i, j): sums over rows where both exist, e.g. count, x_i, x_i * x_j
+        self.prefix = {}
+        for name in names:
+            a, b = CROSS_SUMS[name]
+            out = np.zeros((T + 1, n, n))
+            np.cumsum(f[a][:, :, None] * f[b][:, None, :], axis=0, out=out[1:])
+            self.prefix[name] = out
+
+    def sums(self, t0, t1):
+        """Pairwise sums of rows t0 <= t < t1"""
+        return {name: p[t1] - p[t0] for name, p in self.prefix.items()}
+
+    def window(self, t0, t1, ddof=1):
+        """Pairwise counts, means and covariances of rows t0 <= t < t1"""
+        s = self.sums(t0, t1)
+        n, sx = s["n"], s["x"]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mu = np.diag(sx) / np.diag(n)
+            cov = (s["xy"] - sx * sx.T / n) / (n - ddof)
+        return np.diag(n), mu, cov
+
+
+def rebalance_dates(T, window, min_window, every, expanding):
+    """Indices t at which weights are set from rows before t"""
+    first = min_window if expanding else max(window, min_window)
+    return np.arange(first, T, max(1, every))
+
+
+def _solve_dates(R, dates_idx, window, expanding, min_obs, choice, solver, max_weight, risk_free,
+                 estimator="sample", factors=None, halflife=12):
+    """Target weights at each rebalance index (runs in a worker process)"""
+    prefix = MomentPrefix(R, tuple(CROSS_SUMS) if estimator == "ledoit_wolf" else MomentPrefix.SECOND)
+    n = R.shape[1]
+    problem = FrontierProblem(n, solver=solver, max_weight=max_weight)
+    weights = np.full((len(dates_idx), n), np.nan)
+    ddof = 0 if estimator == "oas" else 1
+    for k, t in enumerate(dates_idx):
+        t0 = 0 if expanding else max(0, t - window)
+        counts, mu, cov = prefix.window(t0, t, ddof)
+        available = counts >= min_obs
+        if available.sum() == 0:
+            continue
+        if estimator == "sample":
+            cov = nearest_psd(np.where(np.isfinite(cov), cov, 0.0))
+        elif estimator == "ledoit_wolf":
+            mu, cov, _ = ledoit_wolf_from_sums(prefix.sums(t0, t))
+        elif estimator == "oas":
+            # Needs only the window covariance, so it stays on the prefix sums
+            cov = nearest_psd(np.where(np.isfinite(cov), cov, 0.0))
+            cov = shrink_to_identity(cov, oas_intensity(cov, float(np.median(counts[available]))))
+        else:
+            F = None if factors is None else factors[t0:t]
+            mu, cov = estimate_covariance(R[t0:t], estimator, F, halflife, min_obs)
+        problem.set_moments(np.nan_to_num(mu), cov, risk_free, available)
+        w = problem.max_sharpe() if choice == "tangency" else None
+        if w is None:
+            w = problem.min_variance()
+        if w is None:
+            w = available / available.sum()
+        weights[k] = w
+    return weights
+
+
+def hold(R, dates_idx, targets):
+    """Realized returns, turnover and drifting weights between rebalances.
+
+    Weights are reset to their targets at each rebalance index and drift
+    with asset returns until the next one; missing returns count as 0.
+    Returns (period returns, turnover, weights held) from the first
+    rebalance index onwards.
+    """
+    R = np.nan_to_num(np.asarray(R, dtype=float))
+    start = dates_idx[0]
+    T, n = R.shape
+    periods = T - start
+    port_ret = np.zeros(periods)
+    turnover = np.zeros(periods)
+    held = np.zeros((periods, n))
+    target_at = dict(zip(dates_idx, targets))
+    w = np.zeros(n)
+    for k, t in enumerate(range(start, T)):
+        target = target_at.get(t)
+        if target is not None and np.isfinite(target).all():
+            turnover[k] = np.abs(target - w).sum() if k else 0.0
+            w = target
+        held[k] = w
+        gross = w * (1 + R[t])
+        port_ret[k] = gross.sum() - 1
+        w = gross / gross.sum() if gross.sum() > 0 else w
+    return port_ret, turnover, held
+
+
+def walk_forward(R, window=36, min_window=24, every=3, expanding=False, min_obs=12,
+                 choice="tangency", solver="CLARABEL", max_weight=None, risk_free=0.0,
+                 workers=1, estimator="sample", factors=None, halflife=12):
+    """Walk-forward backtest over a T x n return panel.
+
+    Returns a dict with rebalance (indices), targets (weights set at each
+    rebalance), returns, turnover and weights (held per period, both from
+    the first rebalance onwards).
+    """
+    T = len(R)
+    dates_idx = rebalance_dates(T, window, min_window, every, expanding)
+    if len(dates_idx) == 0:
+        return None
+
+    args = (window, expanding, min_obs, choice, solver, max_weight, risk_free, estimator, factors, halflife)
+    chunks = [c for c in np.array_split(dates_idx, max(1, min(workers, len(dates_idx)))) if len(c)]
+    if len(chunks) > 1:
+        with process_pool(len(chunks)) as pool:
+            parts = list(pool.map(_solve_dates, [R] * len(chunks), chunks, *[[a] * len(chunks) for a in args]))
+    else:
+        parts = [_solve_dates(R, dates_idx, *args)]
+    targets = np.concatenate(parts)
+
+    returns, turnover, weights = hold(R, dates_idx, targets)
+    return {
+        "rebalance": dates_idx,
+        "targets": targets,
+        "returns": returns,
+        "turnover": turnover,
+        "weights": weights,
+    }
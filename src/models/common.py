@@ -0,0 +1,82 @@
+"""
+Shared I/O helpers for the model scripts.
+Models compute on an in-memory features frame; loading and saving live here.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from src.storage.tables import read_table, table_path, write_table
+
+
+def features_path(cfg):
+    return table_path(Path(cfg["data"]["processed_dir"]) / "features_timeseries.csv", cfg)
+
+
+def load_features(cfg):
+    """Read the features table with parsed dates"""
+    path = features_path(cfg)
+    if not path.exists():
+        raise FileNotFoundError(f"Features file {path} not found.")
+    return read_table(path, cfg)
+
+
+def save_output(out_df, cfg, model_key):
+    """Write a model output frame to its configured file and return the path"""
+    return write_table(out_df, cfg["models"][model_key]["output_file"], cfg)
+
+
+def process_pool(workers):
+    """Worker process pool for the model scripts.
+
+    Workers are spawned, not forked: with --in-process a stage runs on a
+    thread of a multi-threaded process, where fork can deadlock.
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def to_panel(df, value_col="price_index"):
+    """Pivot long (region, segment, date) rows into a G x T array.
+
+    Returns (keys frame, dates index, values). Series that start late or
+    skip dates hold NaN there; duplicate dates within a group are averaged.
+    """
+    df = df.dropna(subset=[value_col])
+    grouped = df.groupby(["region", "segment"], observed=True, sort=True)
+    codes = grouped.ngroup().to_numpy()
+    date_codes, dates = pd.factorize(df["date"], sort=True)
+
+    shape = (grouped.ngroups, len(dates))
+    sums = np.zeros(shape)
+    counts = np.zeros(shape)
+    np.add.at(sums, (codes, date_codes), df[value_col].to_numpy(dtype=float))
+    np.add.at(counts, (codes, date_codes), 1)
+    with np.errstate(invalid="ignore"):
+        values = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+    keys = pd.DataFrame(list(grouped.groups.keys()), columns=["region", "segment"])
+    return keys, pd.DatetimeIndex(dates), values
+
+
+def month_index(dates):
+    """Integer months since the first panel date (the time axis of trend models)"""
+    months = dates.year * 12 + dates.month - 1
+    return np.asarray(months - months.min())
+
+
+def from_panel(keys, dates, columns, mask):
+    """Flatten G x T arrays back to long rows wherever mask is True"""
+    g, t = np.nonzero(mask)
+    out = pd.DataFrame({
+        "date": dates[t],
+        "region": keys["region"].to_numpy()[g],
+        "segment": keys["segment"].to_numpy()[g],
+    })
+    for name, arr in columns.items():
+        arr = np.asarray(arr)
+        out[name] = arr[g, t] if arr.ndim == 2 else arr[g]
+    return out
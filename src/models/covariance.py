@@ -0,0 +1,204 @@
+"""
+Covariance estimators for return panels with missing values.
+All estimators work on pairwise-available data (NaN = missing) instead of
+dropping every period where one series is absent, and return a positive
+semi-definite matrix:
+  sample       – pairwise sample covariance
+  ledoit_wolf  – shrinkage towards a scaled identity (Ledoit & Wolf 2004)
+  oas          – oracle approximating shrinkage (Chen et al. 2010)
+  ewma         – exponentially weighted, recent periods count more
+  factor       – B Σ_F B' + D from regressions on index factor returns
+Ledoit-Wolf and OAS shrink the maximum-likelihood (ddof=0) covariance, so
+their intensities match the published estimators (and sklearn); sample,
+ewma and factor use the unbiased (ddof=1) covariance.
+"""
+
+import numpy as np
+
+ESTIMATORS = ("sample", "ledoit_wolf", "oas", "ewma", "factor")
+
+
+def pairwise_moments(R, weights=None, ddof=1):
+    """Pairwise counts (n x n), own means (n,) and covariances (n x n).
+
+    Each pair uses the periods where both series are observed; with
+    weights (T,) the moments are weighted, counts are weight sums and
+    ddof is ignored.
+    """
+    R = np.asarray(R, dtype=float)
+    obs = ~np.isnan(R)
+    X = np.where(obs, R, 0.0)
+    m = obs.astype(float)
+    w = np.ones(len(R)) if weights is None else np.asarray(weights, dtype=float)
+
+    counts = (m * w[:, None]).T @ m
+    sx = (X * w[:, None]).T @ m  # sx[i, j]: sum of x_i where j is observed too
+    sxy = (X * w[:, None]).T @ X
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mu = np.diag(sx) / np.diag(counts)
+        # Weighted moments use the weight sum
+        dof = counts - ddof if weights is None else counts
+        cov = (sxy - sx * sx.T / counts) / dof
+    return counts, mu, cov
+
+
+def nearest_psd(cov, floor=0.0):
+    """Symmetric matrix with eigenvalues clipped at floor"""
+    cov = (cov + cov.T) / 2
+    vals, vecs = np.linalg.eigh(cov)
+    if vals.min() >= floor:
+        return cov
+    return (vecs * np.clip(vals, floor, None)) @ vecs.T
+
+
+def shrink_to_identity(cov, intensity):
+    """(1 - s) * cov + s * (mean variance) * I"""
+    target = np.trace(cov) / len(cov)
+    return (1 - intensity) * cov + intensity * target * np.eye(len(cov))
+
+
+def _clean(cov):
+    cov = np.where(np.isfinite(cov), cov, 0.0)
+    return nearest_psd(cov)
+
+
+# Pairwise power sums: name -> (row factor of series i, row factor of series j)
+CROSS_SUMS = {
+    "n": ("m", "m"),
+    "x": ("x", "m"),
+    "xy": ("x", "x"),
+    "x2": ("x2", "m"),
+    "x2y": ("x2", "x"),
+    "x2y2": ("x2", "x2"),
+}
+
+
+def cross_factors(R):
+    """Per-period factors of CROSS_SUMS: observed mask, values, squares (0 where missing)"""
+    R = np.asarray(R, dtype=float)
+    obs = ~np.isnan(R)
+    X = np.where(obs, R, 0.0)
+    return {"m": obs.astype(float), "x": X, "x2": X ** 2}
+
+
+def cross_sums(R):
+    """Pairwise power sums of a T x n panel, one n x n array per CROSS_SUMS name.
+
+    Entry [i, j] sums over the periods where both i and j are observed,
+    e.g. x2y[i, j] = sum of x_i^2 x_j. Sums over disjoint periods add,
+    so window sums can be taken from prefix sums.
+    """
+    f = cross_factors(R)
+    return {name: f[a].T @ f[b] for name, (a, b) in CROSS_SUMS.items()}
+
+
+def ledoit_wolf_from_sums(sums):
+    """Ledoit-Wolf (mu, cov, intensity) from cross_sums of a window.
+
+    Series are centered at their own means; the centered second and fourth
+    cross-moments are expanded in the raw power sums.
+    """
+    N = sums["n"]
+    n = np.maximum(N, 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mu = np.diag(sums["x"]) / np.diag(N)
+    m = np.nan_to_num(mu)
+    mi, mj = m[:, None], m[None, :]
+    x, x2, x2y = sums["x"], sums["x2"], sums["x2y"]
+
+    # B = sum (x_i - m_i)(x_j - m_j);  A = sum (x_i - m_i)^2 (x_j - m_j)^2
+    B = sums["xy"] - mj * x - mi * x.T + mi * mj * N
+    A = (sums["x2y2"] - 2 * mj * x2y - 2 * mi * x2y.T + mj ** 2 * x2 + mi ** 2 * x2.T
+         + 4 * mi * mj * sums["xy"] - 2 * mi * mj ** 2 * x - 2 * mi ** 2 * mj * x.T
+         + mi ** 2 * mj ** 2 * N)
+
+    # Biased pairwise covariance and the variance of its estimate (b-bar^2)
+    S = B / n
+    b2 = ((A - 2 * S * B + S ** 2 * N) / n ** 2).sum()
+    d2 = ((S - np.trace(S) / len(S) * np.eye(len(S))) ** 2).sum()
+    intensity = 1.0 if d2 <= 0 else min(b2, d2) / d2
+    return mu, nearest_psd(shrink_to_identity(_clean(S), intensity)), intensity
+
+
+def ledoit_wolf(R):
+    """Ledoit-Wolf shrinkage with pairwise sums; returns (mu, cov, intensity)"""
+    return ledoit_wolf_from_sums(cross_sums(R))
+
+
+def oas_intensity(cov, n_obs):
+    """OAS shrinkage intensity for a p x p covariance estimated from n_obs periods"""
+    p = len(cov)
+    mu = np.trace(cov) / p
+    alpha = (cov ** 2).mean()
+    num = alpha + mu ** 2
+    den = (n_obs + 1.0) * (alpha - mu ** 2 / p)
+    return 1.0 if den <= 0 else min(num / den, 1.0)
+
+
+def oas(R):
+    """Oracle approximating shrinkage; returns (mu, cov, intensity)"""
+    counts, mu, cov = pairwise_moments(R, ddof=0)
+    cov = _clean(cov)
+    intensity = oas_intensity(cov, float(np.median(np.diag(counts))))
+    return mu, shrink_to_identity(cov, intensity), intensity
+
+
+def ewma(R, halflife=12):
+    """Exponentially weighted moments; the last period has weight 1"""
+    T = len(R)
+    weights = 0.5 ** ((T - 1 - np.arange(T)) / float(halflife))
+    _, mu, cov = pairwise_moments(R, weights)
+    return mu, _clean(cov)
+
+
+def factor_model(R, F, min_obs=12):
+    """Covariance implied by OLS regressions of each series on factor returns.
+
+    F is a T x k panel aligned with R; factors with fewer than min_obs
+    periods overlapping R are dropped. Each series is regressed on the
+    remaining factors over the periods where all are observed.
+    Returns (mu, cov, kept factor mask); without usable factors the
+    diagonal of the sample covariance is returned.
+    """
+    R = np.asarray(R, dtype=float)
+    F = np.asarray(F, dtype=float).reshape(len(R), -1)
+    _, mu, sample = pairwise_moments(R)
+    keep = (~np.isnan(F)).sum(axis=0) >= min_obs
+    F = F[:, keep]
+    if F.shape[1] == 0:
+        return mu, np.diag(np.nan_to_num(np.diag(sample))), keep
+
+    f_ok = ~np.isnan(F).any(axis=1)
+    _, _, cov_f = pairwise_moments(F[f_ok])
+    n, k = R.shape[1], F.shape[1]
+    betas = np.zeros((n, k))
+    resid_var = np.nan_to_num(np.diag(sample)).copy()
+    for i in range(n):
+        rows = f_ok & ~np.isnan(R[:, i])
+        if rows.sum() < max(min_obs, k + 2):
+            continue
+        X = np.column_stack([np.ones(rows.sum()), F[rows]])
+        coef, *_ = np.linalg.lstsq(X, R[rows, i], rcond=None)
+        resid = R[rows, i] - X @ coef
+        betas[i] = coef[1:]
+        resid_var[i] = resid @ resid / (rows.sum() - k - 1)
+    cov = betas @ _clean(cov_f) @ betas.T + np.diag(resid_var)
+    return mu, nearest_psd(cov), keep
+
+
+def estimate_covariance(R, method="sample", factors=None, halflife=12, min_obs=12):
+    """Mean returns and covariance of a T x n panel with the chosen estimator"""
+    if method == "sample":
+        _, mu, cov = pairwise_moments(R)
+        return mu, _clean(cov)
+    if method == "ledoit_wolf":
+        return ledoit_wolf(R)[:2]
+    if method == "oas":
+        return oas(R)[:2]
+    if method == "ewma":
+        return ewma(R, halflife)
+    if method == "factor":
+        if factors is None:
+            raise ValueError("The factor covariance estimator needs factor returns")
+        return factor_model(R, factors, min_obs)[:2]
+    raise ValueError(f"Unknown covariance estimator {method!r}; expected one of {ESTIMATORS}")
@@ -0,0 +1,138 @@
+"""
+Parametric long-only mean-variance frontier.
+The QP is compiled once with cvxpy Parameters (DPP): expected returns,
+a covariance factor and the target return can change between solves
+without re-canonicalizing, and successive solves are warm-started.
+"""
+
+import numpy as np
+
+try:
+    import cvxpy as cp
+except ImportError:
+    cp = None
+
+# Tight tolerances: the defaults of first-order solvers are too loose for weights
+SOLVER_OPTIONS = {
+    "OSQP": {"eps_abs": 1e-9, "eps_rel": 1e-9, "polish": True, "max_iter": 200_000},
+    "CLARABEL": {},
+}
+
+
+def covariance_factor(cov):
+    """F with F @ F.T == cov; PSD-clipped eigen factor if Cholesky fails"""
+    cov = (cov + cov.T) / 2
+    try:
+        return np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        vals, vecs = np.linalg.eigh(cov)
+        return vecs * np.sqrt(np.clip(vals, 0.0, None))
+
+
+class FrontierProblem:
+    """Minimum-variance and tangency QPs over n assets, compiled once"""
+
+    def __init__(self, n, solver="CLARABEL", max_weight=None):
+        self.n = n
+        self.solver = solver
+        self.options = SOLVER_OPTIONS.get(solver, {})
+        self.max_weight = 1.0 if max_weight is None else float(max_weight)
+        self.mu = cp.Parameter(n)
+        self.factor = cp.Parameter((n, n))
+        self.target = cp.Parameter()
+        self.excess = cp.Parameter(n)
+        self.cap = cp.Parameter(n, nonneg=True)  # per-asset weight cap; 0 excludes an asset
+
+        # Minimum variance for a target return
+        self.w = cp.Variable(n)
+        constraints = [cp.sum(self.w) == 1, self.w >= 0, self.w <= self.cap, self.mu @ self.w >= self.target]
+        self.frontier = cp.Problem(cp.Minimize(cp.sum_squares(self.factor.T @ self.w)), constraints)
+
+        # Max Sharpe as a QP: min y'Σy s.t. excess'y = 1, y >= 0, then w = y / sum(y)
+        self.y = cp.Variable(n)
+        constraints = [self.excess @ self.y == 1, self.y >= 0, self.y <= cp.multiply(self.cap, cp.sum(self.y))]
+        self.tangency = cp.Problem(cp.Minimize(cp.sum_squares(self.factor.T @ self.y)), constraints)
+
+    def set_moments(self, mu, cov, risk_free=0.0, available=None):
+        """Load new moments; assets not available are held at zero weight"""
+        mu = np.asarray(mu, dtype=float)
+        cov = np.asarray(cov, dtype=float)
+        available = np.ones(self.n, dtype=bool) if available is None else np.asarray(available)
+        if not available.all():
+            # Neutral placeholders keep the factor well defined
+            mu = np.where(available, mu, 0.0)
+            cov = np.where(available[:, None] & available[None, :], cov, 0.0)
+            cov[~available, ~available] = 1.0
+        self.mu.value = mu
+        self.factor.value = covariance_factor(cov)
+        self.excess.value = np.where(available, mu - risk_free, 0.0)
+        self.cap.value = np.where(available, self.max_weight, 0.0)
+        self._available = available
+
+    def _solve(self, problem, var):
+        try:
+            problem.solve(solver=self.solver, warm_start=True, **self.options)
+        except cp.error.SolverError:
+            return None
+        if problem.status not in ("optimal", "optimal_inaccurate") or var.value is None:
+            return None
+        return var.value
+
+    def min_variance(self, target=None):
+        """Weights of the minimum-variance portfolio, optionally with a return floor"""
+        lowest = self.mu.value[self._available].min()
+        self.target.value = float(lowest if target is None else target)
+        w = self._solve(self.frontier, self.w)
+        return None if w is None else _clean(w)
+
+    def max_sharpe(self):
+        """Tangency weights, or None if no asset beats the risk-free rate"""
+        if not (self.excess.value > 0).any():
+            return None
+        y = self._solve(self.tangency, self.y)
+        return None if y is None or y.sum() <= 0 else _clean(y / y.sum())
+
+    def max_return(self):
+        """Highest expected return reachable under the weight caps.
+
+        Filling the best assets up to their cap in order of expected return
+        solves the LP exactly; without caps this is the best asset's return.
+        """
+        mu = self.mu.value[self._available]
+        order = np.argsort(mu)[::-1]
+        cumulative = np.minimum(np.arange(1, len(mu) + 1) * self.max_weight, 1.0)
+        fill = np.diff(cumulative, prepend=0.0)
+        return float(mu[order] @ fill)
+
+    def sweep(self, n_points=50):
+        """Frontier from the minimum-variance return up to the best capped return.
+
+        Returns (targets, weights) for the feasible points, weights n_points x n.
+        """
+        w0 = self.min_variance()
+        if w0 is None:
+            return np.empty(0), np.empty((0, self.n))
+        lo, hi = float(self.mu.value @ w0), self.max_return()
+        targets, weights = [], []
+        for target in np.linspace(lo, hi, n_points):
+            w = self.min_variance(target)
+            if w is not None:
+                targets.append(target)
+                weights.append(w)
+        return np.array(targets), np.array(weights).reshape(-1, self.n)
+
+
+def _clean(w):
+    """Clip solver noise below zero and renormalize"""
+    w = np.clip(w, 0.0, None)
+    return w / w.sum()
+
+
+def portfolio_stats(weights, mu, cov, risk_free=0.0):
+    """Expected return, volatility and Sharpe ratio of each row of weights"""
+    weights = np.atleast_2d(weights)
+    ret = weights @ mu
+    vol = np.sqrt(np.maximum(np.einsum("pi,ij,pj->p", weights, cov, weights), 0.0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe = np.where(vol > 0, (ret - risk_free) / vol, np.nan)
+    return ret, vol, sharpe
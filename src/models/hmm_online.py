@@ -0,0 +1,59 @@
+"""
+Batched forward filter for Gaussian HMMs.
+Updates the filtered state probabilities of many series at once, one
+observation at a time in O(K^2), so new returns can be classified from
+stored parameters and filter state without an EM refit.
+"""
+
+import numpy as np
+
+
+def state_loglik(x, means, variances):
+    """Log density of x (G,) under each state's Gaussian (G x K)"""
+    x = x[:, None]
+    return -0.5 * (np.log(2 * np.pi * variances) + (x - means) ** 2 / variances)
+
+
+def forward_filter(X, startprob, transmat, means, variances, prob0=None):
+    """Filter a G x T panel of returns (NaN = no observation).
+
+    Parameters are stacked per series: startprob, means, variances (G x K)
+    and transmat (G x K x K). prob0 (G x K) is the filtered distribution
+    after the last already-processed observation; rows of NaN (or
+    prob0=None) start from startprob, as a fresh fit would.
+    Returns a dict of filtered (G x T x K, NaN where unobserved), last
+    (G x K), loglik (G,), the predictive log-likelihood of the processed
+    observations, and n_obs (G,).
+    """
+    X = np.asarray(X, dtype=float)
+    G, T_len = X.shape
+    K = startprob.shape[1]
+    prob = np.full((G, K), np.nan) if prob0 is None else np.array(prob0, dtype=float)
+    started = np.isfinite(prob).all(axis=1)
+    prob = np.where(started[:, None], prob, startprob)
+
+    filtered = np.full((G, T_len, K), np.nan)
+    loglik = np.zeros(G)
+    n_obs = np.zeros(G, dtype=int)
+    with np.errstate(divide="ignore"):
+        log_A = np.log(transmat)
+    for t in range(T_len):
+        obs = ~np.isnan(X[:, t])
+        if not obs.any():
+            continue
+        # Predict in log space so near-zero transition probabilities are safe
+        log_pred = np.where(
+            started[:, None],
+            np.logaddexp.reduce(np.log(np.maximum(prob, 1e-300))[:, :, None] + log_A, axis=1),
+            np.log(np.maximum(prob, 1e-300)),
+        )
+        log_joint = log_pred + state_loglik(np.nan_to_num(X[:, t]), means, variances)
+        top = log_joint.max(axis=1, keepdims=True)
+        w = np.exp(log_joint - top)
+        total = w.sum(axis=1, keepdims=True)
+        prob = np.where(obs[:, None], w / total, prob)
+        loglik += np.where(obs, top[:, 0] + np.log(total[:, 0]), 0.0)
+        n_obs += obs
+        started |= obs
+        filtered[obs, t] = prob[obs]
+    return {"filtered": filtered, "last": prob, "loglik": loglik, "n_obs": n_obs}
@@ -0,0 +1,239 @@
+"""
+Batched Kalman filter and RTS smoother.
+Local-level and local-linear-trend models run over every series at once:
+the recursion loops over time, each step is vectorized across series.
+Missing observations (NaN) are skipped by the update step, and each series
+starts at its own first observation.
+"""
+
+import numpy as np
+
+MODELS = ("local_level", "local_linear_trend")
+
+
+def system_matrices(model):
+    """Transition matrix T and observation vector Z of a structural model"""
+    if model == "local_level":
+        return np.array([[1.0]]), np.array([1.0])
+    if model == "local_linear_trend":
+        return np.array([[1.0, 1.0], [0.0, 1.0]]), np.array([1.0, 0.0])
+    raise ValueError(f"Unknown Kalman model {model!r}; expected one of {MODELS}")
+
+
+def _per_series(x, n):
+    return np.broadcast_to(np.asarray(x, dtype=float), (n,)).copy()
+
+
+def kalman_filter(Y, obs_var, level_var, slope_var=0.0, model="local_level",
+                  diffuse_scale=1e4, smooth=True):
+    """Filter (and optionally smooth) a G x T panel.
+
+    obs_var, level_var and slope_var are scalars or length-G arrays.
+    Returns a dict of arrays: filtered_mean / filtered_var (G x T x m and
+    G x T x m x m), smoothed_* likewise when smooth, and loglik (G,), the
+    prediction-error log-likelihood excluding each series' first m
+    observations (one per diffuse state), with its parts sum_log_f,
+    sum_v2_f and n_obs.
+    States before a series' first observation are NaN.
+    """
+    Y = np.asarray(Y, dtype=float)
+    G, T_len = Y.shape
+    Tm, Z = system_matrices(model)
+    m = len(Z)
+
+    H = _per_series(obs_var, G)
+    Q = np.zeros((G, m, m))
+    Q[:, 0, 0] = _per_series(level_var, G)
+    if m == 2:
+        Q[:, 1, 1] = _per_series(slope_var, G)
+
+    observed = ~np.isnan(Y)
+    has_obs = observed.any(axis=1)
+    first = np.where(has_obs, observed.argmax(axis=1), T_len)
+    y_first = Y[np.arange(G), np.minimum(first, T_len - 1)]
+    scale = np.nanvar(np.where(observed, Y, np.nan), axis=1) if T_len > 1 else np.ones(G)
+    scale = np.where(np.isfinite(scale) & (scale > 0), scale, 1.0)
+
+    # Approximately diffuse start at each series' first observation
+    a = np.zeros((G, m))
+    a[:, 0] = np.nan_to_num(y_first)
+    P = np.zeros((G, m, m))
+    P[:, np.arange(m), np.arange(m)] = (diffuse_scale * scale)[:, None]
+
+    a_pred = np.full((G, T_len, m), np.nan)
+    P_pred = np.full((G, T_len, m, m), np.nan)
+    a_filt = np.full((G, T_len, m), np.nan)
+    P_filt = np.full((G, T_len, m, m), np.nan)
+    loglik = np.zeros(G)
+    sum_log_f = np.zeros(G)
+    sum_v2_f = np.zeros(G)
+    n_obs = np.zeros(G)
+    n_seen = np.zeros(G, dtype=int)
+
+    for t in range(T_len):
+        active = t >= first
+        if t > 0:
+            # Predict only after a series' first point: every series starts
+            # from the same diffuse state, whatever its start date
+            a_next = a @ Tm.T
+            P_next = Tm @ P @ Tm.T + Q
+            a = np.where((t > first)[:, None], a_next, a)
+            P = np.where((t > first)[:, None, None], P_next, P)
+        a_pred[:, t] = a
+        P_pred[:, t] = P
+
+        obs = observed[:, t] & active
+        v = np.where(obs, Y[:, t] - a @ Z, 0.0)
+        PZ = P @ Z
+        F = PZ @ Z + H
+        K = PZ / F[:, None]
+        a = a + K * v[:, None]
+        P = P - np.where(obs[:, None, None], K[:, :, None] * K[:, None, :] * F[:, None, None], 0.0)
+
+        # The first m innovations only resolve the diffuse initial state
+        contrib = obs & (n_seen >= m)
+        n_seen += obs
+        log_f = np.log(F)
+        v2_f = v ** 2 / F
+        loglik -= np.where(contrib, 0.5 * (np.log(2 * np.pi) + log_f + v2_f), 0.0)
+        sum_log_f += np.where(contrib, log_f, 0.0)
+        sum_v2_f += np.where(contrib, v2_f, 0.0)
+        n_obs += contrib
+
+        a_filt[:, t] = a
+        P_filt[:, t] = P
+
+    started = (np.arange(T_len)[None, :] >= first[:, None])
+    a_filt[~started] = np.nan
+    P_filt[~started] = np.nan
+
+    out = {
+        "filtered_mean": a_filt,
+        "filtered_var": P_filt,
+        "loglik": loglik,
+        "sum_log_f": sum_log_f,
+        "sum_v2_f": sum_v2_f,
+        "n_obs": n_obs,
+    }
+    if smooth:
+        out.update(_rts_smoother(a_pred, P_pred, a_filt, P_filt, Tm, started))
+    return out
+
+
+def _rts_smoother(a_pred, P_pred, a_filt, P_filt, Tm, started):
+    """Rauch-Tung-Striebel backward pass over all series"""
+    G, T_len, m = a_filt.shape
+    a_s = a_filt.copy()
+    P_s = P_filt.copy()
+    for t in range(T_len - 2, -1, -1):
+        ok = started[:, t]
+        if not ok.any():
+            continue
+        Pf = P_filt[ok, t]
+        J = Pf @ Tm.T @ np.linalg.inv(P_pred[ok, t + 1])
+        a_s[ok, t] = a_filt[ok, t] + np.einsum("gij,gj->gi", J, a_s[ok, t + 1] - a_pred[ok, t + 1])
+        P_s[ok, t] = Pf + J @ (P_s[ok, t + 1] - P_pred[ok, t + 1]) @ np.swapaxes(J, 1, 2)
+    return {"smoothed_mean": a_s, "smoothed_var": P_s}
+
+
+def concentrated_loglik(Y, log_ratios, model="local_level"):
+    """Profile log-likelihood with the observation variance concentrated out.
+
+    log_ratios holds log(state variance / observation variance) per series,
+    one column per state noise (level, and slope for local_linear_trend).
+    Returns (loglik, sigma2) where sigma2 is the ML observation variance.
+    """
+    log_ratios = np.atleast_2d(log_ratios)
+    ratios = np.exp(log_ratios)
+    slope = ratios[:, 1] if ratios.shape[1] > 1 else 0.0
+    res = kalman_filter(Y, 1.0, ratios[:, 0], slope, model=model, smooth=False)
+    n = np.maximum(res["n_obs"], 1)
+    sigma2 = np.maximum(res["sum_v2_f"] / n, 1e-12)
+    loglik = -0.5 * (n * np.log(2 * np.pi * sigma2) + res["sum_log_f"] + n)
+    return loglik, sigma2
+
+
+def _eval_candidates(Y, candidates, model):
+    """Concentrated loglik of K candidate log-ratio vectors per series (G x K x k)"""
+    G, K, k = candidates.shape
+    ll, _ = concentrated_loglik(np.repeat(Y, K, axis=0), candidates.reshape(G * K, k), model)
+    return ll.reshape(G, K)
+
+
+def _grid_search(Y, center, radius, grid_points, bounds, model):
+    """Best point of a per-series grid around center; returns (best, loglik, grid step)"""
+    G, k = center.shape
+    # Product of per-coordinate offsets, evaluated in one pass
+    offsets = np.linspace(-1.0, 1.0, grid_points)
+    mesh = np.stack(np.meshgrid(*[offsets] * k, indexing="ij"), axis=-1).reshape(-1, k)
+    candidates = np.clip(center[:, None, :] + radius[:, None, None] * mesh[None], *bounds)
+    ll = _eval_candidates(Y, candidates, model)
+    pick = ll.argmax(axis=1)
+    return candidates[np.arange(G), pick], ll[np.arange(G), pick], 2.0 * radius / (grid_points - 1)
+
+
+def estimate_noise(Y, model="local_level", init_log_ratios=None, bounds=(-10.0, 4.0),
+                   grid_points=15, warm_grid_points=5, warm_radius=1.0, refine_iters=25):
+    """Per-series maximum-likelihood noise variances, vectorized over series.
+
+    The observation variance is concentrated out analytically, leaving one
+    log signal-to-noise ratio per state noise. Those are located with a
+    batched grid (around init_log_ratios when given, for warm starts) and
+    refined by golden-section search, coordinate by coordinate; every
+    likelihood evaluation is a single filter pass over all series.
+    A warm start whose grid optimum lands on the edge of the warm grid is
+    treated as stale: those series are searched over the full cold grid as
+    well and keep whichever point has the higher likelihood.
+    Returns a dict of obs_var, level_var, slope_var and loglik (G,).
+    """
+    Y = np.asarray(Y, dtype=float)
+    G = len(Y)
+    k = len(system_matrices(model)[1])
+    lo, hi = bounds
+
+    cold_center = np.full((G, k), (lo + hi) / 2)
+    cold_radius = np.full(G, (hi - lo) / 2)
+    if init_log_ratios is None:
+        best, ll, step = _grid_search(Y, cold_center, cold_radius, grid_points, bounds, model)
+    else:
+        center = np.clip(np.asarray(init_log_ratios, dtype=float).reshape(G, k), lo, hi)
+        best, ll, step = _grid_search(Y, center, np.full(G, warm_radius), warm_grid_points,
+                                      bounds, model)
+        # On the warm-grid edge (and not at the bounds): the optimum may lie beyond it
+        at_edge = np.abs(np.abs(best - center) - warm_radius) < 1e-9
+        at_bound = (best <= lo) | (best >= hi)
+        stale = (at_edge & ~at_bound).any(axis=1)
+        if stale.any():
+            c_best, c_ll, c_step = _grid_search(Y[stale], cold_center[stale], cold_radius[stale],
+                                                grid_points, bounds, model)
+            better = c_ll > ll[stale]
+            idx = np.flatnonzero(stale)[better]
+            best[idx] = c_best[better]
+            step[idx] = c_step[better]
+
+    # Golden-section refinement within one grid step of the best point
+    inv_phi = (np.sqrt(5.0) - 1.0) / 2.0
+    for j in range(k):
+        a = np.clip(best[:, j] - step, lo, hi)
+        b = np.clip(best[:, j] + step, lo, hi)
+        for _ in range(refine_iters):
+            c = b - inv_phi * (b - a)
+            d = a + inv_phi * (b - a)
+            trial = np.repeat(best[:, None, :], 2, axis=1)
+            trial[:, 0, j] = c
+            trial[:, 1, j] = d
+            ll = _eval_candidates(Y, trial, model)
+            left = ll[:, 0] >= ll[:, 1]
+            b = np.where(left, d, b)
+            a = np.where(left, a, c)
+        best[:, j] = (a + b) / 2
+
+    loglik, sigma2 = concentrated_loglik(Y, best, model)
+    ratios = np.exp(best)
+    return {
+        "obs_var": sigma2,
+        "level_var": ratios[:, 0] * sigma2,
+        "slope_var": ratios[:, 1] * sigma2 if k > 1 else np.zeros(G),
+        "log_ratios": best,
+        "loglik": loglik,
+    }
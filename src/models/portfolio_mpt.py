@@ -1,104 +1,227 @@
 """
 Modern Portfolio Theory (MPT) optimization.
 Computes efficient frontier and optimal weights.
+The frontier is swept over every region x segment series with one
+compiled parametric QP; tangency and minimum-variance weights are kept.
 """
 
 import pandas as pd
 import numpy as np
-from pathlib import Path
 import sys
 import os
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from src import load_settings
-
-try:
-    import cvxpy as cp
-except ImportError:
-    cp = None
+from src.models.common import load_features, save_output, to_panel
+from src.models.covariance import estimate_covariance
+from src.models.backtest import walk_forward
+from src.models.frontier import FrontierProblem, cp, portfolio_stats
+from src.storage.tables import write_table
 
 
 def mpt_fallback(rets, valid_segments):
     """Fallback: equal weights"""
-    return np.ones(len(valid_segments)) / len(valid_segments)
-
-
-def main():
-    cfg = load_settings()
-    features_path = Path(cfg["data"]["processed_dir"]) / "features_timeseries.csv"
-    out_path = Path(cfg["models"]["portfolio"]["output_file"])
-
-    if not features_path.exists():
-        raise FileNotFoundError(f"Features file {features_path} not found.")
-
-    df = pd.read_csv(features_path, parse_dates=["date"])
-
-    # Extract unique segments
-    segments = df["segment"].unique()
-    segments = [s for s in segments if s != 'all'][:3]  # Top 3
-
-    rets = []
-    valid_segments = []
-    for seg in segments:
-        sub = df[(df["segment"] == seg)].copy()
-        sub = sub.sort_values("date")
-        if sub.empty:
+    return np.ones(len(valid_segments)) / max(1, len(valid_segments))
+
+
+def asset_returns(df, min_returns=12):
+    """Period returns of every region x segment series (national index excluded).
+
+    Returns (keys, dates, R) with R a T x n array, NaN where a series has
+    no observation at either end of the period.
+    """
+    keys, dates, Y = to_panel(df[df["segment"] != "all"], "price_index")
+    R = (Y[:, 1:] / Y[:, :-1] - 1).T
+    enough = (~np.isnan(R)).sum(axis=0) >= min_returns
+    return keys[enough].reset_index(drop=True), dates[1:], R[:, enough]
+
+
+def run(df, cfg=None):
+    """Efficient frontier, tangency and minimum-variance weights for all series"""
+    cfg = cfg or load_settings()
+    params = cfg["models"]["portfolio"]
+    risk_free = float(params.get("risk_free", 0.0))
+    keys, dates, R = asset_returns(df, int(params.get("min_returns", 12)))
+    out_df = keys.copy()
+
+    method = params.get("covariance", "sample")
+    F = factor_returns(df, dates, params.get("factors", [])) if method == "factor" else None
+    if F is not None:
+        complete = ~np.isnan(F).any(axis=1)
+        print(f"Factor returns: {F.shape[1]} factor(s), all observed in {complete.sum()} "
+              f"of {len(dates)} periods")
+
+    backtest = params.get("backtest") or {}
+    if backtest.get("enabled", False) and cp is not None and len(keys) >= 2:
+        run_backtest(keys, dates, R, params, cfg, F)
+
+    if len(keys) < 2:
+        print("⚠️  Not enough series for portfolio optimization.")
+        weights = mpt_fallback(R, keys)
+        out_df["weight"] = out_df["tangency_weight"] = out_df["min_variance_weight"] = weights
+        return out_df
+
+    # Pairwise-available returns: no period is dropped for a missing series
+    mu, cov = estimate_covariance(
+        R,
+        method,
+        factors=F,
+        halflife=float(params.get("ewma_halflife", 12)),
+        min_obs=int(params.get("min_returns", 12)),
+    )
+    print(f"Covariance estimator: {method} (condition number {np.linalg.cond(cov):.3g})")
+    if cp is None:
+        print("⚠️  cvxpy not installed. Using equal weights.")
+        weights = mpt_fallback(R, keys)
+        out_df["weight"] = out_df["tangency_weight"] = out_df["min_variance_weight"] = weights
+        return out_df
+
+    solver = params.get("solver", "CLARABEL")
+    print(f"Building efficient frontier for {len(keys)} series with {solver}...")
+    problem = FrontierProblem(len(keys), solver=solver, max_weight=params.get("max_weight"))
+    problem.set_moments(mu, cov, risk_free)
+    targets, frontier_w = problem.sweep(int(params.get("frontier_points", 50)))
+
+    min_var = problem.min_variance()
+    tangency = problem.max_sharpe()
+    if min_var is None:
+        print("⚠️  Minimum-variance solve failed. Using equal weights.")
+        min_var = mpt_fallback(R, keys)
+    if tangency is None:
+        print("⚠️  No tangency portfolio (no asset beats the risk-free rate). Using minimum variance.")
+        tangency = min_var
+
+    out_df["tangency_weight"] = tangency
+    out_df["min_variance_weight"] = min_var
+    out_df["weight"] = tangency if params.get("choice", "tangency") == "tangency" else min_var
+
+    if params.get("frontier_file"):
+        write_table(frontier_frame(keys, targets, frontier_w, mu, cov, risk_free),
+                    params["frontier_file"], cfg)
+    return out_df
+
+
+def monthly_rates(df, dates):
+    """Per-month returns of every series over the given month dates.
+
+    Each series' returns run between its own consecutive observations; a
+    return spanning several months (the quarterly national index) is
+    spread over them at its compounded monthly rate, so the monthly rates
+    compound back to the series' own returns. Returns (keys, G x T array),
+    NaN for months outside a series' observed span.
+    """
+    keys, panel_dates, Y = to_panel(df, "price_index")
+    months = np.asarray(dates.year * 12 + dates.month)
+    panel_months = np.asarray(panel_dates.year * 12 + panel_dates.month)
+    rates = np.full((len(keys), len(dates)), np.nan)
+    for g, row in enumerate(Y):
+        observed = ~np.isnan(row)
+        m, y = panel_months[observed], row[observed]
+        span = np.maximum(np.diff(m), 1)
+        rate = (y[1:] / y[:-1]) ** (1.0 / span) - 1
+        # Month t belongs to interval k when m[k] < t <= m[k + 1]
+        k = np.searchsorted(m, months, side="left") - 1
+        inside = (k >= 0) & (k < len(rate))
+        rates[g, inside] = rate[k[inside]]
+    return keys, rates
+
+
+def factor_returns(df, dates, specs):
+    """T x k factor returns aligned with the asset return dates.
+
+    Each spec names a region and optionally a segment; without a segment
+    the factor is the equal-weight average monthly rate of the region's
+    series (see monthly_rates). Months no series of a factor covers are NaN.
+    """
+    keys, rates = monthly_rates(df, dates)
+    columns = []
+    for spec in specs:
+        rows = keys["region"] == spec["region"]
+        if spec.get("segment"):
+            rows &= keys["segment"] == spec["segment"]
+        else:
+            rows &= keys["segment"] != "all"
+        if not rows.any():
+            print(f"⚠️  No series for factor {spec}. Factor skipped.")
             continue
-        sub["ret"] = sub["price_index"].pct_change()
-        r = sub["ret"].dropna()
-        if len(r) < 12:
+        sub = rates[rows.to_numpy()]
+        counts = (~np.isnan(sub)).sum(axis=0)
+        factor = np.where(counts > 0, np.nansum(sub, axis=0) / np.maximum(counts, 1), np.nan)
+        if np.isnan(factor).all():
+            print(f"⚠️  Factor {spec} has no returns on the series' dates. Factor skipped.")
             continue
-        rets.append(r)
-        valid_segments.append(seg)
-
-    if len(rets) < 2:
-        print("⚠️  Not enough segments for portfolio optimization.")
-        weights = np.ones(len(valid_segments)) / max(1, len(valid_segments))
-    else:
-        print(f"Building portfolio from {len(valid_segments)} segments...")
-
-        # Align returns by index
-        rets_df = pd.concat(rets, axis=1, join="inner")
-        rets_df.columns = valid_segments
-
-        if rets_df.empty or len(rets_df) < 2:
-            print("⚠️  Not enough aligned return data.")
-            weights = np.ones(len(valid_segments)) / len(valid_segments)
-        else:
-            mu = rets_df.mean().values
-            cov = np.cov(rets_df.values.T)
-
-            if cp is not None:
-                print("Using cvxpy for MPT optimization...")
-                try:
-                    n = len(valid_segments)
-                    w = cp.Variable(n)
-                    target_return = mu.mean()
-
-                    objective = cp.Minimize(cp.quad_form(w, cov))
-                    constraints = [
-                        cp.sum(w) == 1,
-                        w >= 0,
-                        mu @ w >= target_return
-                    ]
-                    prob = cp.Problem(objective, constraints)
-                    prob.solve(solver=cp.SCS, verbose=False)
-
-                    weights = w.value if w.value is not None else mpt_fallback(rets_df, valid_segments)
-                except Exception as e:
-                    print(f"⚠️  cvxpy optimization failed: {e}. Using equal weights.")
-                    weights = mpt_fallback(rets_df, valid_segments)
-            else:
-                print("⚠️  cvxpy not installed. Using equal weights.")
-                weights = mpt_fallback(rets_df, valid_segments)
-
-    out_df = pd.DataFrame({
-        "segment": valid_segments,
-        "weight": weights
+        columns.append(factor)
+    return np.column_stack(columns) if columns else np.empty((len(dates), 0))
+
+
+def run_backtest(keys, dates, R, params, cfg, factors=None):
+    """Walk-forward backtest; writes period returns and weight paths"""
+    bt = params["backtest"]
+    expanding = bt.get("window_type", "rolling") == "expanding"
+    print(f"Walk-forward backtest ({'expanding' if expanding else 'rolling'} window) "
+          f"over {len(dates)} periods...")
+    res = walk_forward(
+        R,
+        window=int(bt.get("window", 36)),
+        min_window=int(bt.get("min_window", 24)),
+        every=int(bt.get("rebalance_every", 3)),
+        expanding=expanding,
+        min_obs=int(bt.get("min_obs", 12)),
+        choice=bt.get("choice", params.get("choice", "tangency")),
+        solver=params.get("solver", "CLARABEL"),
+        max_weight=params.get("max_weight"),
+        risk_free=float(params.get("risk_free", 0.0)),
+        workers=int(bt.get("workers", 1)),
+        estimator=params.get("covariance", "sample"),
+        factors=factors,
+        halflife=float(params.get("ewma_halflife", 12)),
+    )
+    if res is None:
+        print("⚠️  History shorter than the backtest window. Backtest skipped.")
+        return None
+
+    start = res["rebalance"][0]
+    period_dates = dates[start:]
+    summary = pd.DataFrame({
+        "date": period_dates,
+        "rebalance": np.isin(np.arange(start, len(dates)), res["rebalance"]),
+        "portfolio_return": res["returns"],
+        "cumulative_return": np.cumprod(1 + res["returns"]) - 1,
+        "turnover": res["turnover"],
     })
+    n = len(keys)
+    paths = keys.loc[np.tile(np.arange(n), len(period_dates))].reset_index(drop=True)
+    paths.insert(0, "date", np.repeat(period_dates, n))
+    paths["weight"] = res["weights"].ravel()
+
+    if bt.get("output_file"):
+        write_table(summary, bt["output_file"], cfg)
+    if bt.get("weights_file"):
+        write_table(paths, bt["weights_file"], cfg)
+    ann = summary["portfolio_return"].mean() * 12
+    print(f"✓ Backtest: {len(res['rebalance'])} rebalances, mean annualized return {ann:.2%}, "
+          f"mean turnover {summary.loc[summary['rebalance'], 'turnover'].mean():.2f}")
+    return summary
+
+
+def frontier_frame(keys, targets, weights, mu, cov, risk_free=0.0):
+    """Long frontier table: one row per frontier point and asset"""
+    ret, vol, sharpe = portfolio_stats(weights, mu, cov, risk_free)
+    n_points, n = weights.shape
+    out = keys.loc[np.tile(np.arange(n), n_points)].reset_index(drop=True)
+    out.insert(0, "point", np.repeat(np.arange(n_points), n))
+    out.insert(1, "target_return", np.repeat(targets, n))
+    out.insert(2, "expected_return", np.repeat(ret, n))
+    out.insert(3, "volatility", np.repeat(vol, n))
+    out.insert(4, "sharpe", np.repeat(sharpe, n))
+    out["weight"] = weights.ravel()
+    return out
 
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_df.to_csv(out_path, index=False)
+
+def main():
+    cfg = load_settings()
+    out_df = run(load_features(cfg), cfg)
+    out_path = save_output(out_df, cfg, "portfolio")
     print(f"✓ Portfolio weights saved to {out_path}")
 
 
@@ -0,0 +1,138 @@
+"""
+Real options for delaying a sale or a purchase.
+Both are American options on the property value S with a continuous
+dividend q (the rent forgone by not owning) and strike K (the price on
+the table): waiting to buy is a call, waiting to sell is a put. Two
+engines price whole batches at once:
+  lattice – Cox-Ross-Rubinstein binomial tree, vectorized over the batch
+  lsm     – Longstaff-Schwartz Monte Carlo with batched regressions
+The value of waiting is the option value minus immediate exercise.
+"""
+
+import numpy as np
+
+ENGINES = ("lattice", "lsm")
+
+
+def _batch(*arrays):
+    return [np.asarray(a, dtype=float) for a in np.broadcast_arrays(*arrays)]
+
+
+def intrinsic(S, K, kind):
+    return np.maximum(S - K, 0.0) if kind == "call" else np.maximum(K - S, 0.0)
+
+
+def binomial_american(S, K, r, q, sigma, T, kind="call", steps=200):
+    """American option values on a CRR lattice for a whole batch.
+
+    All parameters broadcast to one batch shape (annual r, q, sigma; T in
+    years). Backward induction runs once, each step vectorized across
+    the batch. Returns an array of the batch shape.
+    """
+    S, K, r, q, sigma, T = _batch(S, K, r, q, sigma, T)
+    shape = S.shape
+    S, K, r, q, sigma, T = (a.ravel() for a in (S, K, r, q, sigma, T))
+    dt = np.maximum(T, 1e-12) / steps
+    u = np.exp(np.maximum(sigma, 1e-8) * np.sqrt(dt))
+    d = 1.0 / u
+    p = np.clip((np.exp((r - q) * dt) - d) / (u - d), 0.0, 1.0)
+    disc = np.exp(-r * dt)
+
+    # Prices at step i, node j: S * u^j * d^(i-j) = S * d^i * (u/d)^j
+    j = np.arange(steps + 1)
+    log_ud = np.log(u / d)[:, None]
+    prices = S[:, None] * np.exp(np.log(d)[:, None] * steps + log_ud * j)
+    values = intrinsic(prices, K[:, None], kind)
+    for i in range(steps - 1, -1, -1):
+        prices = S[:, None] * np.exp(np.log(d)[:, None] * i + log_ud * j[: i + 1])
+        cont = disc[:, None] * (p[:, None] * values[:, 1:] + (1 - p[:, None]) * values[:, :-1])
+        values = np.maximum(cont, intrinsic(prices, K[:, None], kind))
+    return values[:, 0].reshape(shape)
+
+
+def _basis(x):
+    return np.stack([np.ones_like(x), x, x * x], axis=-1)
+
+
+def lsm_american(S, K, r, q, sigma, T, kind="call", steps=12, n_paths=20_000, rng=None,
+                 chunk_elements=20_000_000):
+    """Longstaff-Schwartz American option values for a batch (1-D arrays).
+
+    Every batch member shares the number of exercise dates (steps), so
+    group batches by horizon when step sizes should match. Antithetic GBM
+    paths are simulated in blocks of batch members bounded by
+    chunk_elements; continuation values are fitted on (1, S/K, (S/K)^2)
+    by batched least squares over in-the-money paths.
+    """
+    rng = rng or np.random.default_rng()
+    S, K, r, q, sigma, T = (a.ravel() for a in _batch(S, K, r, q, sigma, T))
+    half = max(1, n_paths // 2)
+    block = max(1, chunk_elements // (2 * half * (steps + 1)))
+    out = np.empty(len(S))
+    for b0 in range(0, len(S), block):
+        sl = slice(b0, b0 + block)
+        out[sl] = _lsm_block(S[sl], K[sl], r[sl], q[sl], sigma[sl], T[sl], kind, steps, half, rng)
+    return out
+
+
+def _lsm_block(S, K, r, q, sigma, T, kind, steps, half, rng):
+    B = len(S)
+    dt = (T / steps)[:, None, None]
+    z = rng.standard_normal((B, half, steps))
+    z = np.concatenate([z, -z], axis=1)
+    drift = (r - q - 0.5 * sigma ** 2)[:, None, None] * dt
+    log_paths = np.cumsum(drift + sigma[:, None, None] * np.sqrt(dt) * z, axis=2)
+    x = np.exp(log_paths) * (S / K)[:, None, None]  # moneyness S_t / K
+    disc = np.exp(-r * T / steps)[:, None]
+
+    def payoff(m):
+        return K[:, None] * (np.maximum(m - 1, 0.0) if kind == "call" else np.maximum(1 - m, 0.0))
+
+    value = payoff(x[:, :, -1])
+    for t in range(steps - 2, -1, -1):
+        value *= disc
+        m = x[:, :, t]
+        exercise = payoff(m)
+        itm = (exercise > 0).astype(float)
+        X = _basis(m)
+        Xw = X * itm[..., None]
+        XtX = np.swapaxes(Xw, 1, 2) @ X + 1e-10 * np.eye(3)
+        Xty = np.swapaxes(Xw, 1, 2) @ value[..., None]
+        coef = np.linalg.solve(XtX, Xty)
+        cont = (X @ coef)[..., 0]
+        value = np.where((itm > 0) & (exercise > cont), exercise, value)
+    value *= disc
+    return np.maximum(value.mean(axis=1), intrinsic(S, K, kind))
+
+
+def wait_values(S, K, r, q, sigma, horizons, engine="lattice", steps=200, steps_per_year=12,
+                n_paths=20_000, seed=None, chunk_elements=20_000_000):
+    """Option values and waiting premia for G groups x H horizons in one call.
+
+    S, K, r, q and sigma are per group (G,); horizons in years (H,).
+    Returns a dict of G x H arrays: buy_option, sell_option (American
+    call and put) and buy_wait, sell_wait (premium over acting now).
+    """
+    S, K, r, q, sigma = (np.asarray(a, dtype=float) for a in np.broadcast_arrays(S, K, r, q, sigma))
+    horizons = np.asarray(horizons, dtype=float)
+    G, H = len(S), len(horizons)
+    grid = [np.repeat(a[:, None], H, axis=1) for a in (S, K, r, q, sigma)]
+    T = np.broadcast_to(horizons[None, :], (G, H))
+
+    out = {}
+    for kind, name in (("call", "buy"), ("put", "sell")):
+        if engine == "lattice":
+            values = binomial_american(*grid, T, kind=kind, steps=steps)
+        elif engine == "lsm":
+            rng = np.random.default_rng(seed)
+            values = np.empty((G, H))
+            for h, horizon in enumerate(horizons):
+                n_steps = max(1, int(np.ceil(horizon * steps_per_year)))
+                values[:, h] = lsm_american(S, K, r, q, sigma, np.full(G, horizon), kind=kind,
+                                            steps=n_steps, n_paths=n_paths, rng=rng,
+                                            chunk_elements=chunk_elements)
+        else:
+            raise ValueError(f"Unknown real-options engine {engine!r}; expected one of {ENGINES}")
+        out[f"{name}_option"] = values
+        out[f"{name}_wait"] = np.maximum(values - intrinsic(grid[0], grid[1], kind), 0.0)
+    return out
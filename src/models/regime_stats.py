@@ -0,0 +1,99 @@
+"""
+Regime persistence statistics for all series in one pass.
+Run-length encoding, average and longest durations, empirical
+transition matrices and the time since the last switch are computed with
+array operations over the whole long regime frame.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def classify_thresholds(returns, threshold=0.01, labels=("down", "sideways", "up")):
+    """Threshold regimes: down below -threshold, up above +threshold"""
+    returns = np.asarray(returns, dtype=float)
+    codes = np.where(returns > threshold, 2, np.where(returns < -threshold, 0, 1))
+    return np.asarray(labels)[codes]
+
+
+def run_lengths(series_codes, regime_codes):
+    """Run-length encode regimes within each series.
+
+    Both arrays are aligned and sorted by series, then date. Returns
+    (run_series, run_regime, run_length, run_id per row).
+    """
+    n = len(regime_codes)
+    change = np.ones(n, dtype=bool)
+    change[1:] = (regime_codes[1:] != regime_codes[:-1]) | (series_codes[1:] != series_codes[:-1])
+    run_id = np.cumsum(change) - 1
+    starts = np.flatnonzero(change)
+    lengths = np.diff(np.append(starts, n))
+    return series_codes[starts], regime_codes[starts], lengths, run_id
+
+
+def regime_statistics(regimes_df, labels=("down", "sideways", "up"), transmat=None):
+    """Per series and regime persistence table.
+
+    regimes_df holds date, region, segment and regime rows. transmat is an
+    optional {(region, segment): K x K} map of fitted HMM transition
+    matrices, used for the model-implied expected duration 1 / (1 - p_ii).
+    Columns: region, segment, regime, n_obs, share, n_runs, mean_duration,
+    max_duration, expected_duration, to_<label> (empirical transition
+    probabilities), current_regime and periods_since_switch.
+    """
+    K = len(labels)
+    df = regimes_df.sort_values(["region", "segment", "date"])
+    grouped = df.groupby(["region", "segment"], observed=True, sort=True)
+    s = grouped.ngroup().to_numpy()
+    keys = pd.DataFrame(list(grouped.groups.keys()), columns=["region", "segment"])
+    G = len(keys)
+    r = pd.Categorical(df["regime"], categories=list(labels)).codes.astype(int)
+    known = r >= 0
+    s, r = s[known], r[known]
+
+    run_s, run_r, run_len, _ = run_lengths(s, r)
+    cell = run_s * K + run_r
+    n_runs = np.bincount(cell, minlength=G * K).reshape(G, K)
+    total_len = np.bincount(cell, weights=run_len, minlength=G * K).reshape(G, K)
+    max_len = np.zeros(G * K)
+    np.maximum.at(max_len, cell, run_len)
+    n_obs = np.bincount(s * K + r, minlength=G * K).reshape(G, K)
+
+    # Transitions between consecutive rows of the same series
+    same = s[1:] == s[:-1]
+    trans = np.zeros((G, K, K))
+    np.add.at(trans, (s[1:][same], r[:-1][same], r[1:][same]), 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        trans_prob = trans / trans.sum(axis=2, keepdims=True)
+        mean_len = total_len / n_runs
+        share = n_obs / n_obs.sum(axis=1, keepdims=True)
+
+    # Current regime is the last run of each series; its length is the time since the switch
+    last_run = np.full(G, -1)
+    np.maximum.at(last_run, run_s, np.arange(len(run_s)))
+    has_runs = last_run >= 0
+    current = np.where(has_runs, run_r[last_run], -1)
+    since = np.where(has_runs, run_len[last_run], 0)
+
+    expected = np.full((G, K), np.nan)
+    if transmat:
+        for g, key in enumerate(keys.itertuples(index=False)):
+            A = transmat.get(tuple(key))
+            if A is not None:
+                with np.errstate(divide="ignore"):
+                    expected[g] = 1.0 / (1.0 - np.diag(A))
+
+    out = keys.loc[keys.index.repeat(K)].reset_index(drop=True)
+    out["regime"] = np.tile(np.asarray(labels), G)
+    out["n_obs"] = n_obs.ravel()
+    out["share"] = share.ravel()
+    out["n_runs"] = n_runs.ravel()
+    out["mean_duration"] = mean_len.ravel()
+    out["max_duration"] = max_len.astype(int)
+    out["expected_duration"] = expected.ravel()
+    for j, label in enumerate(labels):
+        out[f"to_{label}"] = trans_prob[:, :, j].ravel()
+    labels_or_none = np.asarray([*labels, None], dtype=object)
+    out["current_regime"] = np.repeat(labels_or_none[current], K)
+    out["periods_since_switch"] = np.repeat(since, K)
+    return out
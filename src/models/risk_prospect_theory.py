@@ -1,74 +1,176 @@
 """
 Risk assessment via Prospect Theory.
-Computes downside probability, expected return, prospect value.
+Computes downside probability, expected return, prospect value and tail
+risk for every region x segment in one batched simulation.
+The expected_12m_return and downside_prob_12m columns keep their names for
+the API and dashboard but cover the configured horizon (the horizon column),
+which is 12 months by default.
 """
 
 import pandas as pd
 import numpy as np
-from pathlib import Path
 import sys
 import os
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from src import load_settings
+from src.models.common import load_features, process_pool, save_output
 
 
 def prospect_value(x, alpha=0.88, beta=0.88, lamb=2.25):
     """Kahneman-Tversky prospect value function"""
+    ax = np.abs(x)
     v = np.where(
         x >= 0,
-        x ** alpha,
-        -lamb * ((-x) ** beta)
+        ax ** alpha,
+        -lamb * (ax ** beta)
     )
     return v
 
 
-def main():
-    cfg = load_settings()
-    features_path = Path(cfg["data"]["processed_dir"]) / "features_timeseries.csv"
-    out_path = Path(cfg["models"]["risk_prospect"]["output_file"])
-
-    if not features_path.exists():
-        raise FileNotFoundError(f"Features file {features_path} not found.")
+def pad_recent_returns(df, lookback):
+    """Right-pad the last `lookback` returns of every (region, segment) group.
+
+    Returns (keys frame, padded G x L array, counts). Row g holds the
+    group's returns left-aligned, NaN beyond counts[g].
+    """
+    df = df.dropna(subset=["ret"]).sort_values(["region", "segment", "date"])
+    grouped = df.groupby(["region", "segment"], observed=True, sort=True)
+    from_end = grouped.cumcount(ascending=False).to_numpy()
+    keep = from_end < lookback
+    codes = grouped.ngroup().to_numpy()[keep]
+    counts = np.bincount(codes, minlength=grouped.ngroups)
+    cols = counts[codes] - 1 - from_end[keep]
+
+    padded = np.full((grouped.ngroups, max(1, counts.max(initial=0))), np.nan)
+    padded[codes, cols] = df["ret"].to_numpy()[keep]
+    keys = pd.DataFrame(list(grouped.groups.keys()), columns=["region", "segment"])
+    return keys, padded, counts
+
+
+def simulate_horizon_returns_batch(padded, counts, n_sims, horizon, rng, chunk_elements=10_000_000):
+    """Bootstrap n_sims cumulative horizon returns for every padded group.
+
+    Draws are masked to each group's own count, so ragged histories share
+    one array. Group and simulation blocks keep at most chunk_elements
+    (groups x sims x horizon) indices in memory at once.
+    """
+    n_groups = len(counts)
+    sims = np.empty((n_groups, n_sims))
+    per_chunk = max(1, chunk_elements // horizon)
+    group_block = max(1, per_chunk // n_sims)
+    sim_block = min(n_sims, per_chunk)
+    for g0 in range(0, n_groups, group_block):
+        g1 = min(g0 + group_block, n_groups)
+        rows = np.arange(g0, g1)[:, None, None]
+        scale = counts[g0:g1, None, None]
+        for s0 in range(0, n_sims, sim_block):
+            s1 = min(s0 + sim_block, n_sims)
+            idx = (rng.random((g1 - g0, s1 - s0, horizon)) * scale).astype(np.intp)
+            sims[g0:g1, s0:s1] = padded[rows, idx].sum(axis=2)
+    return sims
+
+
+def simulate_horizon_returns(returns, n_sims, horizon, rng, chunk_elements=10_000_000):
+    """Bootstrap n_sims cumulative horizon returns from one return series"""
+    returns = np.asarray(returns, dtype=float)
+    return simulate_horizon_returns_batch(
+        returns[None, :], np.array([len(returns)]), n_sims, horizon, rng, chunk_elements
+    )[0]
+
+
+def tail_metrics(sims, levels=(0.95,)):
+    """VaR / CVaR per row of simulated returns, reported as positive losses"""
+    sims = np.atleast_2d(sims)
+    out = {}
+    for level in levels:
+        q = np.quantile(sims, 1 - level, axis=1)
+        pct = int(round(level * 100))
+        out[f"var_{pct}"] = -q
+        out[f"cvar_{pct}"] = -np.nanmean(np.where(sims <= q[:, None], sims, np.nan), axis=1)
+    return out
+
+
+def risk_metrics(sims, levels=(0.95,)):
+    """All risk columns for a (groups x sims) matrix.
+
+    The *_12m columns are over whatever horizon the sims were drawn for.
+    """
+    return {
+        "expected_12m_return": sims.mean(axis=1),
+        "downside_prob_12m": (sims < 0).mean(axis=1),
+        "expected_prospect_value": prospect_value(sims).mean(axis=1),
+        **tail_metrics(sims, levels),
+    }
+
+
+def _risk_block(padded, counts, n_sims, horizon, seed_seq, chunk_elements, levels):
+    """Simulate and summarize one block of groups (runs in a worker process)"""
+    rng = np.random.default_rng(seed_seq)
+    sims = simulate_horizon_returns_batch(padded, counts, n_sims, horizon, rng, chunk_elements)
+    return risk_metrics(sims, levels)
+
+
+def run(df, cfg=None):
+    """Compute the risk output frame for every (region, segment) group"""
+    cfg = cfg or load_settings()
+    params = cfg["models"]["risk_prospect"]
+    n_sims = int(params.get("n_sims", 5000))
+    horizon = int(params.get("horizon", 12))
+    lookback = int(params.get("lookback", 36))
+    min_returns = int(params.get("min_returns", 12))
+    levels = params.get("tail_levels", [0.95])
+    chunk_elements = int(params.get("chunk_elements", 10_000_000))
+    block_groups = int(params.get("block_groups", 32))
+    workers = int(params.get("workers", 1))
+
+    keys, padded, counts = pad_recent_returns(df, lookback)
+    valid = counts >= min_returns
+    if (~valid).any():
+        print(f"⚠️  {(~valid).sum()} group(s) with fewer than {min_returns} returns skipped.")
+    keys, padded, counts = keys[valid].reset_index(drop=True), padded[valid], counts[valid]
+
+    if keys.empty:
+        print("⚠️  Not enough recent returns. Using synthetic risk output.")
+        tails = {f"{m}_{int(round(level * 100))}": np.nan for level in levels for m in ("var", "cvar")}
+        return pd.DataFrame({
+            "region": ["Budapest"],
+            "segment": ["panel_3szoba"],
+            "horizon": [horizon],
+            "expected_12m_return": [0.03],
+            "downside_prob_12m": [0.25],
+            "expected_prospect_value": [1.0],
+            **{k: [val] for k, val in tails.items()},
+        })
+
+    # One seed per fixed-size block keeps results independent of worker count
+    blocks = [slice(i, i + block_groups) for i in range(0, len(keys), block_groups)]
+    seeds = np.random.SeedSequence(params.get("seed")).spawn(len(blocks))
+    args = [
+        (padded[b], counts[b], n_sims, horizon, seed, chunk_elements, levels)
+        for b, seed in zip(blocks, seeds)
+    ]
+    print(f"Running {n_sims} Monte Carlo simulations for {len(keys)} groups "
+          f"in {len(blocks)} block(s)...")
+
+    if workers > 1 and len(blocks) > 1:
+        with process_pool(min(workers, len(blocks))) as pool:
+            parts = list(pool.map(_risk_block, *zip(*args)))
+    else:
+        parts = [_risk_block(*a) for a in args]
 
-    df = pd.read_csv(features_path, parse_dates=["date"])
+    metrics = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+    out_df = keys.copy()
+    out_df.insert(2, "horizon", horizon)
+    for k, v in metrics.items():
+        out_df[k] = v
+    return out_df
 
-    mask = (df["region"] == "Budapest") & (df["segment"] == "panel_3szoba")
-    df_sub = df[mask].copy().dropna(subset=["ret"])
-    df_sub = df_sub.sort_values("date")
 
-    recent = df_sub["ret"].dropna().tail(36)
-    if len(recent) < 12:
-        print("⚠️  Not enough recent returns. Using synthetic risk output.")
-        expected_ret = 0.03
-        downside_prob = 0.25
-        exp_prospect = 1.0
-    else:
-        print(f"Running 5000 Monte Carlo simulations ({len(recent)} recent returns)...")
-        sims = []
-        n_sims = 5000
-        horizon = 12
-
-        for _ in range(n_sims):
-            path = np.random.choice(recent.values, size=horizon, replace=True)
-            sims.append(path.sum())
-        sims = np.array(sims)
-
-        v = prospect_value(sims)
-        expected_ret = sims.mean()
-        downside_prob = (sims < 0).mean()
-        exp_prospect = v.mean()
-
-    out_df = pd.DataFrame({
-        "region": ["Budapest"],
-        "segment": ["panel_3szoba"],
-        "expected_12m_return": [expected_ret],
-        "downside_prob_12m": [downside_prob],
-        "expected_prospect_value": [exp_prospect],
-    })
-
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_df.to_csv(out_path, index=False)
+def main():
+    cfg = load_settings()
+    out_df = run(load_features(cfg), cfg)
+    out_path = save_output(out_df, cfg, "risk_prospect")
     print(f"✓ Risk (prospect theory) output saved to {out_path}")
 
 
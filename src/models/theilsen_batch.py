@@ -0,0 +1,106 @@
+"""
+Univariate Theil-Sen slopes for many series at once.
+Exact median of all pairwise slopes with Sen's confidence bounds, plus a
+rolling-window variant giving a time-varying slope per date.
+"""
+
+from statistics import NormalDist
+
+import numpy as np
+
+
+def _sorted_order_stats(slopes):
+    """Sort rows with NaNs last; return (sorted, count of finite values)"""
+    s = np.sort(slopes, axis=-1)
+    return s, np.isfinite(s).sum(axis=-1)
+
+
+def _take(s, idx):
+    return np.take_along_axis(s, idx[..., None], axis=-1)[..., 0]
+
+
+def _median_sorted(s, n):
+    k = np.maximum(n // 2, 1)
+    hi = _take(s, np.minimum(k, s.shape[-1] - 1))
+    lo = _take(s, k - 1)
+    med = np.where(n % 2 == 1, hi, (lo + hi) / 2)
+    return np.where(n > 0, med, np.nan)
+
+
+def pairwise_slopes(Y, t):
+    """All (y_j - y_i) / (t_j - t_i) for i < j; NaN where either point is missing"""
+    i, j = np.triu_indices(Y.shape[1], k=1)
+    dt = (t[j] - t[i]).astype(float)
+    keep = dt != 0
+    i, j, dt = i[keep], j[keep], dt[keep]
+    return (Y[:, j] - Y[:, i]) / dt
+
+
+def theilsen(Y, t, alpha=0.05, chunk_elements=20_000_000):
+    """Exact Theil-Sen slope and Sen's (1 - alpha) bounds for every row of Y.
+
+    Returns a dict of slope, lower, upper and n_obs arrays (G,).
+    """
+    Y = np.asarray(Y, dtype=float)
+    G, T_len = Y.shape
+    n_pairs = max(1, T_len * (T_len - 1) // 2)
+    block = max(1, chunk_elements // n_pairs)
+    z = NormalDist().inv_cdf(1 - alpha / 2)
+
+    out = {k: np.full(G, np.nan) for k in ("slope", "lower", "upper")}
+    n_obs = (~np.isnan(Y)).sum(axis=1)
+    for g0 in range(0, G, block):
+        g1 = min(g0 + block, G)
+        s, N = _sorted_order_stats(pairwise_slopes(Y[g0:g1], t))
+        out["slope"][g0:g1] = _median_sorted(s, N)
+
+        # Sen (1968): rank offsets from the normal approximation of Kendall's S
+        n = n_obs[g0:g1]
+        C = z * np.sqrt(n * (n - 1) * (2 * n + 5) / 18.0)
+        lo_idx = np.clip(np.round((N - C) / 2).astype(int) - 1, 0, np.maximum(N - 1, 0))
+        hi_idx = np.clip(np.round((N + C) / 2).astype(int), 0, np.maximum(N - 1, 0))
+        valid = N > 0
+        out["lower"][g0:g1] = np.where(valid, _take(s, lo_idx), np.nan)
+        out["upper"][g0:g1] = np.where(valid, _take(s, hi_idx), np.nan)
+    out["n_obs"] = n_obs
+    return out
+
+
+def rolling_theilsen(Y, t, window, min_obs=3, chunk_elements=20_000_000):
+    """Theil-Sen slope over the trailing `window` months ending at each column.
+
+    Y columns are placed on a regular monthly grid first, so the window is
+    calendar-based even when series have gaps or mixed frequencies.
+    Returns a G x T array aligned with Y (NaN where too few points).
+    """
+    Y = np.asarray(Y, dtype=float)
+    G, T_len = Y.shape
+    n_months = int(t.max()) + 1 if T_len else 0
+    if n_months < window:
+        return np.full((G, T_len), np.nan)
+
+    monthly = np.full((G, n_months), np.nan)
+    for c in range(T_len):
+        # Columns sharing a month belong to different series; keep observed values
+        col = Y[:, c]
+        monthly[:, t[c]] = np.where(np.isnan(col), monthly[:, t[c]], col)
+
+    i, j = np.triu_indices(window, k=1)
+    dt = (j - i).astype(float)
+    n_win = n_months - window + 1
+    block = max(1, chunk_elements // (n_win * len(i)))
+
+    rolled = np.full((G, n_win), np.nan)
+    for g0 in range(0, G, block):
+        g1 = min(g0 + block, G)
+        W = np.lib.stride_tricks.sliding_window_view(monthly[g0:g1], window, axis=1)
+        s, N = _sorted_order_stats((W[..., j] - W[..., i]) / dt)
+        med = _median_sorted(s, N)
+        enough = (~np.isnan(W)).sum(axis=-1) >= min_obs
+        rolled[g0:g1] = np.where(enough, med, np.nan)
+
+    end = t - (window - 1)
+    out = np.full((G, T_len), np.nan)
+    ok = end >= 0
+    out[:, ok] = rolled[:, end[ok]]
+    return out
@@ -1,6 +1,8 @@
 """
 Bayesian Hierarchical Nowcasting for trend analysis.
-Uses PyMC to model trend with shrinkage across regions.
+Uses PyMC to model trend with shrinkage across regions and segments, or an
+exact conjugate posterior per series. The method column records which
+engine produced the output.
 """
 
 import pandas as pd
@@ -11,105 +13,355 @@ import os
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from src import load_settings
+from src.models.common import load_features, save_output
+from src.models.bayes_conjugate import nig_posterior, predictive_bands
 
-try:
-    import pymc as pm
-except ImportError:
-    print("⚠️  PyMC not installed. Using fallback linear regression.")
-    pm = None
-
-
-def bayes_trend_fallback(df_sub):
-    """Fallback linear trend if PyMC not available"""
-    from sklearn.linear_model import LinearRegression
-    
-    df_sub = df_sub.sort_values("date").copy()
-    t = np.arange(len(df_sub)).reshape(-1, 1)
-    y = df_sub["price_index"].values
-    
-    model = LinearRegression()
-    model.fit(t, y)
-    mean_pred = model.predict(t)
-    
-    # Simple CI: ±1 std
-    residuals = y - mean_pred
-    std = np.std(residuals)
-    lower = mean_pred - std
-    upper = mean_pred + std
-    
-    return mean_pred, lower, upper
-
-
-def bayes_trend_pymc(df_sub):
-    """Full Bayesian hierarchical model with PyMC"""
-    df_sub = df_sub.sort_values("date").copy()
-    t = np.arange(len(df_sub))
-    y = df_sub["price_index"].values
-
-    with pm.Model() as model:
-        alpha = pm.Normal("alpha", mu=100.0, sigma=50.0)
-        beta = pm.Normal("beta", mu=0.0, sigma=5.0)
-        sigma = pm.HalfNormal("sigma", sigma=10.0)
-
-        mu = alpha + beta * t
-        obs = pm.Normal("obs", mu=mu, sigma=sigma, observed=y)
-        
-        # Sample
-        idata = pm.sample(1000, tune=1000, target_accept=0.9, return_inferencedata=True, 
-                         progressbar=True, cores=1)
-        
-        posterior_pred = pm.sample_posterior_predictive(idata)
-
-    mean_pred = posterior_pred.posterior_predictive["obs"].values.mean(axis=(0, 1))
-    lower = np.percentile(posterior_pred.posterior_predictive["obs"].values, 16, axis=(0, 1))
-    upper = np.percentile(posterior_pred.posterior_predictive["obs"].values, 84, axis=(0, 1))
-
-    return mean_pred, lower, upper
+pm = None  # imported on first use: only the pymc engine needs it
+QuadPotentialDiagAdapt = None
+
+
+def load_pymc():
+    global pm, QuadPotentialDiagAdapt
+    if pm is None:
+        try:
+            import pymc
+            from pymc.step_methods.hmc.quadpotential import QuadPotentialDiagAdapt
+            pm = pymc
+        except ImportError:
+            print("⚠️  PyMC not installed. Using conjugate engine.")
+    return pm
+
+
+def trend_design(df):
+    """Long-format arrays and index coordinates for the pooled model"""
+    df = df.dropna(subset=["price_index"]).sort_values(["region", "segment", "date"])
+    df = df.astype({"region": object, "segment": object}).reset_index(drop=True)
+    grouped = df.groupby(["region", "segment"], sort=True)
+    group_idx = grouped.ngroup().to_numpy()
+    group_keys = pd.DataFrame(list(grouped.groups.keys()), columns=["region", "segment"])
+    region_of_group, regions = pd.factorize(group_keys["region"], sort=True)
+    segment_of_group, segments = pd.factorize(group_keys["segment"], sort=True)
+
+    # Months relative to each series' own mean date: centering decorrelates
+    # intercept and slope, which NUTS needs on long histories. prior_mean's
+    # intercept is therefore the level at the series' mean date
+    months = df["date"].dt.year * 12 + df["date"].dt.month
+    t = (months - months.groupby(group_idx).transform("mean")).to_numpy(dtype=float)
+
+    return {
+        "frame": df,
+        "y": df["price_index"].to_numpy(dtype=float),
+        "t": t,
+        "group_idx": group_idx,
+        "region_of_group": region_of_group,
+        "segment_of_group": segment_of_group,
+        "coords": {
+            "region": list(regions),
+            "segment": list(segments),
+            "group": [f"{r}|{s}" for r, s in zip(group_keys["region"], group_keys["segment"])],
+            "obs_id": np.arange(len(df)),
+        },
+    }
+
+
+# Compiled models (and their NUTS steps) kept for the life of the process,
+# keyed by everything that changes the graph rather than the data. Only runs
+# in the same interpreter reuse them (pipeline.py --in-process, notebooks);
+# the default executor starts a fresh process per stage and compiles again.
+_POOLED_CACHE = {}
+
+
+def _design_data(d):
+    data = {
+        "t": d["t"],
+        "y": d["y"],
+        "group_idx": d["group_idx"],
+        "region_of_group": d["region_of_group"],
+        "segment_of_group": d["segment_of_group"],
+    }
+    return data, d["coords"]
+
+
+def build_pooled_model(d, params):
+    """Partially pooled trend over all series in one PyMC graph.
+
+    Intercepts and slopes are mu + region effect + segment effect + group
+    effect (non-centered), so thin series shrink towards their region and
+    segment. Each series has its own noise scale. All data sit in pm.Data
+    containers so new series or appended quarters can be swapped in.
+    """
+    prior_mean = params.get("prior_mean", [100.0, 0.0])
+    prior_sd = params.get("prior_sd", [50.0, 5.0])
+    data, coords = _design_data(d)
+
+    with pm.Model(coords=coords) as model:
+        t = pm.Data("t", data["t"], dims="obs_id")
+        y = pm.Data("y", data["y"], dims="obs_id")
+        g_idx = pm.Data("group_idx", data["group_idx"], dims="obs_id")
+        r_idx = pm.Data("region_of_group", data["region_of_group"], dims="group")
+        s_idx = pm.Data("segment_of_group", data["segment_of_group"], dims="group")
+
+        def pooled(name, mu, sd):
+            center = pm.Normal(f"mu_{name}", mu=mu, sigma=sd)
+            sd_region = pm.HalfNormal(f"sd_{name}_region", sigma=sd / 5)
+            sd_segment = pm.HalfNormal(f"sd_{name}_segment", sigma=sd / 5)
+            sd_group = pm.HalfNormal(f"sd_{name}_group", sigma=sd / 5)
+            z_region = pm.Normal(f"z_{name}_region", 0.0, 1.0, dims="region")
+            z_segment = pm.Normal(f"z_{name}_segment", 0.0, 1.0, dims="segment")
+            z_group = pm.Normal(f"z_{name}_group", 0.0, 1.0, dims="group")
+            return pm.Deterministic(
+                name,
+                center
+                + sd_region * z_region[r_idx]
+                + sd_segment * z_segment[s_idx]
+                + sd_group * z_group,
+                dims="group",
+            )
+
+        alpha = pooled("alpha", prior_mean[0], prior_sd[0])
+        beta = pooled("beta", prior_mean[1], prior_sd[1])
+        sigma = pm.HalfNormal("sigma", sigma=params.get("prior_sigma", 10.0), dims="group")
+
+        mu = alpha[g_idx] + beta[g_idx] * t
+        pm.Normal("obs", mu=mu, sigma=sigma[g_idx], observed=y, dims="obs_id")
+    return model
+
+
+def pooled_model(d, params):
+    """Cached compiled model with this design's data swapped in"""
+    key = (
+        tuple(params.get("prior_mean", [100.0, 0.0])),
+        tuple(params.get("prior_sd", [50.0, 5.0])),
+        params.get("prior_sigma", 10.0),
+    )
+    entry = _POOLED_CACHE.get(key)
+    if entry is None:
+        entry = {"model": build_pooled_model(d, params), "step": None, "sizes": None}
+        _POOLED_CACHE[key] = entry
+    else:
+        data, coords = _design_data(d)
+        pm.set_data(data, model=entry["model"], coords=coords)
+    return entry
+
+
+def _value_sizes(model):
+    point = model.initial_point()
+    return {v.name: int(np.size(point[v.name])) for v in model.continuous_value_vars}
+
+
+def load_warm_state(path, model):
+    """Stored sampler state, or None if missing or for a different shape"""
+    if not path or not Path(path).exists():
+        return None
+    state = np.load(path, allow_pickle=False)
+    sizes = _value_sizes(model)
+    if list(state["value_names"]) != list(sizes) or list(state["value_sizes"]) != list(sizes.values()):
+        print("⚠️  Stored Bayes sampler state does not match the model shape. Cold start.")
+        return None
+    return {k: state[k] for k in state.files}
+
+
+def save_warm_state(path, model, idata):
+    """Persist step size, diagonal mass matrix and posterior-mean start point"""
+    post = idata.posterior
+    sizes = _value_sizes(model)
+    flat = [post[name].values.reshape(-1, size) for name, size in sizes.items()]
+    unconstrained = np.concatenate(flat, axis=1)
+    arrays = {
+        "value_names": np.array(list(sizes)),
+        "value_sizes": np.array(list(sizes.values())),
+        "step_size": np.array(float(idata.sample_stats["step_size"].values[:, -1].mean())),
+        "mass_mean": unconstrained.mean(axis=0),
+        "mass_diag": unconstrained.var(axis=0) + 1e-8,
+    }
+    for rv in model.free_RVs:
+        arrays[f"init__{rv.name}"] = post[rv.name].values.mean(axis=(0, 1))
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        np.savez(f, **arrays)
+
+
+def _nuts_step(model, params, state):
+    """NUTS step, seeded with the stored step size and mass matrix when warm"""
+    target_accept = float(params.get("target_accept", 0.9))
+    if state is None:
+        return pm.NUTS(model=model, target_accept=target_accept)
+    n = int(state["value_sizes"].sum())
+    potential = QuadPotentialDiagAdapt(
+        n, state["mass_mean"], state["mass_diag"], int(params.get("warm_mass_weight", 50))
+    )
+    return pm.NUTS(
+        model=model,
+        target_accept=target_accept,
+        potential=potential,
+        step_scale=float(state["step_size"]) * n ** 0.25,
+    )
+
+
+def band_quantiles(params):
+    return [float(q) for q in params.get("band_quantiles", [0.16, 0.84])]
+
+
+def band_column(q):
+    """Output column of a predictive quantile, e.g. 0.16 -> bayes_trend_p16"""
+    return f"bayes_trend_p{q * 100:g}".replace(".", "_")
+
+
+def predictive_summary(posterior, group_idx, t, quantiles, chunk_elements=5_000_000, seed=None):
+    """Posterior predictive mean and quantiles per observation, block by block.
+
+    Predictive draws are generated from the alpha, beta and sigma draws for
+    one block of observations at a time and reduced to exact quantiles
+    right away, so memory stays at chunk_elements values instead of
+    chains x draws x observations. Predictive draws are taken directly from
+    the posterior parameters: pm.sample_posterior_predictive leaves the
+    cached model unusable for building later NUTS steps.
+    Returns (mean (n,), {q: (n,)}).
+    """
+    alpha = posterior["alpha"].values.reshape(-1, posterior["alpha"].shape[-1])
+    beta = posterior["beta"].values.reshape(alpha.shape)
+    sigma = posterior["sigma"].values.reshape(alpha.shape)
+    n_samples, n = len(alpha), len(t)
+    block = max(1, chunk_elements // n_samples)
+    rng = np.random.default_rng(seed)
+
+    mean = np.empty(n)
+    bands = {q: np.empty(n) for q in quantiles}
+    for o0 in range(0, n, block):
+        o1 = min(o0 + block, n)
+        g = group_idx[o0:o1]
+        draws = alpha[:, g] + beta[:, g] * t[o0:o1]
+        draws += sigma[:, g] * rng.standard_normal(draws.shape)
+        mean[o0:o1] = draws.mean(axis=0)
+        if quantiles:
+            for q, row in zip(quantiles, np.quantile(draws, quantiles, axis=0)):
+                bands[q][o0:o1] = row
+    return mean, bands
+
+
+def bayes_trend_pymc(df, params, state_path=None):
+    """Sample the pooled model, warm-starting from a stored state if possible"""
+    d = trend_design(df)
+    chains = int(params.get("chains", 4))
+    cores = min(chains, int(params.get("cores", os.cpu_count() or 1)))
+
+    entry = pooled_model(d, params)
+    model = entry["model"]
+    state = load_warm_state(state_path, model) if params.get("warm_start", True) else None
+    sizes = _value_sizes(model)
+
+    if state is not None:
+        step = _nuts_step(model, params, state)
+        tune = int(params.get("warm_tune", 200))
+        initvals = {k[len("init__"):]: v for k, v in state.items() if k.startswith("init__")}
+    elif entry["step"] is not None and entry["sizes"] == sizes:
+        # Same free-variable layout: the compiled sampler is reused as is
+        step, tune, initvals = entry["step"], int(params.get("tune", 1000)), None
+    else:
+        step, tune, initvals = _nuts_step(model, params, None), int(params.get("tune", 1000)), None
+    entry["step"], entry["sizes"] = step, sizes
+
+    print(f"Sampling pooled model: {len(d['coords']['group'])} series, "
+          f"{chains} chains on {cores} cores, {tune} tuning steps"
+          f"{' (warm start)' if state is not None else ''}...")
+    with model:
+        idata = pm.sample(
+            int(params.get("draws", 1000)),
+            tune=tune,
+            step=step,
+            initvals=initvals,
+            chains=chains,
+            cores=cores,
+            # Forked chain workers would inherit the in-process runner's threads
+            mp_ctx="spawn",
+            random_seed=params.get("seed"),
+            return_inferencedata=True,
+            idata_kwargs={"include_transformed": True},
+            progressbar=False,
+        )
+    if state_path:
+        save_warm_state(state_path, model, idata)
+
+    out_df = d["frame"][["date", "region", "segment"]].copy()
+    mean, bands = predictive_summary(
+        idata.posterior,
+        d["group_idx"],
+        d["t"],
+        band_quantiles(params),
+        chunk_elements=int(params.get("chunk_elements", 5_000_000)),
+        seed=params.get("seed"),
+    )
+    out_df["bayes_trend_mean"] = mean
+    for q, values in bands.items():
+        out_df[band_column(q)] = values
+    out_df["method"] = "pymc"
+    return out_df
+
+
+def bayes_trend_conjugate(df, params):
+    """Exact Normal-Inverse-Gamma trend for every series at once.
+
+    Uses the pooled model's rows and centred time axis, so the priors mean
+    the same in both engines and duplicate dates stay separate observations.
+    """
+    d = trend_design(df)
+    g = d["group_idx"]
+    pos = d["frame"].groupby(g).cumcount().to_numpy()
+    # Each series' rows side by side, NaN-padded to the longest series
+    shape = (len(d["coords"]["group"]), pos.max() + 1 if len(pos) else 0)
+    Y = np.full(shape, np.nan)
+    t = np.zeros(shape)
+    Y[g, pos] = d["y"]
+    t[g, pos] = d["t"]
+
+    print(f"Computing conjugate Bayes trend for {shape[0]} series...")
+    post = nig_posterior(
+        Y,
+        t,
+        prior_mean=params.get("prior_mean", [100.0, 0.0]),
+        prior_sd=params.get("prior_sd", [50.0, 5.0]),
+        prior_sigma=params.get("prior_sigma", 10.0),
+    )
+    mean, bands = predictive_bands(post, t, quantiles=band_quantiles(params))
+    out_df = d["frame"][["date", "region", "segment"]].copy()
+    out_df["bayes_trend_mean"] = mean[g, pos]
+    for q, values in bands.items():
+        out_df[band_column(q)] = values[g, pos]
+    out_df["method"] = "conjugate"
+    return out_df
+
+
+def sampler_failed(error):
+    """True for errors raised by NUTS itself (e.g. bad initial energy), not by bugs"""
+    from pymc.exceptions import SamplingError
+    from pymc.sampling.parallel import ParallelSamplingError
+
+    if isinstance(error, ParallelSamplingError):
+        # Raised from the worker's own error
+        error = error.__cause__
+    return isinstance(error, SamplingError)
+
+
+def run(df, cfg=None):
+    """Compute the Bayes trend output frame for every series"""
+    cfg = cfg or load_settings()
+    params = cfg["models"]["trend_bayes"]
+    if params.get("engine", "conjugate") == "pymc" and load_pymc() is not None:
+        try:
+            return bayes_trend_pymc(df, params, state_path=params.get("state_file"))
+        except ImportError as e:
+            print(f"⚠️  PyMC dependency missing: {e}. Using conjugate engine.")
+        except Exception as e:
+            if not sampler_failed(e):
+                raise
+            print(f"⚠️  PyMC sampling failed: {e}. Using conjugate engine.")
+    return bayes_trend_conjugate(df, params)
 
 
 def main():
     cfg = load_settings()
-    features_path = Path(cfg["data"]["processed_dir"]) / "features_timeseries.csv"
-    out_path = Path(cfg["models"]["trend_bayes"]["output_file"])
-
-    if not features_path.exists():
-        raise FileNotFoundError(f"Features file {features_path} not found.")
-
-    df = pd.read_csv(features_path, parse_dates=["date"])
-    
-    # Filter: Budapest panel_3szoba for demonstration
-    mask = (df["region"] == "Budapest") & (df["segment"] == "panel_3szoba")
-    df_sub = df[mask].copy().dropna(subset=["price_index"])
-
-    if df_sub.empty:
-        print("⚠️  No data for Budapest panel_3szoba. Creating synthetic output.")
-        out_df = pd.DataFrame({
-            "date": pd.date_range("2020-01-01", "2025-12-01", freq="MS"),
-            "region": "Budapest",
-            "segment": "panel_3szoba",
-            "bayes_trend_mean": 100.0,
-            "bayes_trend_p16": 95.0,
-            "bayes_trend_p84": 105.0,
-        })
-    else:
-        print(f"Training Bayes hierarchical model on {len(df_sub)} samples...")
-        
-        if pm is not None:
-            try:
-                mean_pred, lower, upper = bayes_trend_pymc(df_sub)
-            except Exception as e:
-                print(f"⚠️  PyMC sampling failed: {e}. Using fallback.")
-                mean_pred, lower, upper = bayes_trend_fallback(df_sub)
-        else:
-            mean_pred, lower, upper = bayes_trend_fallback(df_sub)
-
-        out_df = df_sub[["date", "region", "segment"]].copy()
-        out_df["bayes_trend_mean"] = mean_pred
-        out_df["bayes_trend_p16"] = lower
-        out_df["bayes_trend_p84"] = upper
-
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_df.to_csv(out_path, index=False)
+    out_df = run(load_features(cfg), cfg)
+    out_path = save_output(out_df, cfg, "trend_bayes")
     print(f"✓ Bayes trend output saved to {out_path}")
 
 
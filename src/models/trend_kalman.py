@@ -1,85 +1,109 @@
 """
 Kalman Filter + Theil-Sen robust trend.
-Filters noise and computes robust slope.
+Filters and smooths every region x segment series in one batched pass
+and computes a robust slope (per month) with confidence bounds per series.
 """
 
-import pandas as pd
 import numpy as np
-from pathlib import Path
 import sys
 import os
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from src import load_settings
-
-try:
-    from pykalman import KalmanFilter
-except ImportError:
-    KalmanFilter = None
-
-try:
-    from sklearn.linear_model import TheilSenRegressor
-except ImportError:
-    TheilSenRegressor = None
+from src.models.common import load_features, save_output, to_panel, from_panel, month_index
+from src.models.kalman_batch import estimate_noise, kalman_filter
+from src.models.theilsen_batch import rolling_theilsen, theilsen
+from src.storage.tables import read_table, table_path, write_table
+
+
+def fit_noise(keys, Y, cfg):
+    """Per-series ML noise variances, warm-started from the stored params table"""
+    params = cfg["models"]["trend_kalman"]
+    model = params.get("model", "local_level")
+    params_path = params.get("params_file")
+    n_ratios = 2 if model == "local_linear_trend" else 1
+
+    fitted = keys.copy()
+    fitted["model"] = model
+    fitted["observation_variance"] = float(params.get("observation_variance", 1.0))
+    fitted["level_variance"] = float(params.get("level_variance", 0.1))
+    fitted["slope_variance"] = float(params.get("slope_variance", 0.01)) if n_ratios == 2 else 0.0
+    fitted["loglik"] = np.nan
+    fitted["estimated"] = False
+
+    enough = (~np.isnan(Y)).sum(axis=1) >= int(params.get("min_obs_estimate", 8))
+    init = np.full((len(keys), n_ratios), np.nan)
+    if params.get("warm_start", True) and params_path and table_path(params_path, cfg).exists():
+        prev = read_table(params_path, cfg)
+        prev = prev[(prev["model"] == model) & prev["estimated"].astype(bool)]
+        prev = keys.merge(prev.astype({"region": object, "segment": object}),
+                          on=["region", "segment"], how="left")
+        obs = prev["observation_variance"].to_numpy(dtype=float)
+        init[:, 0] = np.log(prev["level_variance"].to_numpy(dtype=float) / obs)
+        if n_ratios == 2:
+            init[:, 1] = np.log(prev["slope_variance"].to_numpy(dtype=float) / obs)
+    warm = enough & np.isfinite(init).all(axis=1)
+    cold = enough & ~warm
+
+    print(f"Estimating noise variances by ML: {warm.sum()} warm-started, {cold.sum()} cold...")
+    for subset, start in ((warm, init[warm]), (cold, None)):
+        if not subset.any():
+            continue
+        est = estimate_noise(Y[subset], model=model, init_log_ratios=start)
+        fitted.loc[subset, "observation_variance"] = est["obs_var"]
+        fitted.loc[subset, "level_variance"] = est["level_var"]
+        fitted.loc[subset, "slope_variance"] = est["slope_var"]
+        fitted.loc[subset, "loglik"] = est["loglik"]
+        fitted.loc[subset, "estimated"] = True
+
+    if params_path:
+        write_table(fitted, params_path, cfg)
+    return fitted
+
+
+def run(df, cfg=None):
+    """Compute the Kalman + Theil-Sen output frame for every series"""
+    cfg = cfg or load_settings()
+    params = cfg["models"]["trend_kalman"]
+    model = params.get("model", "local_level")
+
+    keys, dates, Y = to_panel(df, "price_index")
+    if params.get("estimate_noise", False):
+        noise = fit_noise(keys, Y, cfg)
+        obs_var = noise["observation_variance"].to_numpy()
+        level_var = noise["level_variance"].to_numpy()
+        slope_var = noise["slope_variance"].to_numpy()
+    else:
+        obs_var = params.get("observation_variance", 1.0)
+        level_var = params.get("level_variance", 0.1)
+        slope_var = params.get("slope_variance", 0.01)
+
+    print(f"Applying Kalman filter + RTS smoother to {len(keys)} series...")
+    res = kalman_filter(Y, obs_var=obs_var, level_var=level_var, slope_var=slope_var, model=model)
+
+    print("Computing Theil-Sen slopes...")
+    t = month_index(dates)
+    ts = theilsen(Y, t, alpha=params.get("theilsen_alpha", 0.05))
+    columns = {
+        "kalman_trend": res["filtered_mean"][:, :, 0],
+        "kalman_trend_var": res["filtered_var"][:, :, 0, 0],
+        "kalman_smoothed": res["smoothed_mean"][:, :, 0],
+        "kalman_smoothed_var": res["smoothed_var"][:, :, 0, 0],
+        "theilsen_slope": ts["slope"],
+        "theilsen_lower": ts["lower"],
+        "theilsen_upper": ts["upper"],
+    }
+    window = params.get("theilsen_window")
+    if window:
+        columns["theilsen_rolling_slope"] = rolling_theilsen(Y, t, int(window))
+
+    return from_panel(keys, dates, columns, mask=~np.isnan(Y))
 
 
 def main():
     cfg = load_settings()
-    features_path = Path(cfg["data"]["processed_dir"]) / "features_timeseries.csv"
-    out_path = Path(cfg["models"]["trend_kalman"]["output_file"])
-
-    if not features_path.exists():
-        raise FileNotFoundError(f"Features file {features_path} not found.")
-
-    df = pd.read_csv(features_path, parse_dates=["date"])
-
-    mask = (df["region"] == "Budapest") & (df["segment"] == "panel_3szoba")
-    df_sub = df[mask].copy().dropna(subset=["price_index"])
-    df_sub = df_sub.sort_values("date")
-
-    y = df_sub["price_index"].values
-
-    # Kalman filter
-    if KalmanFilter is not None:
-        print("Applying Kalman filter...")
-        try:
-            kf = KalmanFilter(
-                transition_matrices=[1],
-                observation_matrices=[1],
-                initial_state_mean=y[0],
-                initial_state_covariance=1,
-                observation_covariance=1,
-                transition_covariance=0.1,
-            )
-            state_means, _ = kf.filter(y)
-        except Exception as e:
-            print(f"⚠️  Kalman fit failed: {e}. Using raw data.")
-            state_means = y
-    else:
-        print("⚠️  pykalman not installed. Using raw data.")
-        state_means = y
-
-    # Theil-Sen robust slope
-    if TheilSenRegressor is not None:
-        print("Computing Theil-Sen slope...")
-        try:
-            t = np.arange(len(y)).reshape(-1, 1)
-            ts_model = TheilSenRegressor()
-            ts_model.fit(t, y)
-            slope = ts_model.coef_[0]
-        except Exception as e:
-            print(f"⚠️  Theil-Sen fit failed: {e}. Using OLS.")
-            slope = np.polyfit(np.arange(len(y)), y, 1)[0]
-    else:
-        print("⚠️  sklearn not installed. Using OLS.")
-        slope = np.polyfit(np.arange(len(y)), y, 1)[0]
-
-    out_df = df_sub[["date", "region", "segment"]].copy()
-    out_df["kalman_trend"] = state_means
-    out_df["theilsen_slope"] = slope
-
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_df.to_csv(out_path, index=False)
+    out_df = run(load_features(cfg), cfg)
+    out_path = save_output(out_df, cfg, "trend_kalman")
     print(f"✓ Kalman + Theil-Sen output saved to {out_path}")
 
 
@@ -1,16 +1,29 @@
 """
 Markov-Switching regime detection.
 Identifies states: up, sideways, down.
+Every region x segment series gets a 3-state Gaussian HMM fitted from
+several random restarts (run in parallel processes); the best
+log-likelihood wins and its parameters are stored for warm starts.
+In online mode new returns only update a stored forward-filter state;
+series whose already-filtered history was revised are refitted.
+Probabilities are forward-filtered on both paths, so a row's regime only
+depends on returns up to its date.
+Regime persistence statistics are stored next to the output.
 """
 
+import hashlib
+import logging
 import pandas as pd
 import numpy as np
-from pathlib import Path
 import sys
 import os
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from src import load_settings
+from src.models.common import load_features, process_pool, save_output, to_panel
+from src.models.hmm_online import forward_filter
+from src.models.regime_stats import classify_thresholds, regime_statistics
+from src.storage.tables import read_table, table_path, write_table
 
 try:
     from hmmlearn.hmm import GaussianHMM
@@ -18,69 +31,338 @@ except ImportError:
     print("⚠️  hmmlearn not installed. Using fallback classification.")
     GaussianHMM = None
 
+# Non-monotone EM steps near convergence are expected across many restarts
+logging.getLogger("hmmlearn").setLevel(logging.ERROR)
 
-def markov_fallback(returns):
+REGIMES = ("down", "sideways", "up")  # states ordered by mean return
+N_STATES = len(REGIMES)
+
+
+def markov_fallback(returns, threshold=0.01):
     """Fallback: classify based on simple thresholds"""
-    regimes = []
-    for ret in returns:
-        if ret > 0.01:
-            regimes.append("up")
-        elif ret < -0.01:
-            regimes.append("down")
-        else:
-            regimes.append("sideways")
-    return regimes
+    return classify_thresholds(returns, threshold, REGIMES)
 
 
-def main():
-    cfg = load_settings()
-    features_path = Path(cfg["data"]["processed_dir"]) / "features_timeseries.csv"
-    out_path = Path(cfg["models"]["trend_markov"]["output_file"])
-
-    if not features_path.exists():
-        raise FileNotFoundError(f"Features file {features_path} not found.")
-
-    df = pd.read_csv(features_path, parse_dates=["date"])
-
-    # Filter
-    mask = (df["region"] == "Budapest") & (df["segment"] == "panel_3szoba")
-    df_sub = df[mask].copy().dropna(subset=["price_index"])
-    df_sub = df_sub.sort_values("date")
-
-    df_sub["ret"] = df_sub["price_index"].pct_change()
-    returns = df_sub["ret"].dropna().values
-
-    if len(returns) < 3:
-        print("⚠️  Not enough returns data. Using synthetic regimes.")
-        regimes = ["sideways"] * len(returns)
-    elif GaussianHMM is not None:
-        print(f"Training Markov-Switching HMM on {len(returns)} returns...")
-        try:
-            X = returns.reshape(-1, 1)
-            model = GaussianHMM(n_components=3, covariance_type="diag", n_iter=100)
-            model.fit(X)
-            states = model.predict(X)
-
-            # Map to regime names
-            means = [returns[states == i].mean() if (states == i).sum() > 0 else 0 for i in range(3)]
-            order = np.argsort(means)
-            regime_map = {order[0]: "down", order[1]: "sideways", order[2]: "up"}
-            regimes = [regime_map[s] for s in states]
-        except Exception as e:
-            print(f"⚠️  HMM fit failed: {e}. Using fallback.")
-            regimes = markov_fallback(returns)
+def series_returns(df):
+    """Simple returns between consecutive observations of every series.
+
+    Returns (keys frame, list of date indexes, list of return arrays).
+    """
+    keys, dates, Y = to_panel(df, "price_index")
+    all_dates, all_returns = [], []
+    for row in Y:
+        observed = ~np.isnan(row)
+        y = row[observed]
+        all_dates.append(dates[observed][1:])
+        all_returns.append(y[1:] / y[:-1] - 1)
+    return keys, all_dates, all_returns
+
+
+def _new_hmm(n_iter, tol, random_state, warm=None):
+    model = GaussianHMM(
+        n_components=N_STATES,
+        covariance_type="diag",
+        n_iter=n_iter,
+        tol=tol,
+        random_state=random_state,
+        init_params="" if warm else "stmc",
+    )
+    if warm:
+        model.startprob_ = warm["startprob"]
+        model.transmat_ = warm["transmat"]
+        model.means_ = warm["means"][:, None]
+        model.covars_ = warm["vars"][:, None]
+    return model
+
+
+def _canonical(model):
+    """Parameters with states sorted by mean return (down, sideways, up)"""
+    order = np.argsort(model.means_[:, 0])
+    return {
+        "startprob": model.startprob_[order],
+        "transmat": model.transmat_[np.ix_(order, order)],
+        "means": model.means_[order, 0],
+        "vars": np.diagonal(model.covars_, axis1=1, axis2=2)[order, 0],
+    }
+
+
+def _fit_restart(returns, n_iter, tol, random_state, warm=None):
+    """One EM run (in a worker process); returns (loglik, params) or (-inf, None)"""
+    X = returns.reshape(-1, 1)
+    try:
+        model = _new_hmm(n_iter, tol, random_state, warm)
+        model.fit(X)
+        score = model.score(X)
+    except Exception:
+        return -np.inf, None
+    if not np.isfinite(score):
+        return -np.inf, None
+    return score, _canonical(model)
+
+
+def params_frame(keys, fitted):
+    """Long table of fitted parameters: one row per series and state"""
+    rows = []
+    for (region, segment), par in zip(keys.itertuples(index=False), fitted):
+        if par is None:
+            continue
+        for s in range(N_STATES):
+            row = {
+                "region": region,
+                "segment": segment,
+                "state": REGIMES[s],
+                "startprob": par["startprob"][s],
+                "mean": par["means"][s],
+                "var": par["vars"][s],
+                "loglik": par["loglik"],
+                "n_obs": par["n_obs"],
+            }
+            row.update({f"to_{r}": par["transmat"][s, j] for j, r in enumerate(REGIMES)})
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def load_fitted_params(keys, path, cfg):
+    """Stored parameters per series (None where missing or malformed)"""
+    fitted = [None] * len(keys)
+    if not path or not table_path(path, cfg).exists():
+        return fitted
+    prev = read_table(path, cfg)
+    prev = prev.astype({"region": object, "segment": object, "state": object})
+    by_key = {k: g.set_index("state") for k, g in prev.groupby(["region", "segment"])}
+    trans_cols = [f"to_{r}" for r in REGIMES]
+    for i, key in enumerate(keys.itertuples(index=False)):
+        g = by_key.get(tuple(key))
+        if g is None or sorted(g.index) != sorted(REGIMES):
+            continue
+        g = g.loc[list(REGIMES)]
+        transmat = g[trans_cols].to_numpy(dtype=float) + 1e-6
+        startprob = g["startprob"].to_numpy(dtype=float) + 1e-6
+        fitted[i] = {
+            "startprob": startprob / startprob.sum(),
+            "transmat": transmat / transmat.sum(axis=1, keepdims=True),
+            "means": g["mean"].to_numpy(dtype=float),
+            "vars": np.maximum(g["var"].to_numpy(dtype=float), 1e-10),
+            "loglik": float(g["loglik"].iloc[0]),
+            "n_obs": int(g["n_obs"].iloc[0]) if "n_obs" in g else 0,
+        }
+    return fitted
+
+
+def fit_all(keys, returns, cfg, subset, warm):
+    """Best-of-restarts HMM for the series in subset; restarts share one pool"""
+    params = cfg["models"]["trend_markov"]
+    n_restarts = int(params.get("n_restarts", 8))
+    warm_restarts = int(params.get("warm_restarts", 2))
+    n_iter = int(params.get("n_iter", 100))
+    tol = float(params.get("tol", 1e-4))
+    workers = int(params.get("workers", 1))
+
+    # One seed per series keeps results independent of worker count
+    seeds = np.random.SeedSequence(params.get("seed")).spawn(len(keys))
+
+    tasks, owners = [], []
+    for i in np.flatnonzero(subset):
+        start = warm[i] if params.get("warm_start", True) else None
+        starts = [None] * (warm_restarts if start is not None else n_restarts)
+        if start is not None:
+            starts.insert(0, start)
+        for start, state in zip(starts, seeds[i].generate_state(len(starts))):
+            tasks.append((returns[i], n_iter, tol, int(state), start))
+            owners.append(i)
+
+    n_warm = sum(1 for i in set(owners) if tasks[owners.index(i)][4] is not None)
+    print(f"Fitting {len(tasks)} HMM restarts for {len(set(owners))} series "
+          f"({n_warm} warm-started)...")
+    if workers > 1 and len(tasks) > 1:
+        with process_pool(min(workers, len(tasks))) as pool:
+            results = list(pool.map(_fit_restart, *zip(*tasks), chunksize=max(1, len(tasks) // (4 * workers))))
     else:
-        regimes = markov_fallback(returns)
+        results = [_fit_restart(*t) for t in tasks]
+
+    best = [None] * len(keys)
+    for i, (score, par) in zip(owners, results):
+        if par is not None and (best[i] is None or score > best[i]["loglik"]):
+            best[i] = {**par, "loglik": score, "n_obs": len(returns[i])}
+    return best
+
+
+def _padded(arrays):
+    """Stack ragged 1-D arrays into a NaN-padded matrix"""
+    out = np.full((len(arrays), max((len(a) for a in arrays), default=0)), np.nan)
+    for i, a in enumerate(arrays):
+        out[i, :len(a)] = a
+    return out
 
-    out_df = pd.DataFrame({
-        "date": df_sub["date"].iloc[1:].values,
-        "region": "Budapest",
-        "segment": "panel_3szoba",
-        "regime": regimes
-    })
 
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_df.to_csv(out_path, index=False)
+def _filter(returns, fitted, prob0=None):
+    """Forward filter a list of series, each under its own fitted parameters"""
+    return forward_filter(
+        _padded(returns),
+        np.stack([f["startprob"] for f in fitted]),
+        np.stack([f["transmat"] for f in fitted]),
+        np.stack([f["means"] for f in fitted]),
+        np.stack([f["vars"] for f in fitted]),
+        prob0=prob0,
+    )
+
+
+def history_hash(dates, returns):
+    """Fingerprint of a series' returns and their dates, to detect revisions"""
+    h = hashlib.sha256(np.asarray(dates, dtype="datetime64[ns]").view("int64").tobytes())
+    h.update(np.round(np.asarray(returns, dtype=float), 12).tobytes())
+    return h.hexdigest()
+
+
+def load_filter_state(keys, path, cfg):
+    """Last forward-filter state per series, aligned with keys"""
+    state = keys.copy()
+    state["last_date"] = pd.NaT
+    for name in REGIMES:
+        state[f"prob_{name}"] = np.nan
+    state["n_new"] = 0
+    state["new_loglik"] = 0.0
+    state["history_hash"] = None
+    if path and table_path(path, cfg).exists():
+        prev = read_table(path, cfg).astype({"region": object, "segment": object})
+        state = keys.merge(prev, on=["region", "segment"], how="left")
+        state["n_new"] = state["n_new"].fillna(0).astype(int)
+        state["new_loglik"] = state["new_loglik"].fillna(0.0)
+        if "history_hash" not in state:
+            state["history_hash"] = None
+        state["history_hash"] = state["history_hash"].astype(object)
+    return state
+
+
+def _needs_refit(state, fitted, params):
+    """Refit on schedule, or when new returns fit much worse than the history did"""
+    refit_every = int(params.get("refit_every", 12))
+    drift_min_obs = int(params.get("drift_min_obs", 3))
+    tolerance = float(params.get("drift_tolerance", 1.0))
+    n_new = state["n_new"].to_numpy()
+    fit_rate = np.array([f["loglik"] / max(f["n_obs"], 1) if f else np.nan for f in fitted])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        new_rate = state["new_loglik"].to_numpy() / n_new
+    drift = (n_new >= drift_min_obs) & (new_rate < fit_rate - tolerance)
+    return (n_new >= refit_every) | drift, drift
+
+
+def _frame(region, segment, dates, probs, regimes=None):
+    if regimes is None:
+        regimes = np.asarray(REGIMES)[probs.argmax(axis=1)]
+    part = pd.DataFrame({"date": dates, "region": region, "segment": segment, "regime": regimes})
+    for j, name in enumerate(REGIMES):
+        part[f"prob_{name}"] = probs[:, j]
+    return part
+
+
+def run(df, cfg=None):
+    """Compute regime labels and state probabilities for every series.
+
+    In online mode, series with stored parameters and filter state only
+    run the forward filter over their new returns; the HMM is refitted on
+    a schedule (refit_every new returns), when the new returns' average
+    log-likelihood drops drift_tolerance below that of the fitted history,
+    or when the returns already filtered no longer match their stored hash.
+    """
+    cfg = cfg or load_settings()
+    params = cfg["models"]["trend_markov"]
+    keys, dates, returns = series_returns(df)
+    G = len(keys)
+    min_returns = int(params.get("min_returns", 12))
+    eligible = np.array([len(r) >= min_returns for r in returns]) & (GaussianHMM is not None)
+
+    stored = load_fitted_params(keys, params.get("params_file"), cfg)
+    state = load_filter_state(keys, params.get("filter_file"), cfg)
+    prob_cols = [f"prob_{r}" for r in REGIMES]
+
+    # Online update: forward-filter the returns after each series' last filtered date
+    updated = np.zeros(G, dtype=bool)
+    out_path = table_path(cfg["models"]["trend_markov"]["output_file"], cfg)
+    if params.get("mode", "refit") == "online" and out_path.exists():
+        previous = read_table(out_path, cfg).astype({"region": object, "segment": object})
+        have_state = state[prob_cols].notna().all(axis=1).to_numpy()
+        candidates = np.flatnonzero(eligible & have_state & np.array([f is not None for f in stored]))
+        # Revised history invalidates both the stored rows and the filter state
+        seen = [dates[i] <= state["last_date"].iloc[i] for i in candidates]
+        revised = np.array([history_hash(dates[i][m], returns[i][m]) != state["history_hash"].iloc[i]
+                            for i, m in zip(candidates, seen)], dtype=bool)
+        candidates = candidates[~revised]
+        if revised.any():
+            print(f"Online regime update: {revised.sum()} series with revised history will be refitted")
+        if len(candidates):
+            new = [returns[i][dates[i] > state["last_date"].iloc[i]] for i in candidates]
+            res = _filter(new, [stored[i] for i in candidates],
+                          prob0=state.loc[candidates, prob_cols].to_numpy(dtype=float))
+            state.loc[candidates, "n_new"] += res["n_obs"]
+            state.loc[candidates, "new_loglik"] += res["loglik"]
+            state.loc[candidates, prob_cols] = res["last"]
+            updated[candidates] = True
+            new_parts = {i: (dates[i][dates[i] > state["last_date"].iloc[i]], res["filtered"][k])
+                         for k, i in enumerate(candidates)}
+            refit, drift = _needs_refit(state, stored, params)
+            updated &= ~refit
+            print(f"Online regime update: {updated.sum()} series filtered, "
+                  f"{(refit & ~drift)[candidates].sum()} scheduled and "
+                  f"{drift[candidates].sum()} drift refit(s)")
+
+    to_fit = eligible & ~updated
+    fitted = list(stored)
+    if to_fit.any():
+        fits = fit_all(keys, returns, cfg, to_fit, stored)
+        for i in np.flatnonzero(to_fit):
+            fitted[i] = fits[i]
+    if params.get("params_file"):
+        write_table(params_frame(keys, fitted), params.get("params_file"), cfg)
+
+    # Fresh fits restart their filter from the beginning of the history
+    refitted = np.flatnonzero(to_fit & np.array([f is not None for f in fitted]))
+    refit_probs = {}
+    if len(refitted):
+        res = _filter([returns[i] for i in refitted], [fitted[i] for i in refitted])
+        state.loc[refitted, prob_cols] = res["last"]
+        state.loc[refitted, ["n_new", "new_loglik"]] = 0
+        refit_probs = {i: res["filtered"][k, :len(returns[i])] for k, i in enumerate(refitted)}
+
+    parts = []
+    for i, ((region, segment), d, r) in enumerate(zip(keys.itertuples(index=False), dates, returns)):
+        if len(r) == 0:
+            continue
+        if updated[i]:
+            old = previous[(previous["region"] == region) & (previous["segment"] == segment)]
+            parts.append(old[old["date"] <= state["last_date"].iloc[i]])
+            new_dates, probs = new_parts[i]
+            if len(new_dates):
+                parts.append(_frame(region, segment, new_dates, probs[:len(new_dates)]))
+        elif fitted[i] is not None and to_fit[i]:
+            parts.append(_frame(region, segment, d, refit_probs[i]))
+        else:
+            print(f"⚠️  No HMM fit for {region} / {segment}. Using fallback.")
+            regimes = markov_fallback(r, float(params.get("fallback_threshold", 0.01)))
+            probs = (regimes[:, None] == np.asarray(REGIMES)[None, :]).astype(float)
+            parts.append(_frame(region, segment, d, probs, regimes))
+        state.loc[i, "last_date"] = d[-1]
+        state.at[i, "history_hash"] = history_hash(d, r)
+
+    if params.get("filter_file"):
+        write_table(state, params.get("filter_file"), cfg)
+
+    if not parts:
+        print("⚠️  Not enough returns data. No regimes computed.")
+        columns = ["date", "region", "segment", "regime", *prob_cols]
+        return pd.DataFrame(columns=columns)
+    out_df = pd.concat(parts, ignore_index=True)
+
+    if params.get("stats_file"):
+        transmat = {tuple(k): f["transmat"] for k, f in zip(keys.itertuples(index=False), fitted) if f}
+        write_table(regime_statistics(out_df, REGIMES, transmat), params.get("stats_file"), cfg)
+    return out_df
+
+
+def main():
+    cfg = load_settings()
+    out_df = run(load_features(cfg), cfg)
+    out_path = save_output(out_df, cfg, "trend_markov")
     print(f"✓ Markov regime output saved to {out_path}")
 
 
@@ -1,6 +1,9 @@
 """
 Valuation via Nash Bargaining + Real Options.
 Computes optimal contract price and option value of waiting.
+Waiting to sell or buy is priced as an American option per region x
+segment, calibrated from index volatility with the rental yield as
+dividend (lattice or Longstaff-Schwartz engine).
 """
 
 import pandas as pd
@@ -11,6 +14,8 @@ import os
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from src import load_settings
+from src.models.common import load_features, save_output, to_panel
+from src.models.real_options import wait_values
 
 try:
     from scipy.optimize import minimize
@@ -18,69 +23,245 @@ except ImportError:
     minimize = None
 
 
-def nash_product(vars, a_res, b_res):
-    """Nash bargaining product: maximize (u_a) * (u_b)"""
+def nash_product(vars, a_res, b_res, alpha=0.5):
+    """Generalized Nash product: maximize u_a^alpha * u_b^(1 - alpha)"""
     p = vars[0]
     u_a = p - a_res  # seller utility (higher price = higher utility)
     u_b = b_res - p  # buyer utility (lower price = higher utility)
     if u_a <= 0 or u_b <= 0:
         return 1e6
-    return -(u_a * u_b)  # minimize negative product
+    return -(u_a ** alpha * u_b ** (1 - alpha))  # minimize negative product
 
 
-def main():
-    cfg = load_settings()
-    features_path = Path(cfg["data"]["processed_dir"]) / "features_timeseries.csv"
-    out_path = Path(cfg["models"]["valuation"]["output_file"])
-
-    if not features_path.exists():
-        raise FileNotFoundError(f"Features file {features_path} not found.")
-
-    df = pd.read_csv(features_path, parse_dates=["date"])
-
-    mask = (df["region"] == "Budapest") & (df["segment"] == "panel_3szoba")
-    df_sub = df[mask].copy().dropna(subset=["price_index"])
-    df_sub = df_sub.sort_values("date")
-
-    current_index = df_sub["price_index"].iloc[-1]
-    # Mapping: index 100 ≈ 51M HUF (you calibrate this)
-    base_price = 51_000_000
-
-    seller_res = 48_000_000
-    buyer_res = 52_000_000
-
-    if minimize is not None:
-        print("Solving Nash bargaining problem...")
-        try:
-            res = minimize(
-                nash_product,
-                x0=[base_price],
-                args=(seller_res, buyer_res),
-                bounds=[(seller_res, buyer_res)]
-            )
-            nash_price = float(res.x[0])
-        except Exception as e:
-            print(f"⚠️  Nash optimization failed: {e}. Using midpoint.")
-            nash_price = (seller_res + buyer_res) / 2
-    else:
-        print("⚠️  scipy not installed. Using midpoint.")
-        nash_price = (seller_res + buyer_res) / 2
-
-    # Option value of waiting: proportional to volatility
-    df_sub["ret"] = df_sub["price_index"].pct_change()
-    vol = df_sub["ret"].dropna().std()
-    option_value_wait = vol * 1_000_000
-
-    out_df = pd.DataFrame({
-        "region": ["Budapest"],
-        "segment": ["panel_3szoba"],
-        "current_price_guess": [base_price],
-        "nash_price": [nash_price],
-        "option_value_wait": [option_value_wait]
+def nash_prices(seller_res, buyer_res, seller_weight=0.5, buyer_weight=0.5):
+    """Generalized Nash bargaining prices for many deals at once.
+
+    Maximizing (p - s)^a (b - p)^(1 - a) with a = ws / (ws + wb) gives
+    p = s + a (b - s) in closed form. Deals without a zone of agreement
+    (b <= s) get NaN; rows where the closed form is not finite fall back
+    to the numerical solver.
+    """
+    s, b, ws, wb = (np.asarray(a, dtype=float) for a in np.broadcast_arrays(
+        seller_res, buyer_res, seller_weight, buyer_weight))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        alpha = ws / (ws + wb)
+        price = s + alpha * (b - s)
+    agree = b > s
+    price = np.where(agree, price, np.nan)
+
+    retry = np.flatnonzero(agree & ~np.isfinite(price))
+    if len(retry):
+        print(f"⚠️  Closed-form Nash price not finite for {len(retry)} deal(s). Solving numerically.")
+    for i in retry:
+        a = alpha.flat[i] if np.isfinite(alpha.flat[i]) else 0.5
+        price.flat[i] = nash_price_single(s.flat[i], b.flat[i], (s.flat[i] + b.flat[i]) / 2, a)
+    return price
+
+
+def load_yields(path, regions=("National",)):
+    """Latest annual rental yield and retail government bond rate per region (decimals).
+
+    Clean_Yields.csv columns: label, period, date, rental yield %, bond
+    rate %, then investor shares. The file stacks one block of rows per
+    region; a block ends at a header row or where the dates start over,
+    and regions names the blocks in file order. Returns a frame of
+    region, rent_yield, risk_free and date.
+    """
+    raw = pd.read_csv(path, header=None, skiprows=1)
+    dates = pd.to_datetime(raw[4], errors="coerce")
+    values = raw[[5, 6]].apply(pd.to_numeric, errors="coerce")
+    ok = dates.notna() & values.notna().all(axis=1)
+    if not ok.any():
+        raise ValueError(f"No yield rows in {path}")
+
+    # Header rows and date restarts open a new block
+    restart = dates.diff() <= pd.Timedelta(0)
+    block = (~ok | restart).cumsum()
+    block = block[ok].map({b: i for i, b in enumerate(block[ok].unique())})
+    if block.max() >= len(regions):
+        raise ValueError(f"{path} has {block.max() + 1} yield blocks but only regions {list(regions)} are named")
+
+    rows = pd.DataFrame({
+        "region": np.asarray(regions)[block.to_numpy()],
+        "rent_yield": values.loc[ok, 5] / 100,
+        "risk_free": values.loc[ok, 6] / 100,
+        "date": dates[ok],
     })
+    latest = rows.sort_values("date").groupby("region", sort=False).tail(1)
+    return latest.set_index("region").loc[[r for r in regions if r in set(latest["region"])]].reset_index()
+
+
+def region_yields(regions, yields, fallback="National"):
+    """rent_yield and risk_free for each region, from the fallback region where missing"""
+    table = yields.set_index("region")[["rent_yield", "risk_free"]]
+    out = table.reindex(regions)
+    if fallback in table.index:
+        out = out.fillna(table.loc[fallback])
+    return out.reset_index(drop=True)
+
+
+def calibrate(df, lookback=36):
+    """Latest index level and annualized log-return volatility per series.
+
+    Each series' observations are packed to the left of the panel, so
+    returns run between its own consecutive observations for all series
+    at once; the median spacing of those observations (monthly or
+    quarterly) sets the annualization.
+    """
+    keys, dates, Y = to_panel(df, "price_index")
+    observed = ~np.isnan(Y)
+    counts = observed.sum(axis=1)
+    order = np.argsort(~observed, axis=1, kind="stable")
+    packed = np.take_along_axis(Y, order, axis=1)
+    days = dates.values.astype("datetime64[D]").astype(float)[order]
+
+    enough = counts >= 3
+    n, packed, days = counts[enough], packed[enough], days[enough]
+    cols = np.arange(Y.shape[1] - 1)[None, :]
+    valid = cols < (n - 1)[:, None]
+    recent = valid & (cols >= (n - 1 - lookback)[:, None])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        log_ret = np.where(recent, np.diff(np.log(packed), axis=1), np.nan)
+    periods_per_year = 365.25 / np.nanmedian(np.where(valid, np.diff(days, axis=1), np.nan), axis=1)
+
+    sigma = np.full(len(keys), np.nan)
+    current = np.full(len(keys), np.nan)
+    sigma[enough] = np.nanstd(log_ret, axis=1, ddof=1) * np.sqrt(periods_per_year)
+    current[enough] = packed[np.arange(len(n)), n - 1]
+    out = keys.copy()
+    out["current_index"] = current
+    out["sigma"] = sigma
+    return out
+
 
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_df.to_csv(out_path, index=False)
+def nash_price_single(seller_res, buyer_res, base_price, alpha=0.5):
+    """Numerical Nash price for one deal (fallback for nash_prices)"""
+    if minimize is None:
+        return seller_res + alpha * (buyer_res - seller_res)
+    try:
+        res = minimize(
+            nash_product,
+            x0=[base_price],
+            args=(seller_res, buyer_res, alpha),
+            bounds=[(seller_res, buyer_res)]
+        )
+        return float(res.x[0])
+    except Exception as e:
+        print(f"⚠️  Nash optimization failed: {e}. Using midpoint.")
+        return (seller_res + buyer_res) / 2
+
+
+def run(df, cfg=None):
+    """Nash prices and real-option values of waiting for every series and horizon"""
+    cfg = cfg or load_settings()
+    params = cfg["models"]["valuation"]
+    groups = calibrate(df, int(params.get("vol_lookback", 36)))
+    groups = groups[(groups["segment"] != "all") & groups["sigma"].notna()].reset_index(drop=True)
+
+    # Index 100 ≈ base_price HUF, per segment when base_prices lists it
+    base = params.get("base_prices", {}) or {}
+    base_price = groups["segment"].map(base).fillna(float(params.get("base_price", 51_000_000)))
+    groups["current_price_guess"] = base_price * groups["current_index"] / 100
+
+    seller_res = groups["current_price_guess"] * float(params.get("seller_reservation_ratio", 0.94))
+    buyer_res = groups["current_price_guess"] * float(params.get("buyer_reservation_ratio", 1.02))
+    groups["nash_price"] = nash_prices(seller_res, buyer_res)
+
+    yields_path = Path(cfg["data"]["raw_dir"]) / params.get("yields_file", "Clean_Yields.csv")
+    if yields_path.exists():
+        yields = load_yields(yields_path, params.get("yields_regions", ["National"]))
+        for r in yields.itertuples():
+            print(f"{r.region}: rent yield {r.rent_yield:.2%}, risk-free {r.risk_free:.2%} "
+                  f"(as of {r.date.date()})")
+    else:
+        print(f"⚠️  {yields_path} not found. Using configured yields.")
+        yields = pd.DataFrame({
+            "region": ["National"],
+            "rent_yield": [float(params.get("rent_yield", 0.05))],
+            "risk_free": [float(params.get("risk_free", 0.06))],
+        })
+    # Regions without their own yield block use the national one
+    rates = region_yields(groups["region"].astype(object), yields)
+    groups["rent_yield"] = rates["rent_yield"].to_numpy()
+    groups["risk_free"] = rates["risk_free"].to_numpy()
+
+    engine = params.get("engine", "lattice")
+    horizons = [float(h) for h in params.get("horizons", [0.5, 1.0, 2.0])]
+    print(f"Pricing wait options ({engine}) for {len(groups)} series x {len(horizons)} horizons...")
+    values = wait_values(
+        groups["current_price_guess"].to_numpy(),
+        groups["nash_price"].to_numpy(),
+        groups["risk_free"].to_numpy(),
+        groups["rent_yield"].to_numpy(),
+        groups["sigma"].to_numpy(),
+        horizons,
+        engine=engine,
+        steps=int(params.get("lattice_steps", 500)),
+        steps_per_year=int(params.get("lsm_steps_per_year", 12)),
+        n_paths=int(params.get("lsm_paths", 20_000)),
+        seed=params.get("seed"),
+    )
+
+    H = len(horizons)
+    out_df = groups.loc[groups.index.repeat(H)].reset_index(drop=True)
+    out_df.insert(2, "horizon", np.tile(horizons, len(groups)))
+    # The owner's question: what is waiting to sell worth instead of accepting nash_price now
+    out_df["option_value_wait"] = values["sell_wait"].ravel()
+    out_df["option_value_wait_buy"] = values["buy_wait"].ravel()
+    out_df["sell_option"] = values["sell_option"].ravel()
+    out_df["buy_option"] = values["buy_option"].ravel()
+    return out_df
+
+
+def value_properties(props, groups, params, horizon):
+    """Nash prices and wait-option values for many properties in one pass.
+
+    props has city, segment, size_sqm, seller_reservation,
+    buyer_reservation, seller_weight and buyer_weight columns; groups is
+    the valuation output (per-series calibration). A property's current
+    value scales the series' current_price_guess by size over the
+    segment's reference size. Returns props with nash_price, agreement,
+    current_value, option_value_wait and option_value_wait_buy added;
+    option values are NaN without agreement or calibration.
+    """
+    calib = groups.astype({"region": object, "segment": object}).drop_duplicates(["region", "segment"])
+    calib = calib[["region", "segment", "current_price_guess", "sigma", "rent_yield", "risk_free"]]
+    out = props.merge(calib, left_on=["city", "segment"], right_on=["region", "segment"], how="left")
+    out = out.drop(columns="region")
+
+    out["nash_price"] = nash_prices(
+        out["seller_reservation"], out["buyer_reservation"], out["seller_weight"], out["buyer_weight"]
+    )
+    out["agreement"] = out["nash_price"].notna()
+
+    sizes = params.get("reference_sizes", {}) or {}
+    ref_size = out["segment"].map(sizes).fillna(float(params.get("reference_size_sqm", 65.0)))
+    out["current_value"] = out["current_price_guess"] * out["size_sqm"] / ref_size
+
+    out["option_value_wait"] = np.nan
+    out["option_value_wait_buy"] = np.nan
+    ok = (out["agreement"] & out["current_value"].notna()).to_numpy()
+    if ok.any():
+        sub = out.loc[ok]
+        values = wait_values(
+            sub["current_value"].to_numpy(),
+            sub["nash_price"].to_numpy(),
+            sub["risk_free"].to_numpy(),
+            sub["rent_yield"].to_numpy(),
+            sub["sigma"].to_numpy(),
+            [horizon],
+            engine="lattice",
+            steps=int(params.get("batch_lattice_steps", 100)),
+        )
+        out.loc[ok, "option_value_wait"] = values["sell_wait"][:, 0]
+        out.loc[ok, "option_value_wait_buy"] = values["buy_wait"][:, 0]
+    return out.drop(columns=["current_price_guess", "sigma", "rent_yield", "risk_free"])
+
+
+def main():
+    cfg = load_settings()
+    out_df = run(load_features(cfg), cfg)
+    out_path = save_output(out_df, cfg, "valuation")
     print(f"✓ Valuation output saved to {out_path}")
 
 
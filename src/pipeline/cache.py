@@ -0,0 +1,99 @@
+"""
+Content-hash stage cache.
+A stage's fingerprint covers its input files, its settings section and its
+source code; when it matches the one stored next to the outputs, the stage
+is skipped.
+"""
+
+from pathlib import Path
+import hashlib
+import json
+
+
+def _file_digest(path):
+    """sha256 of a file's content, or a marker if it does not exist"""
+    if not path.exists():
+        return "missing"
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _settings_section(cfg, keys):
+    section = cfg
+    for k in keys:
+        section = section.get(k, {}) if isinstance(section, dict) else {}
+    return section
+
+
+class StageCache:
+    """Decides whether a stage must run and records fingerprints after it does"""
+
+    def __init__(self, cfg, root=".", force=()):
+        self.cfg = cfg
+        self.root = Path(root)
+        self.force = set(force)
+
+    def _path(self, p):
+        p = Path(p)
+        return p if p.is_absolute() else self.root / p
+
+    def fingerprint_file(self, stage):
+        first = stage.outputs[0] if stage.outputs else Path(stage.script)
+        return self._path(first).with_name(f".{stage.name}.fingerprint.json")
+
+    def fingerprint(self, stage):
+        parts = {
+            "inputs": {str(p): _file_digest(self._path(p)) for p in stage.inputs},
+            "sources": {str(p): _file_digest(self._path(p)) for p in [stage.script, *stage.sources]},
+            "settings": _settings_section(self.cfg, stage.settings_keys),
+        }
+        blob = json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(blob).hexdigest()
+
+    def is_forced(self, stage):
+        return "all" in self.force or stage.name in self.force
+
+    def is_fresh(self, stage):
+        """True if outputs exist and were produced from identical inputs"""
+        if self.is_forced(stage):
+            return False
+        if not all(self._path(p).exists() for p in stage.outputs):
+            return False
+        fp_file = self.fingerprint_file(stage)
+        if not fp_file.exists():
+            return False
+        try:
+            stored = json.loads(fp_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        return stored.get("fingerprint") == self.fingerprint(stage)
+
+    def save(self, stage):
+        fp_file = self.fingerprint_file(stage)
+        fp_file.parent.mkdir(parents=True, exist_ok=True)
+        fp_file.write_text(
+            json.dumps({"stage": stage.name, "fingerprint": self.fingerprint(stage)}, indent=2),
+            encoding="utf-8",
+        )
+
+    def plan(self, stages):
+        """Names of stages that would run, in declaration order.
+
+        Stages downstream of a stage that runs are assumed to run as well,
+        since their inputs cannot be hashed before they are rebuilt.
+        """
+        will_run = set()
+        by_name = {s.name: s for s in stages}
+        remaining = list(by_name)
+        while remaining:
+            for name in list(remaining):
+                stage = by_name[name]
+                if not stage.deps <= set(by_name) - set(remaining):
+                    continue
+                if stage.deps & will_run or not self.is_fresh(stage):
+                    will_run.add(name)
+                remaining.remove(name)
+        return [s.name for s in stages if s.name in will_run]
@@ -0,0 +1,196 @@
+"""
+DAG stage executor.
+Runs each stage as a subprocess as soon as its dependencies finish, on a
+bounded worker pool, and stops everything on the first failure. CPU time
+and peak memory come from the child's resource usage when it is reaped.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from src.instrumentation import maxrss_mb, profile_path
+from src.storage.tables import SUFFIXES, table_rows
+
+
+@dataclass
+class StageResult:
+    name: str
+    status: str = "pending"  # pending | ok | cached | failed | cancelled
+    returncode: int | None = None
+    seconds: float = 0.0
+    output: str = ""
+    cpu_seconds: float | None = None  # user + system, including processes the stage waited for
+    peak_rss_mb: float | None = None
+    rows_in: int | None = None
+    rows_out: dict = field(default_factory=dict)  # output file name -> rows
+    profile: str | None = None
+
+
+def record_rows(stage, result, root=None):
+    """Rows of the stage's table inputs and of each table it wrote"""
+    def resolve(p):
+        p = Path(p)
+        return p if root is None or p.is_absolute() else Path(root) / p
+
+    tables = set(SUFFIXES.values())
+    inputs = [resolve(p) for p in stage.inputs if Path(p).suffix in tables and resolve(p).exists()]
+    result.rows_in = sum(table_rows(p) for p in inputs) if inputs else None
+    result.rows_out = {
+        Path(p).name: table_rows(resolve(p))
+        for p in stage.outputs if Path(p).suffix in tables and resolve(p).exists()
+    }
+
+
+def _wait(proc):
+    """Reap proc and return its resource usage (None where unavailable)"""
+    if hasattr(os, "wait4"):
+        try:
+            _, status, usage = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            return usage
+        except ChildProcessError:
+            pass  # already reaped by terminate()
+    proc.wait()
+    return None
+
+
+def _run_stage(stage, python, cwd, procs, lock, stop, profile_file=None):
+    """Run one stage script, capturing its output and resource usage"""
+    start = time.perf_counter()
+    cmd = [python, stage.script]
+    if profile_file is not None:
+        cmd = [python, "-m", "cProfile", "-o", str(profile_file), stage.script]
+    with lock:
+        # Started under the lock so a concurrent failure cannot miss it
+        if stop.is_set():
+            return None, "", 0.0, None
+        proc = subprocess.Popen(
+            cmd,
+            cwd=cwd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+        procs[stage.name] = proc
+    output = proc.stdout.read()
+    proc.stdout.close()
+    usage = _wait(proc)
+    with lock:
+        procs.pop(stage.name, None)
+    return proc.returncode, output, time.perf_counter() - start, usage
+
+
+def _print_stage(stage, result):
+    print("\n" + "=" * 60)
+    print(f"{stage.label} [{result.status}, {result.seconds:.1f}s]")
+    print("=" * 60)
+    if result.output:
+        print(result.output.rstrip())
+
+
+def run_stages(stages, max_workers=4, python=sys.executable, cwd=None, cache=None,
+               profile=(), profile_dir=None):
+    """Execute stages in dependency order; return {name: StageResult}
+
+    With a StageCache, stages whose fingerprint is unchanged are skipped
+    and successful stages record their new fingerprint. Stages named in
+    profile run under cProfile, dumping stats into profile_dir.
+    """
+    results = {s.name: StageResult(s.name) for s in stages}
+    pending = {s.name: s for s in stages}
+    done = set()
+    futures = {}
+    procs = {}
+    lock = threading.Lock()
+    stop = threading.Event()
+    failed = None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or futures:
+            if failed is None:
+                ready = [name for name, s in pending.items() if s.deps <= done]
+                for name in ready:
+                    stage = pending.pop(name)
+                    if cache is not None and cache.is_fresh(stage):
+                        print(f"= {stage.name} unchanged, skipped")
+                        results[name].status = "cached"
+                        done.add(name)
+                        continue
+                    print(f"▶ {stage.name} queued")
+                    prof = None
+                    if name in profile:
+                        prof = profile_path(profile_dir, name)
+                        Path(cwd or ".", prof).parent.mkdir(parents=True, exist_ok=True)
+                        results[name].profile = str(prof)
+                    fut = pool.submit(_run_stage, stage, python, cwd, procs, lock, stop, prof)
+                    futures[fut] = stage
+
+            if not futures:
+                if failed is None and any(s.deps <= done for s in pending.values()):
+                    continue  # cached stages unlocked more work
+                break
+
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                stage = futures.pop(fut)
+                result = results[stage.name]
+                if fut.cancelled():
+                    result.status = "cancelled"
+                    continue
+                try:
+                    rc, output, seconds, usage = fut.result()
+                except Exception as e:
+                    rc, output, seconds, usage = -1, f"{type(e).__name__}: {e}", 0.0, None
+                if rc is None:
+                    result.status = "cancelled"
+                    continue
+                result.returncode = rc
+                result.output = output
+                result.seconds = seconds
+                if usage is not None:
+                    result.cpu_seconds = usage.ru_utime + usage.ru_stime
+                    result.peak_rss_mb = maxrss_mb(usage.ru_maxrss)
+                if rc == 0:
+                    result.status = "ok"
+                    done.add(stage.name)
+                    record_rows(stage, result, cwd)
+                    if cache is not None:
+                        cache.save(stage)
+                elif failed is not None:
+                    # Terminated by us after another stage failed
+                    result.status = "cancelled"
+                else:
+                    result.status = "failed"
+                    failed = stage.name
+                    for other in futures:
+                        other.cancel()
+                    with lock:
+                        stop.set()
+                        for proc in procs.values():
+                            proc.terminate()
+                _print_stage(stage, result)
+
+    for name in pending:
+        results[name].status = "cancelled"
+    return results
+
+
+def print_summary(stages, results):
+    """Print a per-stage status table"""
+    print("\n" + "=" * 60)
+    print("PIPELINE SUMMARY")
+    print("=" * 60)
+    icons = {"ok": "✓", "cached": "=", "failed": "✗", "cancelled": "–", "pending": "?"}
+    for stage in stages:
+        r = results[stage.name]
+        rc = "" if r.returncode is None else f" (exit {r.returncode})"
+        cpu = "" if r.cpu_seconds is None else f" cpu {r.cpu_seconds:6.1f}s"
+        mem = "" if r.peak_rss_mb is None else f" peak {r.peak_rss_mb:6.0f}MB"
+        rows = f" {sum(r.rows_out.values())} rows" if r.rows_out else ""
+        print(f"{icons.get(r.status, '?')} {stage.name:<15} {r.status:<10} {r.seconds:7.1f}s{cpu}{mem}{rows}{rc}")
@@ -0,0 +1,120 @@
+"""
+In-process stage runner.
+Runs the pipeline inside the current interpreter: the features frame is
+built (or read) once and the same frame is handed to every model.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import importlib
+import traceback
+
+from src.instrumentation import measure, profile_path, profiled
+from src.models.common import load_features, save_output
+from src.pipeline.executor import StageResult, record_rows
+
+
+def stage_module(stage):
+    """Import the module behind a stage script (src/models/x.py -> src.models.x)"""
+    return importlib.import_module(stage.script[:-len(".py")].replace("/", "."))
+
+
+def _timed(result, func, *args, profile_dir=None):
+    """Call func, recording wall/CPU time and peak memory on result"""
+    m = None
+    try:
+        with measure(result.name) as m:
+            if profile_dir is not None:
+                result.profile = str(profile_path(profile_dir, result.name))
+                return profiled(result.profile, func, *args)
+            return func(*args)
+    finally:
+        result.seconds = m.wall_seconds
+        result.cpu_seconds = m.cpu_seconds
+        result.peak_rss_mb = m.peak_rss_mb
+
+
+def run_in_process(stages, cfg, max_workers=4, cache=None, profile=(), profile_dir=None):
+    """Run dataload/features, then all models on one shared features frame.
+
+    CPU time is per thread, so a model's own worker processes are not in
+    it; peak memory is the whole process's high-water mark.
+    """
+    results = {s.name: StageResult(s.name) for s in stages}
+    by_name = {s.name: s for s in stages}
+    producers = [by_name[n] for n in ("dataload", "features") if n in by_name]
+    models = [s for s in stages if s.name not in ("dataload", "features")]
+
+    features = None
+    for stage in producers:
+        result = results[stage.name]
+        if cache is not None and cache.is_fresh(stage):
+            print(f"= {stage.name} unchanged, skipped")
+            result.status = "cached"
+            continue
+        print(f"▶ {stage.name}")
+        try:
+            module = stage_module(stage)
+            prof = profile_dir if stage.name in profile else None
+            if stage.name == "dataload":
+                _timed(result, module.main, profile_dir=prof)
+            else:
+                features = _timed(result, module.build_features, profile_dir=prof)
+        except Exception:
+            traceback.print_exc()
+            result.status = "failed"
+            for other in stages:
+                if results[other.name].status == "pending":
+                    results[other.name].status = "cancelled"
+            return results
+        result.status = "ok"
+        record_rows(stage, result)
+        if cache is not None:
+            cache.save(stage)
+
+    todo = []
+    for stage in models:
+        if cache is not None and cache.is_fresh(stage):
+            print(f"= {stage.name} unchanged, skipped")
+            results[stage.name].status = "cached"
+        else:
+            todo.append(stage)
+    if not todo:
+        return results
+
+    if features is None:
+        features = load_features(cfg)
+    print(f"Shared features frame: {len(features)} rows → {len(todo)} models")
+
+    def fit(stage):
+        prof = profile_dir if stage.name in profile else None
+        out_df = _timed(results[stage.name], stage_module(stage).run, features, cfg, profile_dir=prof)
+        return save_output(out_df, cfg, stage.name)
+
+    failed = False
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(fit, stage): stage for stage in todo}
+        while futures:
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                stage = futures.pop(fut)
+                result = results[stage.name]
+                if fut.cancelled():
+                    result.status = "cancelled"
+                    continue
+                try:
+                    out_path = fut.result()
+                except Exception:
+                    traceback.print_exc()
+                    result.status = "failed"
+                    if not failed:
+                        failed = True
+                        # Threads cannot be killed; stop whatever has not started
+                        for other in futures:
+                            other.cancel()
+                    continue
+                result.status = "ok"
+                record_rows(stage, result)
+                print(f"✓ {stage.name} → {out_path} ({result.seconds:.1f}s)")
+                if cache is not None:
+                    cache.save(stage)
+    return results
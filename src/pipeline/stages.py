@@ -0,0 +1,134 @@
+"""
+Pipeline stage declarations.
+Every stage lists the files it reads and writes; dependencies are derived
+from that data flow instead of being hardcoded.
+"""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from src.storage.tables import table_path
+
+
+@dataclass
+class Stage:
+    """One pipeline step run as a standalone script"""
+    name: str
+    label: str
+    script: str
+    inputs: list = field(default_factory=list)
+    outputs: list = field(default_factory=list)
+    sources: list = field(default_factory=list)  # extra code files besides script
+    settings_keys: tuple = ()  # settings section the stage depends on
+    deps: set = field(default_factory=set)
+
+
+def build_stages(cfg):
+    """Declare all stages from settings and resolve their dependencies"""
+    raw_dir = Path(cfg["data"]["raw_dir"])
+    processed_dir = Path(cfg["data"]["processed_dir"])
+    unified_path = table_path(cfg["data"]["unified_file"], cfg)
+    features_path = table_path(processed_dir / "features_timeseries.csv", cfg)
+    models = cfg["models"]
+    # Only the PyMC engine writes sampler state
+    bayes = models["trend_bayes"]
+    bayes_state = bayes.get("state_file") if bayes.get("engine", "conjugate") == "pymc" else None
+    backtest = models["portfolio"].get("backtest") or {}
+    portfolio_backtest_files = (
+        [backtest.get("output_file"), backtest.get("weights_file")] if backtest.get("enabled") else []
+    )
+
+    def model_stage(name, label, script, sources=(), extra_outputs=(), raw_outputs=(), extra_inputs=()):
+        # Extra outputs (e.g. fitted parameters) are never declared as inputs,
+        # even when reused for warm starts, so they cannot invalidate the cache.
+        # raw_outputs are non-table files kept under their own names.
+        return Stage(
+            name=name,
+            label=label,
+            script=script,
+            inputs=[features_path, *extra_inputs],
+            outputs=[table_path(p, cfg) for p in [models[name]["output_file"], *extra_outputs]]
+            + [Path(p) for p in raw_outputs],
+            sources=["src/__init__.py", "src/models/common.py", "src/storage/tables.py", *sources],
+            settings_keys=("models", name),
+        )
+
+    stages = [
+        Stage(
+            name="dataload",
+            label="DATA LOAD",
+            script="src/data_load/dataload.py",
+            inputs=[
+                raw_dir / "mnb_lakasarindex.csv",
+                raw_dir / "ksh_lakasarindex.csv",
+                raw_dir / "ingatlancom_monthly_index.csv",
+            ],
+            outputs=[
+                table_path(processed_dir / "mnb_lakasarindex_normalized.csv", cfg),
+                table_path(processed_dir / "ksh_lakasarindex_normalized.csv", cfg),
+                table_path(processed_dir / "ingatlancom_index_normalized.csv", cfg),
+                unified_path,
+            ],
+            sources=["src/__init__.py", "src/storage/tables.py"],
+            settings_keys=("data",),
+        ),
+        Stage(
+            name="features",
+            label="FEATURE BUILD",
+            script="src/features/features.py",
+            inputs=[unified_path],
+            outputs=[features_path],
+            sources=["src/__init__.py", "src/storage/tables.py"],
+            settings_keys=("data",),
+        ),
+        # Bayes first: it dominates wall-clock, so it should start first
+        model_stage("trend_bayes", "MODEL – BAYES", "src/models/trend_bayes_hierarchical.py",
+                    sources=["src/models/bayes_conjugate.py"],
+                    raw_outputs=[p for p in [bayes_state] if p]),
+        model_stage("trend_markov", "MODEL – MARKOV", "src/models/trend_markov_switching.py",
+                    extra_outputs=[p for p in [models["trend_markov"].get("params_file"),
+                                               models["trend_markov"].get("filter_file"),
+                                               models["trend_markov"].get("stats_file")] if p]),
+        model_stage("trend_kalman", "MODEL – KALMAN", "src/models/trend_kalman.py",
+                    sources=["src/models/kalman_batch.py", "src/models/theilsen_batch.py"],
+                    extra_outputs=[p for p in [models["trend_kalman"].get("params_file")] if p]),
+        model_stage("risk_prospect", "MODEL – RISK", "src/models/risk_prospect_theory.py"),
+        model_stage("portfolio", "MODEL – MPT", "src/models/portfolio_mpt.py",
+                    sources=["src/models/frontier.py", "src/models/backtest.py",
+                             "src/models/covariance.py"],
+                    extra_outputs=[p for p in [models["portfolio"].get("frontier_file"),
+                                               *portfolio_backtest_files] if p]),
+        model_stage("valuation", "MODEL – VALUATION", "src/models/valuation_nash_real.py",
+                    sources=["src/models/real_options.py"],
+                    extra_inputs=[raw_dir / models["valuation"].get("yields_file", "Clean_Yields.csv")]),
+    ]
+    resolve_dependencies(stages)
+    return stages
+
+
+def resolve_dependencies(stages):
+    """Link each stage to the stages producing its inputs"""
+    producers = {}
+    for stage in stages:
+        for out in stage.outputs:
+            if out in producers:
+                raise ValueError(f"{out} is produced by both {producers[out]} and {stage.name}")
+            producers[out] = stage.name
+
+    for stage in stages:
+        stage.deps = {
+            producers[p] for p in stage.inputs
+            if p in producers and producers[p] != stage.name
+        }
+
+    # Reject cycles up front so the executor can never deadlock
+    ordered = set()
+    remaining = {s.name: s.deps for s in stages}
+    while remaining:
+        ready = [n for n, deps in remaining.items() if deps <= ordered]
+        if not ready:
+            raise ValueError(f"Dependency cycle between stages: {sorted(remaining)}")
+        for n in ready:
+            ordered.add(n)
+            del remaining[n]
+    return stages
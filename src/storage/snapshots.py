@@ -0,0 +1,160 @@
+"""
+Versioned snapshots of the published tables.
+Stages keep writing to processed_dir; after a successful run the pipeline
+publishes its tables as an immutable snapshot directory
+(snapshot_dir/<version>/) with a manifest.json, then points the CURRENT
+file at it with one atomic rename. Readers (API, dashboard) resolve table
+paths through CURRENT, so they see either the old or the new set of
+tables, never a partly written one. Files are hard-linked when possible;
+write_table replaces files instead of rewriting them, so a linked
+snapshot never changes under a reader. The newest keep_snapshots
+versions are kept for rollback.
+"""
+
+from datetime import datetime, timezone
+from pathlib import Path
+import hashlib
+import json
+import os
+import shutil
+
+from src.storage.tables import storage_format, table_path
+
+POINTER = "CURRENT"
+MANIFEST = "manifest.json"
+
+
+def snapshot_root(cfg):
+    return Path(cfg["data"].get("snapshot_dir", "data/snapshots"))
+
+
+def _write_atomic(path, text):
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def current_version(cfg):
+    """Published snapshot version, or None if nothing has been published"""
+    try:
+        return (snapshot_root(cfg) / POINTER).read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def list_versions(cfg):
+    """Complete snapshot versions, oldest first"""
+    root = snapshot_root(cfg)
+    if not root.exists():
+        return []
+    # Staging directories (.<version>.tmp) hold a manifest before they are renamed
+    return sorted(p.name for p in root.iterdir()
+                  if p.is_dir() and not p.name.startswith(".") and (p / MANIFEST).exists())
+
+
+def load_manifest(cfg, version=None):
+    """Manifest of a snapshot (the published one by default), or None"""
+    version = version or current_version(cfg)
+    if version is None:
+        return None
+    try:
+        return json.loads((snapshot_root(cfg) / version / MANIFEST).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+
+
+def published_path(path, cfg, version=None):
+    """Where readers find a table: inside the published snapshot if it has it.
+
+    path is a settings path (with its .csv name). Without a published
+    snapshot, or for a table the snapshot does not hold, this is the
+    working copy under processed_dir. Returns (path, version).
+    """
+    version = version or current_version(cfg)
+    local = table_path(path, cfg)
+    if version is not None:
+        snap = snapshot_root(cfg) / version / local.name
+        if snap.exists():
+            return snap, version
+    return local, None
+
+
+def _new_version(root):
+    version = datetime.now(timezone.utc).strftime("v%Y%m%dT%H%M%S%fZ")
+    while (root / version).exists():
+        version += "_"
+    return version
+
+
+def publish(paths, cfg, meta=None):
+    """Snapshot the given table files and make them the published version.
+
+    Returns the new version name. The snapshot directory is assembled
+    under a temporary name and renamed into place before CURRENT is
+    switched, so a crash leaves the previous version published.
+    """
+    root = snapshot_root(cfg)
+    root.mkdir(parents=True, exist_ok=True)
+    version = _new_version(root)
+    staging = root / f".{version}.tmp"
+    staging.mkdir()
+
+    try:
+        tables = {}
+        for src in paths:
+            src = Path(src)
+            if not src.exists():
+                continue
+            dst = staging / src.name
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copy2(src, dst)
+            tables[src.name] = {"source": str(src), "bytes": dst.stat().st_size, "sha256": _digest(dst)}
+
+        manifest = {
+            "version": version,
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "storage_format": storage_format(cfg),
+            "tables": tables,
+            **(meta or {}),
+        }
+        _write_atomic(staging / MANIFEST, json.dumps(manifest, indent=2))
+        os.rename(staging, root / version)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    switch(version, cfg)
+    prune(cfg)
+    return version
+
+
+def switch(version, cfg):
+    """Point CURRENT at an existing snapshot (publish or roll back)"""
+    if version not in list_versions(cfg):
+        raise ValueError(f"Unknown snapshot {version!r}; available: {', '.join(list_versions(cfg)) or 'none'}")
+    _write_atomic(snapshot_root(cfg) / POINTER, version + "\n")
+
+
+def prune(cfg, keep=None):
+    """Delete all but the newest keep versions; the published one is always kept"""
+    keep = int(cfg["data"].get("keep_snapshots", 5) if keep is None else keep)
+    current = current_version(cfg)
+    versions = list_versions(cfg)
+    removed = []
+    for version in versions[:max(0, len(versions) - keep)]:
+        if version != current:
+            shutil.rmtree(snapshot_root(cfg) / version, ignore_errors=True)
+            removed.append(version)
+    return removed
@@ -0,0 +1,130 @@
+"""
+Table storage for everything under processed_dir.
+Settings pick the on-disk format (data.storage_format):
+  csv      – plain text, as before
+  feather  – Arrow IPC, uncompressed, memory-mapped on read (only the
+             selected columns are paged in; converting to pandas still copies
+             them out of the map)
+  parquet  – compressed columnar, smaller but not memory-mappable
+Paths in settings.yaml keep their .csv names; the suffix is swapped here.
+"""
+
+import os
+import pandas as pd
+from pathlib import Path
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+SUFFIXES = {"csv": ".csv", "feather": ".arrow", "parquet": ".parquet"}
+CATEGORICAL_COLUMNS = ("region", "segment", "source")
+
+_warned = False
+
+
+def storage_format(cfg):
+    """Configured storage format, falling back to csv without pyarrow"""
+    global _warned
+    fmt = cfg["data"].get("storage_format", "csv")
+    if fmt not in SUFFIXES:
+        raise ValueError(f"Unknown storage_format {fmt!r}; expected one of {sorted(SUFFIXES)}")
+    if fmt != "csv" and pa is None:
+        if not _warned:
+            print(f"⚠️  pyarrow not installed. Storing {fmt} tables as CSV.")
+            _warned = True
+        return "csv"
+    return fmt
+
+
+def table_path(path, cfg):
+    """Path of a table in the configured format"""
+    return Path(path).with_suffix(SUFFIXES[storage_format(cfg)])
+
+
+def _typed(df):
+    """Categorical labels so they are stored dictionary-encoded"""
+    df = df.copy()
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns and df[col].dtype == object:
+            df[col] = df[col].astype("category")
+    return df
+
+
+def _replace(out_path, write):
+    """Write through a temporary file and rename it over out_path.
+
+    Readers see the old or the new file, never a truncated one, and a
+    snapshot hard-linked to the old file keeps its content.
+    """
+    tmp = out_path.with_name(f".{out_path.name}.tmp")
+    write(tmp)
+    os.replace(tmp, out_path)
+
+
+def write_table(df, path, cfg):
+    """Write df in the configured format (plus a CSV copy if export_csv) and return the path"""
+    fmt = storage_format(cfg)
+    out_path = table_path(path, cfg)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    if fmt == "feather":
+        _replace(out_path, lambda p: feather.write_feather(_typed(df).reset_index(drop=True), p,
+                                                           compression="uncompressed"))
+    elif fmt == "parquet":
+        _replace(out_path, lambda p: _typed(df).to_parquet(p, index=False))
+    else:
+        _replace(out_path, lambda p: df.to_csv(p, index=False))
+
+    if fmt != "csv" and cfg["data"].get("export_csv", False):
+        _replace(Path(path).with_suffix(".csv"), lambda p: df.to_csv(p, index=False))
+    return out_path
+
+
+def _to_pandas(table):
+    """Convert an Arrow table to pandas, freeing each Arrow column once converted.
+
+    Peak memory stays near one copy of the table instead of two. split_blocks
+    is left off: it would hand back read-only views of null-free numeric
+    columns, and callers assign into the frames they read.
+    """
+    return table.to_pandas(self_destruct=True)
+
+
+def read_table(path, cfg, columns=None):
+    """Read a table written by write_table; dates come back as datetime64"""
+    fmt = storage_format(cfg)
+    in_path = table_path(path, cfg)
+
+    if fmt == "feather":
+        # Memory-mapped: untouched columns are never read from disk
+        with pa.memory_map(str(in_path), "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+            if columns is not None:
+                table = table.select(columns)
+            return _to_pandas(table)
+    if fmt == "parquet":
+        return _to_pandas(pq.read_table(in_path, columns=columns))
+
+    header = pd.read_csv(in_path, nrows=0).columns
+    return pd.read_csv(
+        in_path,
+        usecols=columns,
+        parse_dates=["date"] if "date" in header and (columns is None or "date" in columns) else None,
+    )
+
+
+def table_rows(path):
+    """Row count of a stored table from its metadata (CSV: lines minus header)"""
+    path = Path(path)
+    if path.suffix == SUFFIXES["feather"] and pa is not None:
+        with pa.memory_map(str(path), "r") as source:
+            reader = pa.ipc.open_file(source)
+            return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+    if path.suffix == SUFFIXES["parquet"] and pa is not None:
+        return pq.ParquetFile(path).metadata.num_rows
+    with open(path, "rb") as f:
+        return max(0, sum(1 for _ in f) - 1)
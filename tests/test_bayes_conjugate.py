@@ -0,0 +1,35 @@
+import numpy as np
+
+from src.models.bayes_conjugate import nig_posterior, predictive_bands
+
+
+def test_predictive_matches_monte_carlo():
+    rng = np.random.default_rng(0)
+    t = np.arange(24, dtype=float)
+    Y = 100 + 0.5 * t + rng.normal(0, 2, (2, 24))
+    Y[1, :8] = np.nan
+    post = nig_posterior(Y, t, prior_mean=(100.0, 0.0), prior_sd=(50.0, 5.0), prior_sigma=10.0)
+    t_new = np.array([0.0, 12.0, 30.0])
+    quantiles = (0.05, 0.5, 0.95)
+    mean, bands = predictive_bands(post, t_new, quantiles)
+
+    n = 400_000
+    X = np.column_stack([np.ones_like(t_new), t_new])
+    for g in range(len(Y)):
+        # sigma^2 ~ InvGamma(a, b), coefficients ~ N(mean, sigma^2 Vn), y ~ N(x'coef, sigma^2)
+        sigma2 = post["b"][g] / rng.gamma(post["a"][g], 1.0, n)
+        L = np.linalg.cholesky(post["cov_scale"][g])
+        coef = post["mean"][g] + np.sqrt(sigma2)[:, None] * (rng.standard_normal((n, 2)) @ L.T)
+        draws = coef @ X.T + np.sqrt(sigma2)[:, None] * rng.standard_normal((n, len(t_new)))
+
+        np.testing.assert_allclose(mean[g], draws.mean(axis=0), atol=0.05)
+        for q, ref in zip(quantiles, np.quantile(draws, quantiles, axis=0)):
+            np.testing.assert_allclose(bands[q][g], ref, atol=0.1)
+
+
+def test_flat_prior_posterior_mean_is_least_squares():
+    rng = np.random.default_rng(1)
+    t = np.arange(30, dtype=float)
+    y = 50 + 1.5 * t + rng.normal(0, 1, 30)
+    post = nig_posterior(y[None], t, prior_mean=(0.0, 0.0), prior_sd=(1e6, 1e6), prior_sigma=1.0)
+    np.testing.assert_allclose(post["mean"][0], np.polyfit(t, y, 1)[::-1], rtol=1e-6)
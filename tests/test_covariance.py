@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+
+from src.models.covariance import ledoit_wolf, oas
+
+
+def returns(seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(0.01, 0.03, (40, 6)) @ np.diag([1.0, 2.0, 1.0, 0.5, 1.0, 3.0])
+
+
+@pytest.mark.parametrize("ours, name", [(ledoit_wolf, "ledoit_wolf"), (oas, "oas")])
+def test_shrinkage_matches_sklearn(ours, name):
+    covariance = pytest.importorskip("sklearn.covariance")
+    R = returns()
+    mu, cov, intensity = ours(R)
+    ref_cov, ref_intensity = getattr(covariance, name)(R)
+    np.testing.assert_allclose(intensity, ref_intensity, rtol=1e-10)
+    np.testing.assert_allclose(cov, ref_cov, atol=1e-12)
+    np.testing.assert_allclose(mu, R.mean(axis=0))
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.models import trend_markov_switching as tm
+from src.models.common import save_output
+from src.storage.tables import read_table
+
+pytest.importorskip("hmmlearn")
+
+
+@pytest.fixture
+def cfg(tmp_path):
+    def path(name):
+        return str(tmp_path / f"{name}.csv")
+
+    return {
+        "data": {"storage_format": "csv"},
+        "models": {"trend_markov": {
+            "output_file": path("output"),
+            "params_file": path("params"),
+            "filter_file": path("filter"),
+            "mode": "online",
+            "n_restarts": 2,
+            "warm_restarts": 1,
+            "n_iter": 20,
+            "min_returns": 12,
+            "seed": 0,
+            "workers": 1,
+            "refit_every": 12,
+        }},
+    }
+
+
+def features_frame(periods=72, seed=0):
+    rng = np.random.default_rng(seed)
+    months = pd.date_range("2020-01-01", periods=periods, freq="MS")
+    rows = []
+    for region in ("Budapest", "Debrecen"):
+        level = 100 * np.cumprod(1 + rng.normal(0.005, 0.02, periods))
+        rows.append(pd.DataFrame({"date": months, "region": region, "segment": "panel", "price_index": level}))
+    return pd.concat(rows, ignore_index=True)
+
+
+def run(df, cfg):
+    out = tm.run(df, cfg)
+    save_output(out, cfg, "trend_markov")
+    return out
+
+
+def filtered_probabilities(df, cfg, region):
+    """Forward-filtered probabilities of one series under its stored fit"""
+    keys, dates, returns = tm.series_returns(df)
+    i = int(np.flatnonzero(keys["region"] == region)[0])
+    fitted = tm.load_fitted_params(keys, cfg["models"]["trend_markov"]["params_file"], cfg)
+    return tm._filter([returns[i]], [fitted[i]])["filtered"][0]
+
+
+# Stored parameters are smoothed by 1e-6 on load
+ATOL = 1e-4
+
+
+def test_online_rows_match_a_refit_filter(cfg, capsys):
+    df = features_frame()
+    run(df[df["date"] < "2025-07-01"], cfg)
+    capsys.readouterr()
+    out = run(df, cfg)
+    assert "2 series filtered, 0 scheduled and 0 drift" in capsys.readouterr().out
+
+    # Appended rows continue the same forward filter the refit path used
+    prob_cols = [f"prob_{r}" for r in tm.REGIMES]
+    budapest = out[out["region"] == "Budapest"]
+    np.testing.assert_allclose(budapest[prob_cols].to_numpy(), filtered_probabilities(df, cfg, "Budapest"),
+                               atol=ATOL)
+
+
+def test_revised_history_is_refitted(cfg, capsys):
+    df = features_frame()
+    run(df, cfg)
+    revised = df.copy()
+    early = (revised["region"] == "Debrecen") & (revised["date"] == "2020-06-01")
+    revised.loc[early, "price_index"] *= 1.05
+    capsys.readouterr()
+    out = run(revised, cfg)
+
+    assert "1 series with revised history" in capsys.readouterr().out
+    keys, dates, returns = tm.series_returns(revised)
+    debrecen = out[out["region"] == "Debrecen"]
+    np.testing.assert_allclose(debrecen[[f"prob_{r}" for r in tm.REGIMES]].to_numpy(),
+                               filtered_probabilities(revised, cfg, "Debrecen"), atol=ATOL)
+    state = read_table(cfg["models"]["trend_markov"]["filter_file"], cfg)
+    assert (state["history_hash"] == [tm.history_hash(d, r) for d, r in zip(dates, returns)]).all()
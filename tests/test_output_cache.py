@@ -0,0 +1,87 @@
+import os
+
+import pandas as pd
+import pytest
+
+from src.api.output_cache import OutputCache
+from src.storage import snapshots
+from src.storage.tables import write_table
+
+MODELS = ("trend_bayes", "trend_markov")
+
+
+@pytest.fixture
+def cfg(tmp_path):
+    processed = tmp_path / "processed"
+    return {
+        "data": {
+            "processed_dir": str(processed),
+            "snapshot_dir": str(tmp_path / "snapshots"),
+            "storage_format": "csv",
+            "keep_snapshots": 5,
+        },
+        "models": {key: {"output_file": str(processed / f"{key}.csv")} for key in MODELS},
+    }
+
+
+def publish(cfg, value):
+    """Write every output with value and publish them as one version"""
+    paths = []
+    for key in MODELS:
+        frame = pd.DataFrame({"date": pd.to_datetime(["2024-01-01"]), "region": "Budapest",
+                              "segment": "panel", "x": [value]})
+        paths.append(write_table(frame, cfg["models"][key]["output_file"], cfg))
+    return snapshots.publish(paths, cfg)
+
+
+def value(table):
+    return table.latest("Budapest", "panel")["x"]
+
+
+def test_one_request_reads_every_table_from_one_version(cfg):
+    v1 = publish(cfg, 1)
+    cache = OutputCache(cfg, check_interval=0.0)
+    snapshot = cache.current()
+    assert snapshot == v1
+    bayes = cache.get("trend_bayes", snapshot)
+
+    publish(cfg, 2)
+    markov = cache.get("trend_markov", snapshot)
+    assert value(bayes) == value(markov) == 1
+    assert markov.version == ("snapshot", v1)
+
+    # The next request sees the new version for both tables
+    snapshot = cache.current()
+    assert value(cache.get("trend_bayes", snapshot)) == value(cache.get("trend_markov", snapshot)) == 2
+
+
+def test_tables_share_one_check_clock(cfg):
+    publish(cfg, 1)
+    cache = OutputCache(cfg, check_interval=60.0)
+    bayes = cache.get("trend_bayes")
+
+    # A publish between two gets is not seen until the shared interval ends
+    publish(cfg, 2)
+    assert value(cache.get("trend_markov")) == value(bayes) == 1
+
+
+def test_pinned_old_snapshot_does_not_evict_the_current_table(cfg):
+    v1 = publish(cfg, 1)
+    cache = OutputCache(cfg, check_interval=0.0)
+    publish(cfg, 2)
+    current = cache.get("trend_bayes")
+    assert value(current) == 2
+
+    assert value(cache.get("trend_bayes", v1)) == 1
+    assert cache.get("trend_bayes") is current
+
+
+def test_unpublished_outputs_come_from_the_working_copy(cfg):
+    cache = OutputCache(cfg, check_interval=0.0)
+    assert cache.get("trend_bayes") is None
+    frame = pd.DataFrame({"date": pd.to_datetime(["2024-01-01"]), "region": "Budapest",
+                          "segment": "panel", "x": [3]})
+    write_table(frame, cfg["models"]["trend_bayes"]["output_file"], cfg)
+    table = cache.get("trend_bayes")
+    assert value(table) == 3
+    assert table.version[0] == os.stat(cfg["models"]["trend_bayes"]["output_file"]).st_mtime_ns
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+from src.models.covariance import factor_model
+from src.models.frontier import FrontierProblem
+from src.models.portfolio_mpt import asset_returns, factor_returns
+
+SPECS = [{"region": "National", "segment": "all"}, {"region": "Budapest"}]
+
+
+def features_frame(seed=0):
+    """Monthly regional series plus a quarterly national index from two sources"""
+    rng = np.random.default_rng(seed)
+    months = pd.date_range("2020-01-01", periods=48, freq="MS")
+    rows = []
+    for region in ("Budapest", "Debrecen"):
+        for segment in ("panel", "tegla"):
+            level = 100 * np.cumprod(1 + rng.normal(0.005, 0.02, len(months)))
+            rows.append(pd.DataFrame({"date": months, "region": region, "segment": segment,
+                                      "price_index": level}))
+    quarters = pd.date_range("2020-03-31", periods=15, freq="QE")
+    national = 100 * np.cumprod(1 + rng.normal(0.01, 0.02, len(quarters)))
+    for source, shift in (("MNB", 0.0), ("KSH", 0.5)):
+        rows.append(pd.DataFrame({"date": quarters, "region": "National", "segment": "all",
+                                  "price_index": national + shift, "source": source}))
+    return pd.concat(rows, ignore_index=True)
+
+
+def test_factors_cover_every_asset_period_inside_their_span():
+    df = features_frame()
+    keys, dates, R = asset_returns(df, min_returns=12)
+    F = factor_returns(df, dates, SPECS)
+    assert F.shape == (len(dates), 2)
+
+    # Budapest is monthly like the assets: no gaps at all
+    assert not np.isnan(F[:, 1]).any()
+    # National only misses the months before its first and after its last quarter
+    covered = np.flatnonzero(~np.isnan(F).any(axis=1))
+    assert (np.diff(covered) == 1).all()
+    assert len(covered) == 14 * 3
+
+    _, _, keep = factor_model(R, F, min_obs=12)
+    assert keep.all()
+
+
+def test_quarterly_factor_compounds_to_the_quarterly_return():
+    df = features_frame()
+    _, dates, _ = asset_returns(df, min_returns=12)
+    F = factor_returns(df, dates, SPECS[:1])
+    national = df[df["region"] == "National"].groupby("date")["price_index"].mean()
+    quarterly = national.iloc[1:].to_numpy() / national.iloc[:-1].to_numpy() - 1
+    covered = F[~np.isnan(F[:, 0]), 0]
+    np.testing.assert_allclose(np.prod(1 + covered.reshape(-1, 3), axis=1) - 1, quarterly)
+
+
+def test_region_factor_is_the_average_series_return():
+    df = features_frame()
+    keys, dates, R = asset_returns(df, min_returns=12)
+    F = factor_returns(df, dates, SPECS[1:])
+    budapest = (keys["region"] == "Budapest").to_numpy()
+    np.testing.assert_allclose(F[:, 0], R[:, budapest].mean(axis=1))
+
+
+def test_capped_sweep_ends_at_the_best_capped_return():
+    rng = np.random.default_rng(1)
+    mu = np.array([0.01, 0.02, 0.05, 0.03])
+    A = rng.normal(size=(4, 4))
+    problem = FrontierProblem(4, max_weight=0.4)
+    problem.set_moments(mu, A @ A.T / 100 + np.eye(4) * 0.01)
+
+    # Fill 0.05 and 0.03 to the cap, the rest on 0.02
+    assert np.isclose(problem.max_return(), 0.4 * 0.05 + 0.4 * 0.03 + 0.2 * 0.02)
+    targets, weights = problem.sweep(10)
+    assert len(targets) == 10
+    assert np.isclose(targets[-1], problem.max_return())
+    assert weights.max() <= 0.4 + 1e-6
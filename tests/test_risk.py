@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from src.models.risk_prospect_theory import run
+
+
+def features_frame(seed=0):
+    rng = np.random.default_rng(seed)
+    months = pd.date_range("2020-01-01", periods=40, freq="MS")
+    rows = [
+        pd.DataFrame({"date": months, "region": f"R{g}", "segment": "panel",
+                      "ret": rng.normal(0.005, 0.02, len(months))})
+        for g in range(7)
+    ]
+    return pd.concat(rows, ignore_index=True)
+
+
+def settings(workers):
+    return {"models": {"risk_prospect": {
+        "n_sims": 2000, "horizon": 12, "lookback": 36, "seed": 42, "min_returns": 12,
+        "tail_levels": [0.95], "block_groups": 2, "workers": workers, "chunk_elements": 50_000,
+    }}}
+
+
+def test_results_do_not_depend_on_worker_count():
+    df = features_frame()
+    serial = run(df, settings(1))
+    parallel = run(df, settings(3))
+    pd.testing.assert_frame_equal(serial, parallel)
+    assert len(serial) == 7 and serial["expected_prospect_value"].notna().all()
@@ -0,0 +1,84 @@
+import os
+
+import pandas as pd
+import pytest
+
+from src.storage import snapshots
+from src.storage.tables import read_table, write_table
+
+
+@pytest.fixture
+def cfg(tmp_path):
+    return {"data": {
+        "processed_dir": str(tmp_path / "processed"),
+        "snapshot_dir": str(tmp_path / "snapshots"),
+        "storage_format": "csv",
+        "keep_snapshots": 2,
+    }}
+
+
+def write(cfg, value):
+    path = os.path.join(cfg["data"]["processed_dir"], "out.csv")
+    write_table(pd.DataFrame({"x": [value]}), path, cfg)
+    return path
+
+
+def published_value(cfg):
+    path, _ = snapshots.published_path(os.path.join(cfg["data"]["processed_dir"], "out.csv"), cfg)
+    return read_table(path, cfg)["x"].iloc[0]
+
+
+def test_publish_creates_exactly_one_version_and_switches_to_it(cfg):
+    path = write(cfg, 1)
+    v1 = snapshots.publish([path], cfg)
+    assert snapshots.list_versions(cfg) == [v1]
+    assert snapshots.current_version(cfg) == v1
+    assert snapshots.load_manifest(cfg)["tables"].keys() == {"out.csv"}
+
+    # Rewriting the working copy leaves the published snapshot untouched
+    write(cfg, 2)
+    assert published_value(cfg) == 1
+    v2 = snapshots.publish([path], cfg)
+    assert snapshots.list_versions(cfg) == [v1, v2]
+    assert published_value(cfg) == 2
+
+
+def test_rollback_switches_once_and_rejects_unknown_versions(cfg):
+    path = write(cfg, 1)
+    v1 = snapshots.publish([path], cfg)
+    write(cfg, 2)
+    v2 = snapshots.publish([path], cfg)
+
+    snapshots.switch(v1, cfg)
+    assert snapshots.current_version(cfg) == v1 and published_value(cfg) == 1
+    assert snapshots.list_versions(cfg) == [v1, v2]
+
+    with pytest.raises(ValueError):
+        snapshots.switch("v-missing", cfg)
+    assert snapshots.current_version(cfg) == v1
+
+
+def test_failed_publish_leaves_the_previous_version(cfg, monkeypatch):
+    path = write(cfg, 1)
+    v1 = snapshots.publish([path], cfg)
+    write(cfg, 2)
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(snapshots.os, "rename", fail)
+    with pytest.raises(OSError):
+        snapshots.publish([path], cfg)
+    assert snapshots.list_versions(cfg) == [v1]
+    assert sorted(os.listdir(cfg["data"]["snapshot_dir"])) == [snapshots.POINTER, v1]
+    assert snapshots.current_version(cfg) == v1 and published_value(cfg) == 1
+
+
+def test_prune_keeps_the_published_version(cfg):
+    path = write(cfg, 0)
+    versions = [snapshots.publish([path], cfg) for _ in range(3)]
+    assert snapshots.list_versions(cfg) == versions[1:]
+
+    snapshots.switch(versions[1], cfg)
+    assert snapshots.prune(cfg, keep=0) == [versions[2]]
+    assert snapshots.list_versions(cfg) == [versions[1]]
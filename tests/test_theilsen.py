@@ -0,0 +1,38 @@
+import numpy as np
+from scipy import stats
+
+from src.models.theilsen_batch import rolling_theilsen, theilsen
+
+
+def panel(seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(30)
+    Y = 100 + 0.4 * t + rng.standard_t(3, (4, 30))
+    Y[1, :6] = np.nan
+    Y[3, ::4] = np.nan
+    return Y, t
+
+
+def test_slopes_and_bounds_match_scipy():
+    Y, t = panel()
+    res = theilsen(Y, t, alpha=0.05)
+    for g, y in enumerate(Y):
+        ok = ~np.isnan(y)
+        ref = stats.theilslopes(y[ok], t[ok], alpha=0.95)
+        np.testing.assert_allclose(res["slope"][g], ref.slope)
+        np.testing.assert_allclose([res["lower"][g], res["upper"][g]], [ref.low_slope, ref.high_slope])
+        assert res["n_obs"][g] == ok.sum()
+
+
+def test_rolling_slope_matches_scipy_per_window():
+    Y, t = panel()
+    window = 12
+    rolled = rolling_theilsen(Y, t, window)
+    for g, y in enumerate(Y):
+        for c in range(len(t)):
+            lo = t[c] - window + 1
+            sel = (t >= lo) & (t <= t[c]) & ~np.isnan(y)
+            if lo < 0 or sel.sum() < 3:
+                assert np.isnan(rolled[g, c])
+            else:
+                np.testing.assert_allclose(rolled[g, c], stats.theilslopes(y[sel], t[sel]).slope)
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.models import trend_bayes_hierarchical as tb
+
+PARAMS = {"engine": "pymc", "prior_mean": [100.0, 0.0], "prior_sd": [50.0, 5.0], "prior_sigma": 10.0}
+
+
+def features_frame():
+    months = pd.date_range("2020-01-01", periods=24, freq="MS")
+    return pd.DataFrame({
+        "date": months,
+        "region": "Budapest",
+        "segment": "panel",
+        "price_index": 100 + 0.5 * np.arange(len(months)),
+    })
+
+
+def test_sampler_failure_falls_back_to_conjugate(monkeypatch):
+    pm = pytest.importorskip("pymc")
+
+    def fail(*args, **kwargs):
+        raise pm.exceptions.SamplingError("Bad initial energy")
+
+    monkeypatch.setattr(tb, "bayes_trend_pymc", fail)
+    out = tb.run(features_frame(), {"models": {"trend_bayes": PARAMS}})
+    assert (out["method"] == "conjugate").all()
+
+
+def test_other_errors_propagate(monkeypatch):
+    pytest.importorskip("pymc")
+
+    def fail(*args, **kwargs):
+        raise ValueError("shape mismatch")
+
+    monkeypatch.setattr(tb, "bayes_trend_pymc", fail)
+    with pytest.raises(ValueError):
+        tb.run(features_frame(), {"models": {"trend_bayes": PARAMS}})
+
+
+def test_conjugate_uses_the_pooled_rows_and_time_axis():
+    df = features_frame()
+    # A second source reporting the same dates with an offset
+    df = pd.concat([df, df.iloc[::3].assign(price_index=lambda x: x["price_index"] + 1.0)])
+    out = tb.bayes_trend_conjugate(df, {"prior_mean": [0.0, 0.0], "prior_sd": [1e6, 1e6], "prior_sigma": 1.0})
+    d = tb.trend_design(df)
+    assert len(out) == len(df)
+    pd.testing.assert_frame_equal(out[["date", "region", "segment"]], d["frame"][["date", "region", "segment"]])
+
+    # Flat prior: least squares on every row, intercept at the mean date
+    beta, alpha = np.polyfit(d["t"], d["y"], 1)
+    np.testing.assert_allclose(out["bayes_trend_mean"], alpha + beta * d["t"], rtol=1e-8)
+    assert np.isclose(alpha, d["y"].mean())
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+from src.models.valuation_nash_real import calibrate, load_yields, region_yields
+
+HEADER = "Cím:,title,Unnamed: 4,Period,Unnamed: 7,Unnamed: 8,Unnamed: 9,Unnamed: 10,Unnamed: 11\n"
+
+
+def write_yields(path, blocks):
+    lines = [HEADER]
+    for rows in blocks:
+        for date, rent, bond in rows:
+            lines.append(f",,x,x,{date},{rent},{bond},30,5\n")
+    path.write_text("".join(lines), encoding="utf-8")
+
+
+def test_load_yields_splits_stacked_blocks(tmp_path):
+    path = tmp_path / "Clean_Yields.csv"
+    write_yields(path, [
+        [("2024-03-31", 7.0, 6.0), ("2024-09-30", 6.5, 5.5)],
+        [("2024-03-31", 5.0, 6.0), ("2024-09-30", 4.5, 5.5)],
+    ])
+    yields = load_yields(path, ["National", "Budapest"])
+    assert yields["region"].tolist() == ["National", "Budapest"]
+    np.testing.assert_allclose(yields["rent_yield"], [0.065, 0.045])
+    np.testing.assert_allclose(yields["risk_free"], [0.055, 0.055])
+
+    rates = region_yields(pd.Series(["Budapest", "Győr"]), yields)
+    np.testing.assert_allclose(rates["rent_yield"], [0.045, 0.065])
+
+
+def test_calibrate_uses_each_series_own_observations():
+    rng = np.random.default_rng(0)
+    months = pd.date_range("2020-01-01", periods=40, freq="MS")
+    quarters = pd.date_range("2020-03-31", periods=12, freq="QE")
+    monthly = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(months))))
+    quarterly = 100 * np.exp(np.cumsum(rng.normal(0, 0.04, len(quarters))))
+    df = pd.concat([
+        pd.DataFrame({"date": months, "region": "Budapest", "segment": "panel", "price_index": monthly}),
+        pd.DataFrame({"date": quarters, "region": "National", "segment": "all", "price_index": quarterly}),
+    ])
+    out = calibrate(df, lookback=24).set_index("region")
+
+    def annualized(dates, levels):
+        spacing = np.median(np.diff(dates.values).astype("timedelta64[D]").astype(float))
+        return np.diff(np.log(levels))[-24:].std(ddof=1) * np.sqrt(365.25 / spacing)
+
+    expected_monthly = annualized(months, monthly)
+    expected_quarterly = annualized(quarters, quarterly)
+    assert out.loc["Budapest", "current_index"] == monthly[-1]
+    assert out.loc["National", "current_index"] == quarterly[-1]
+    np.testing.assert_allclose(out.loc["Budapest", "sigma"], expected_monthly)
+    np.testing.assert_allclose(out.loc["National", "sigma"], expected_quarterly)